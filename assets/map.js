@@ -0,0 +1,47 @@
+// Mise à jour de la carte dans le navigateur : coloration de la capitale sélectionnée et changement de couche météo,
+// sans renvoyer la figure complète au serveur
+
+// URL absolue d'un chemin du serveur (proxy des tuiles, image interpolée), pour l'adresse de la page telle que le
+// navigateur l'a demandée (proxy inverse compris) ; URL déjà absolues inchangées
+function to_page_url(url) {
+    return typeof url === "string" && url.charAt(0) === "/" && url.charAt(1) !== "/" ? window.location.origin + url : url;
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    map: {
+        update_map: function(capitale_data, n_intervals, selected_layer, figure, map_settings) {
+            if (!capitale_data || !figure) {
+                return window.dash_clientside.no_update;
+            }
+            var capital_name = JSON.parse(capitale_data).CapitalName;
+
+            // Coloration des points : seule la capitale sélectionnée change de couleur
+            var data = figure.data.map(function(trace) {
+                var colors = (trace.hovertext || []).map(function(name) {
+                    return name === capital_name ? map_settings.marker_color_selected : map_settings.marker_color;
+                });
+                return Object.assign({}, trace, {marker: Object.assign({}, trace.marker, {color: colors})});
+            });
+
+            // Couche météo : seule l'URL des tuiles de la couche sélectionnée change
+            // (ou celle de l'image interpolée, rechargée à chaque intervalle) ; fond de carte du proxy en URL absolue
+            var layers = figure.layout.mapbox.layers.map(function(layer) {
+                if (layer.sourceattribution !== "OpenWeather") {
+                    var source = Array.isArray(layer.source) ? layer.source.map(to_page_url) : to_page_url(layer.source);
+                    return Object.assign({}, layer, {source: source});
+                }
+                if (layer.sourcetype === "image") {
+                    return Object.assign({}, layer, {source: to_page_url(map_settings.overlay_url.replace("{layer}", selected_layer)) + "?n=" + (n_intervals || 0)});
+                }
+                return Object.assign({}, layer, {source: [to_page_url(map_settings.weather_tile_url.replace("{layer}", selected_layer))]});
+            });
+
+            return Object.assign({}, figure, {
+                data: data,
+                layout: Object.assign({}, figure.layout, {
+                    mapbox: Object.assign({}, figure.layout.mapbox, {layers: layers})
+                })
+            });
+        }
+    }
+});
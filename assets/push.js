@@ -0,0 +1,60 @@
+// Mises à jour poussées par le serveur (section [push] de 'config.ini', mode=sse) : abonnement aux messages de la
+// capitale sélectionnée, recopiés dans des champs cachés dont la valeur déclenche les callbacks Dash ; les jetons des
+// données reçus sont placés directement dans les zones de stockage
+(function() {
+    var source = null;
+
+    // Changement de la valeur d'un champ comme une saisie de l'utilisateur, pour que Dash la prenne en compte
+    function set_input_value(identifier, value) {
+        var input = document.getElementById(identifier);
+        if (!input) {
+            return;
+        }
+        var setter = Object.getOwnPropertyDescriptor(window.HTMLInputElement.prototype, "value").set;
+        setter.call(input, value);
+        input.dispatchEvent(new Event("input", {bubbles: true}));
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        push: {
+            subscribe: function(capitale_data, push_settings) {
+                if (!capitale_data || !push_settings) {
+                    return window.dash_clientside.no_update;
+                }
+                var capitale = JSON.parse(capitale_data);
+                var url = push_settings.url + "?lat=" + encodeURIComponent(capitale.CapitalLatitude)
+                    + "&lon=" + encodeURIComponent(capitale.CapitalLongitude);
+                if (source && source.url.endsWith(url)) {
+                    return url;
+                }
+
+                // Une seule connexion par onglet : celle de la capitale précédente est fermée
+                if (source) {
+                    source.close();
+                }
+                source = new EventSource(url);
+                source.addEventListener("weather", function(event) {
+                    set_input_value("push-weather", event.data);
+                });
+                source.addEventListener("layer", function(event) {
+                    set_input_value("push-layer", event.data);
+                });
+
+                return url;
+            },
+
+            receive: function(message, current, hourly) {
+                if (!message) {
+                    throw window.dash_clientside.PreventUpdate;
+                }
+                var tokens = JSON.parse(message);
+
+                // Seules les zones de stockage dont les données ont changé sont mises à jour
+                return [
+                    tokens[0] === current ? window.dash_clientside.no_update : tokens[0],
+                    tokens[1] === hourly ? window.dash_clientside.no_update : tokens[1]
+                ];
+            }
+        }
+    });
+})();
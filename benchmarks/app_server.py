@@ -0,0 +1,59 @@
+# coding: utf-8
+
+import logging
+import multiprocessing
+import time
+
+import requests
+
+
+def run_server(overrides: dict, ports):
+    """Processus serveur : application dont les paramètres de 'config.ini' sont remplacés par overrides (noms des
+    variables de components/config.py), servie par werkzeug (un thread par connexion), avec une route renvoyant
+    le temps processeur consommé"""
+
+    from werkzeug.serving import make_server
+
+    from components import config
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    for name, value in overrides.items():
+        setattr(config, name, value)
+
+    import main
+
+    main.application.add_url_rule("/bench/cpu", "bench_cpu", lambda: str(time.process_time()))
+    server = make_server("127.0.0.1", 0, main.application, threaded=True)
+    ports.put(server.server_port)
+    server.serve_forever()
+
+def start_app(overrides: dict):
+    """Lancement de l'application dans un nouveau processus ; renvoie le processus et l'URL de l'application"""
+
+    context = multiprocessing.get_context("spawn")
+    ports = context.Queue()
+    process = context.Process(target=run_server, args=(overrides, ports), daemon=True)
+    process.start()
+
+    return process, "http://127.0.0.1:{}".format(ports.get(timeout=120))
+
+def get_server_cpu(base_url: str):
+    """Temps processeur consommé par le processus de l'application, en secondes"""
+
+    return float(requests.get(base_url + "/bench/cpu").text)
+
+def post_callback(session: requests.Session, base_url: str, outputs: list, inputs: list, state: list=[]):
+    """Appel d'un callback comme le navigateur ; renvoie les propriétés mises à jour (aucune si PreventUpdate)"""
+
+    properties = ["{}.{}".format(identifier, prop) for identifier, prop in outputs]
+    specs = [{'id': identifier, 'property': prop} for identifier, prop in outputs]
+    response = session.post(base_url + "/_dash-update-component", json={
+        'output': properties[0] if len(outputs) == 1 else "..{}..".format("...".join(properties)),
+        'outputs': specs[0] if len(outputs) == 1 else specs,
+        'inputs': [{'id': identifier, 'property': prop, 'value': value} for identifier, prop, value in inputs],
+        'state': [{'id': identifier, 'property': prop, 'value': value} for identifier, prop, value in state],
+        'changedPropIds': []
+    })
+    response.raise_for_status()
+
+    return response.json()['response'] if response.status_code == 200 else {}
@@ -0,0 +1,81 @@
+# coding: utf-8
+
+"""Taille et durée de la mise à jour de la carte selon le nombre de villes : carte complète et carte à niveau de détail,
+pour plusieurs vues (la taille de la carte à niveau de détail doit rester bornée quel que soit le nombre de villes)
+
+Lancement depuis la racine du projet : python -m benchmarks.bench_lod
+"""
+
+import json
+import time
+
+import numpy as np
+import pandas as pd
+import plotly.utils
+
+from components.capitals import CapitalIndex, capitals
+from components.config import api_key, init_layer, weather_tile_api_base_url, scatter_mapbox_marker_color, \
+    map_lod_cell_size, map_lod_max_markers, map_lod_cluster_radius, map_lod_viewport_margin
+from components.figures import create_map, create_lod_map, get_lod_map_template
+from components.lod import LevelOfDetail, get_viewport
+
+
+# Nombres de villes des jeux de données générés
+SIZES = [245, 5000, 50000, 200000]
+
+# Vues mesurées : zoom et coins de la vue (longitude, latitude), None pour le monde entier
+VIEWS = {
+    'monde (zoom 1)': (1, None),
+    'Europe (zoom 4)': (4, [[-12, 60], [30, 60], [30, 35], [-12, 35]]),
+    'Paris (zoom 10)': (10, [[2.1, 48.95], [2.6, 48.95], [2.6, 48.75], [2.1, 48.75]])
+}
+
+
+def generate_cities(count: int, seed: int=0):
+    """Villes fictives réparties autour des capitales (premières lignes : les capitales elles-mêmes)"""
+
+    rng = np.random.default_rng(seed)
+    origins = rng.integers(0, len(capitals), count)
+    spread = rng.exponential(1.5, (count, 2)) * rng.choice([-1, 1], (count, 2))
+    spread[:min(count, len(capitals))] = 0
+    origins[:min(count, len(capitals))] = np.arange(min(count, len(capitals)))
+
+    return pd.DataFrame({
+        'CountryName': capitals['CountryName'].to_numpy()[origins],
+        'CapitalName': ["Ville {}".format(i) for i in range(count)],
+        'CapitalLatitude': np.clip(capitals['CapitalLatitude'].to_numpy()[origins] + spread[:, 0], -85, 85),
+        'CapitalLongitude': (capitals['CapitalLongitude'].to_numpy()[origins] + spread[:, 1] + 180) % 360 - 180,
+        'ContinentName': capitals['ContinentName'].to_numpy()[origins]
+    })
+
+def get_size(fig):
+    """Taille en octets de la figure sérialisée comme par Dash"""
+
+    return len(json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder))
+
+def main():
+    template = get_lod_map_template(init_layer, weather_tile_api_base_url, api_key, scatter_mapbox_marker_color)
+    print("{:>8} {:<18} {:>12} {:>10} {:>14}".format("villes", "vue", "marqueurs", "octets", "durée (ms)"))
+    for size in SIZES:
+        cities = generate_cities(size)
+        index = CapitalIndex(cities)
+        lod = LevelOfDetail(index.latitudes, index.longitudes, map_lod_cell_size, map_lod_max_markers, map_lod_cluster_radius)
+
+        started = time.perf_counter()
+        full_size = get_size(create_map(cities, init_layer, weather_tile_api_base_url, api_key, scatter_mapbox_marker_color))
+        print("{:>8} {:<18} {:>12} {:>10} {:>14.1f}".format(size, "carte complète", size, full_size, (time.perf_counter() - started) * 1000))
+
+        for label, (zoom, corners) in VIEWS.items():
+            relayout_data = {'mapbox.zoom': zoom}
+            if corners is not None:
+                relayout_data['mapbox._derived'] = {'coordinates': corners}
+            started = time.perf_counter()
+            zoom, bounds = get_viewport(relayout_data, 1, map_lod_viewport_margin)
+            positions, clusters = lod.select(bounds, zoom)
+            fig = create_lod_map(template, index, positions, clusters, "Ville 0")
+            fig_size = get_size(fig)
+            duration = (time.perf_counter() - started) * 1000
+            print("{:>8} {:<18} {:>12} {:>10} {:>14.1f}".format(size, label, len(positions) + len(clusters[2]), fig_size, duration))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+# coding: utf-8
+
+"""Comparaison de la boucle séquentielle sur get_weather_results et de get_weather_results_many
+
+Lancement depuis la racine du projet : python -m benchmarks.bench_many [latence en secondes]
+"""
+
+import sys
+import time
+
+from components import governor
+from components.api import get_weather_results, get_weather_results_many, weather_cache
+from components.capitals import capitals
+
+from .upstream_stub import start_stub
+
+
+def main(latency: float):
+    server, url = start_stub(latency)
+    # Mesure de tous les appels : sans budget des appels à OpenWeather
+    governor.budget = None
+    locations = list(zip(capitals['CapitalLatitude'], capitals['CapitalLongitude']))
+
+    # Boucle séquentielle
+    weather_cache.clear()
+    started = time.perf_counter()
+    for lat, lon in locations:
+        get_weather_results(lat, lon, url, "")
+    serial = time.perf_counter() - started
+
+    # Appel groupé concurrent
+    weather_cache.clear()
+    started = time.perf_counter()
+    results, errors = get_weather_results_many(locations, url, "")
+    concurrent = time.perf_counter() - started
+    server.shutdown()
+
+    print("{} points, latence amont {:.0f} ms".format(len(locations), latency * 1000))
+    print("séquentiel : {:.2f} s".format(serial))
+    print("concurrent : {:.2f} s ({} résultats, {} erreurs)".format(concurrent, len(results), len(errors)))
+    print("accélération : x{:.1f}".format(serial / concurrent))
+
+if __name__ == '__main__':
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 0.2)
@@ -0,0 +1,79 @@
+# coding: utf-8
+
+"""Micro-benchmark de la lecture des réponses One Call enregistrées : ancienne lecture ligne à ligne contre lecture vectorisée
+
+Lancement depuis la racine du projet : python -m benchmarks.bench_parsing
+Code de sortie non nul si la lecture vectorisée diffère de l'ancienne ou n'est pas plus rapide.
+"""
+
+import datetime as dt
+import sys
+import timeit
+
+import pandas as pd
+
+from components.api import get_current_weather_results, get_hourly_weather_results
+
+from .payloads import load_fixtures
+
+
+def legacy_current_weather_results(weather_dict: dict):
+    """Ancienne lecture des données courantes, champ par champ sur la série"""
+
+    current = pd.Series(weather_dict['current'])
+    current['dt'] = dt.datetime.fromtimestamp(current['dt'])
+    current['sunrise'] = dt.datetime.fromtimestamp(current['sunrise'])
+    current['sunset'] = dt.datetime.fromtimestamp(current['sunset'])
+    current['weather_condition'] = current['weather'][0]['main']
+    current['weather_icon'] = current['weather'][0]['icon']
+    current.drop(['weather'], inplace=True)
+
+    return current
+
+def legacy_hourly_weather_results(weather_dict: dict):
+    """Ancienne lecture des prévisions horaires, avec des .map ligne à ligne"""
+
+    hourly = pd.DataFrame(weather_dict['hourly'])
+    hourly.loc[:,'weather_condition'] = hourly['weather'].map(lambda ls: ls[0]['main'])
+    hourly.loc[:,'weather_icon'] = hourly['weather'].map(lambda ls: ls[0]['icon'])
+    hourly.drop(columns=['weather'], inplace=True)
+    hourly.loc[:,'dt'] = hourly['dt'].map(dt.datetime.fromtimestamp)
+
+    return hourly
+
+def check_equivalence(payload: dict):
+    """Vérifie que la lecture vectorisée donne les mêmes valeurs que l'ancienne"""
+
+    legacy, vectorized = legacy_hourly_weather_results(payload), get_hourly_weather_results(payload)
+    pd.testing.assert_frame_equal(
+        legacy.astype({'dt': 'datetime64[ns]'}),
+        vectorized.astype({'weather_condition': object, 'weather_icon': object}),
+        check_dtype=False,
+        rtol=1e-6
+    )
+    legacy, vectorized = legacy_current_weather_results(payload), get_current_weather_results(payload)
+    pd.testing.assert_series_equal(legacy, vectorized, check_dtype=False)
+
+def measure(function, payload: dict, number: int):
+    """Meilleur temps moyen d'un appel, en microsecondes"""
+
+    return min(timeit.repeat(lambda: function(payload), number=number, repeat=5)) / number * 1e6
+
+def main(number: int=200):
+    failed = False
+    for name, payload in load_fixtures().items():
+        check_equivalence(payload)
+        for label, legacy, vectorized in [
+            ("current", legacy_current_weather_results, get_current_weather_results),
+            ("hourly", legacy_hourly_weather_results, get_hourly_weather_results)
+        ]:
+            legacy_time, vectorized_time = measure(legacy, payload, number), measure(vectorized, payload, number)
+            failed |= vectorized_time >= legacy_time
+            print("{:<10} {:<8} ancien {:8.1f} µs   vectorisé {:8.1f} µs   x{:.1f}".format(
+                name, label, legacy_time, vectorized_time, legacy_time / vectorized_time
+            ))
+
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,74 @@
+# coding: utf-8
+
+"""Coût d'une réponse One Call par appel, complète ou réduite (exclude=minutely,daily,alerts et champs conservés de
+la section [payload]) : octets transférés (bruts et gzip), temps de décodage JSON et de mise en forme, pic de mémoire
+pendant la lecture et mémoire des résultats conservés en cache, sur les réponses enregistrées
+
+Lancement depuis la racine du projet : python -m benchmarks.bench_payload
+"""
+
+import gzip
+import json
+import timeit
+import tracemalloc
+
+from components import api
+from components.rankings import CURRENT_FIELDS
+
+from .payloads import load_fixtures
+
+
+# Parties de la réponse exclues par l'URL de 'config.ini'
+EXCLUDED_PARTS = ['minutely', 'daily', 'alerts']
+
+
+def read(body: bytes, kept: set):
+    """Décodage et mise en forme d'une réponse, comme api.get_weather_results"""
+
+    response = json.loads(body)
+
+    return api.get_current_weather_results(response, kept), api.get_hourly_weather_results(response, kept)
+
+def measure(body: bytes, kept: set, number: int):
+    """Mesures d'une réponse : octets, temps de décodage et de lecture complète (µs), pics et mémoire conservée (Kio)"""
+
+    decode_time = min(timeit.repeat(lambda: json.loads(body), number=number, repeat=5)) / number * 1e6
+    read_time = min(timeit.repeat(lambda: read(body, kept), number=number, repeat=5)) / number * 1e6
+
+    tracemalloc.start()
+    current, hourly = read(body, kept)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    retained = current.memory_usage(deep=True) + hourly.memory_usage(deep=True).sum()
+
+    return {
+        'bytes': len(body),
+        'gzip_bytes': len(gzip.compress(body)),
+        'decode_us': decode_time,
+        'read_us': read_time,
+        'peak_kib': peak / 1024,
+        'retained_kib': retained / 1024,
+        'columns': len(hourly.columns)
+    }
+
+def main(number: int=200):
+    # Champs conservés par la configuration par défaut (classements activés)
+    api.keep_fields(CURRENT_FIELDS)
+
+    print("{:<10} {:<8} {:>8} {:>8} {:>10} {:>10} {:>10} {:>10} {:>8}".format(
+        "réponse", "mode", "octets", "gzip", "json (µs)", "total (µs)", "pic (Kio)", "cache (Kio)", "colonnes"
+    ))
+    for name, payload in load_fixtures().items():
+        trimmed = {part: value for part, value in payload.items() if part not in EXCLUDED_PARTS}
+        for mode, body, fields in [
+            ("complète", json.dumps(payload).encode("utf-8"), None),
+            ("réduite", json.dumps(trimmed).encode("utf-8"), api.kept_fields)
+        ]:
+            result = measure(body, fields, number)
+            print("{:<10} {:<8} {:>8d} {:>8d} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f} {:>8d}".format(
+                name, mode, result['bytes'], result['gzip_bytes'], result['decode_us'], result['read_us'],
+                result['peak_kib'], result['retained_kib'], result['columns']
+            ))
+
+if __name__ == '__main__':
+    main()
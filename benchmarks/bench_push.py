@@ -0,0 +1,162 @@
+# coding: utf-8
+
+"""Charge du serveur selon le nombre d'onglets ouverts : interrogation à intervalles réguliers par chaque onglet (poll),
+puis mises à jour poussées par le serveur (sse) ; temps processeur du serveur, requêtes reçues et appels à l'API One Call.
+Les durées sont réduites : 1 s pour les 120 s de l'intervalle, 5 s pour les 600 s du cache et du renouvellement des données.
+
+Lancement depuis la racine du projet : python -m benchmarks.bench_push [onglets, séparés par des virgules] [durée en secondes]
+"""
+
+import http.client
+import json
+import sys
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+import requests
+
+from components.capitals import capitals
+
+from .app_server import get_server_cpu, post_callback, start_app
+from .upstream_stub import start_stub
+
+
+# Intervalle entre deux mises à jour (interrogation de chaque onglet, ou lecture par point en mode sse), en secondes
+INTERVAL = 1.0
+# Durée de vie du cache des résultats et période de renouvellement des données du serveur simulé
+CACHE_TTL = 5.0
+# Intervalle entre deux messages vides (les onglets simulés vérifient alors s'ils doivent s'arrêter)
+KEEPALIVE = 0.5
+# Capitales affichées par les onglets, à tour de rôle
+CAPITAL_COUNT = 5
+
+
+class Viewer:
+    """Onglet simulé : sélection d'une capitale, puis mise à jour des graphiques dont les données ont changé,
+    d'après les jetons obtenus à chaque intervalle (poll) ou reçus à chaque message du serveur (sse)"""
+
+    def __init__(self, base_url: str, mode: str, capital_name: str, stop: threading.Event):
+        self.base_url = base_url
+        self.mode = mode
+        self.capital_name = capital_name
+        self.stop = stop
+        self.session = requests.Session()
+        self.tokens = {'current': None, 'hourly': None}
+        self.requests = 0
+        self.capitale = None
+
+    def call(self, outputs: list, inputs: list, state: list=[]):
+        self.requests += 1
+
+        return post_callback(self.session, self.base_url, outputs, inputs, state)
+
+    def update(self, tokens: dict):
+        """Mise à jour des graphiques des données qui ont changé"""
+
+        changed = {store for store, token in tokens.items() if token != self.tokens[store]}
+        self.tokens.update(tokens)
+        if 'current' in changed:
+            self.call([('indicateur', 'figure')], [('current', 'data', self.tokens['current'])])
+        if 'hourly' in changed:
+            self.call([('graphe-serie', 'figure')], [('hourly', 'data', self.tokens['hourly']), ('variables-prevision-dropdown', 'value', "temp")])
+            self.call([('tab', 'figure')], [('hourly', 'data', self.tokens['hourly'])])
+
+    def run(self):
+        response = self.call(
+            [('capitale', 'data'), ('capitale-name', 'children')],
+            [('mapmonde', 'clickData', {'points': [{'hovertext': self.capital_name}]})]
+        )
+        self.capitale = response['capitale']['data']
+
+        if self.mode == "sse":
+            self.run_sse()
+        else:
+            self.run_poll()
+
+    def run_poll(self):
+        n_intervals = 0
+        while not self.stop.is_set():
+            response = self.call(
+                [('current', 'data'), ('hourly', 'data')],
+                [('interval-component-120s', 'n_intervals', n_intervals), ('capitale', 'data', self.capitale)],
+                [('current', 'data', self.tokens['current']), ('hourly', 'data', self.tokens['hourly'])]
+            )
+            self.update({store: response[store]['data'] for store in response})
+            n_intervals += 1
+            self.stop.wait(INTERVAL)
+
+    def run_sse(self):
+        capitale = json.loads(self.capitale)
+        # Lecture ligne par ligne du flux de messages, qui reste ouvert
+        connection = http.client.HTTPConnection(urlsplit(self.base_url).netloc)
+        connection.request("GET", "/events?" + urlencode({'lat': capitale['CapitalLatitude'], 'lon': capitale['CapitalLongitude']}))
+        response = connection.getresponse()
+        event = None
+        for line in response:
+            if self.stop.is_set():
+                break
+            line = line.decode("utf-8").rstrip("\n")
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: ") and event == "weather":
+                # Jetons recopiés dans les zones de stockage par le navigateur (assets/push.js), sans appel au serveur
+                self.update(dict(zip(['current', 'hourly'], json.loads(line[len("data: "):]))))
+        connection.close()
+
+def measure(mode: str, viewer_count: int, duration: float, stub, url: str):
+    """Temps processeur du serveur, requêtes et appels amont pendant duration secondes avec viewer_count onglets"""
+
+    process, base_url = start_app({
+        'push_mode': mode,
+        'push_refresh_interval': INTERVAL,
+        'push_keepalive': KEEPALIVE,
+        'cache_ttl': CACHE_TTL,
+        'one_call_api_base_url': url,
+        'refresher_enabled': False,
+        'governor_enabled': False,
+        'history_enabled': False
+    })
+
+    stop = threading.Event()
+    names = list(capitals['CapitalName'][:CAPITAL_COUNT])
+    viewers = [Viewer(base_url, mode, names[i % len(names)], stop) for i in range(viewer_count)]
+    threads = [threading.Thread(target=viewer.run, daemon=True) for viewer in viewers]
+    for thread in threads:
+        thread.start()
+
+    # Mesure après l'ouverture de tous les onglets
+    time.sleep(2 * INTERVAL)
+    cpu_started = get_server_cpu(base_url)
+    calls_started, requests_started = stub.request_count, sum(viewer.requests for viewer in viewers)
+    time.sleep(duration)
+    cpu = get_server_cpu(base_url) - cpu_started
+    calls, callback_requests = stub.request_count - calls_started, sum(viewer.requests for viewer in viewers) - requests_started
+
+    stop.set()
+    for thread in threads:
+        thread.join(timeout=5)
+    process.terminate()
+    process.join()
+
+    return cpu, callback_requests, calls
+
+def main(viewer_counts: list[int], duration: float):
+    stub, url = start_stub(update_period=CACHE_TTL)
+    print("{} capitales, intervalle {:.0f} s, données renouvelées toutes les {:.0f} s, mesure sur {:.0f} s".format(
+        CAPITAL_COUNT, INTERVAL, CACHE_TTL, duration
+    ))
+    print("{:<6} {:>8} {:>14} {:>12} {:>14}".format("mode", "onglets", "CPU serveur", "requêtes", "appels amont"))
+    for mode in ["poll", "sse"]:
+        for viewer_count in viewer_counts:
+            cpu, callback_requests, calls = measure(mode, viewer_count, duration, stub, url)
+            print("{:<6} {:>8d} {:>12.2f} s {:>12d} {:>14d}".format(mode, viewer_count, cpu, callback_requests, calls))
+
+    stub.shutdown()
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(
+        [int(count) for count in args[0].split(",")] if len(args) > 0 else [1, 10, 50, 100],
+        float(args[1]) if len(args) > 1 else 10.0
+    )
@@ -0,0 +1,259 @@
+# coding: utf-8
+
+"""Charge de plusieurs sessions simultanées du tableau de bord : chaque session clique sur des capitales, change de
+couche et de variable, et reçoit les intervalles ; les callbacks du serveur (store_click_data, stream_data, update_map,
+indicateur, serie_temp, tab) sont appelés en cascade par l'URL _dash-update-component comme le ferait le navigateur.
+Débit, erreurs et latences (p50, p95, p99) par callback, et octets reçus par session (transférés et décompressés,
+mise en page comprise).
+
+Par défaut, l'application est lancée dans un processus séparé et interroge le serveur de substitution (upstream_stub) ;
+avec --url, les sessions visent une application déjà lancée, dont 'config.ini' peut pointer vers
+python -m benchmarks.upstream_stub.
+
+Lancement depuis la racine du projet : python -m benchmarks.bench_sessions [--sessions 20] [--duration 30] ...
+"""
+
+import argparse
+import random
+import threading
+import time
+
+import numpy as np
+import requests
+
+from components.capitals import capitals
+
+from .app_server import get_server_cpu, start_app
+from .upstream_stub import get_stub_urls, start_stub
+
+
+# Actions d'une session et leur probabilité
+ACTIONS = [
+    ('click', 0.6),
+    ('layer', 0.15),
+    ('variable', 0.15),
+    ('interval', 0.1)
+]
+
+
+def parse_property(prop_id: str):
+    """Identifiant et propriété d'un composant ("id.propriété")"""
+
+    return tuple(prop_id.rsplit(".", 1))
+
+def get_callbacks(base_url: str):
+    """Callbacks exécutés par le serveur (les callbacks exécutés dans le navigateur sont ignorés) : nom de la sortie,
+    sorties, entrées et états"""
+
+    callbacks = []
+    for spec in requests.get(base_url + "/_dash-dependencies").json():
+        if spec.get('clientside_function'):
+            continue
+        output = spec['output']
+        outputs = output.strip(".").split("...") if output.startswith("..") else [output]
+        callbacks.append({
+            'output': output,
+            'name': "+".join(parse_property(item)[0] for item in outputs),
+            'multi': output.startswith(".."),
+            'outputs': [parse_property(item) for item in outputs],
+            'inputs': [(item['id'], item['property']) for item in spec['inputs']],
+            'state': [(item['id'], item['property']) for item in spec['state']]
+        })
+
+    return callbacks
+
+def get_layout_values(base_url: str):
+    """Propriétés initiales de tous les composants identifiés de la mise en page, par (id, propriété)"""
+
+    values = {}
+    nodes = [requests.get(base_url + "/_dash-layout").json()]
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, list):
+            nodes.extend(node)
+        elif isinstance(node, dict) and 'props' in node:
+            props = node['props']
+            nodes.append(props.get('children'))
+            if 'id' in props:
+                for prop, value in props.items():
+                    if prop not in ('id', 'children'):
+                        values[props['id'], prop] = value
+
+    return values
+
+
+class Session:
+    """Session simulée : valeurs des propriétés des composants, actions de l'utilisateur et callbacks déclenchés
+    en cascade, avec la latence de chaque appel"""
+
+    def __init__(self, base_url: str, callbacks: list, values: dict, rng: random.Random):
+        self.base_url = base_url
+        self.callbacks = callbacks
+        self.values = dict(values)
+        self.rng = rng
+        self.http = requests.Session()
+        # Appels : nom du callback, latence en secondes, succès
+        self.calls = []
+        # Octets reçus : transférés (compressés) et décompressés
+        self.transferred_bytes = 0
+        self.decoded_bytes = 0
+
+    def count_bytes(self, response: requests.Response):
+        """Comptage des octets d'une réponse, avant et après décompression"""
+
+        self.decoded_bytes += len(response.content)
+        self.transferred_bytes += int(response.headers.get('Content-Length', len(response.content)))
+
+    def call(self, callback: dict, triggered: set):
+        """Appel d'un callback ; renvoie les propriétés modifiées"""
+
+        def describe(items, with_values):
+            return [
+                dict({'id': identifier, 'property': prop}, **({'value': self.values.get((identifier, prop))} if with_values else {}))
+                for identifier, prop in items
+            ]
+
+        outputs = describe(callback['outputs'], False)
+        started = time.perf_counter()
+        response = self.http.post(self.base_url + "/_dash-update-component", json={
+            'output': callback['output'],
+            'outputs': outputs if callback['multi'] else outputs[0],
+            'inputs': describe(callback['inputs'], True),
+            'state': describe(callback['state'], True),
+            'changedPropIds': ["{}.{}".format(*item) for item in triggered if item in callback['inputs']]
+        })
+        self.calls.append((callback['name'], time.perf_counter() - started, response.status_code in (200, 204)))
+        self.count_bytes(response)
+        if response.status_code != 200:
+            return set()
+
+        changed = set()
+        for identifier, props in response.json()['response'].items():
+            for prop, value in props.items():
+                self.values[identifier, prop] = value
+                changed.add((identifier, prop))
+
+        return changed
+
+    def trigger(self, changed: set):
+        """Exécution en cascade des callbacks déclenchés par des propriétés modifiées, par vagues comme le navigateur"""
+
+        while changed:
+            triggered = changed
+            changed = set()
+            for callback in self.callbacks:
+                if triggered.intersection(callback['inputs']):
+                    changed |= self.call(callback, triggered)
+
+    def act(self, action: str):
+        """Action de l'utilisateur, suivie des callbacks qu'elle déclenche"""
+
+        if action == 'click':
+            name = self.rng.choice(capitals['CapitalName'].tolist())
+            self.values['mapmonde', 'clickData'] = {'points': [{'hovertext': name}]}
+            self.trigger({('mapmonde', 'clickData')})
+        elif action == 'layer':
+            self.values['layers-dropdown', 'value'] = self.rng.choice(self.values['layers-dropdown', 'options'])['value']
+            self.trigger({('layers-dropdown', 'value')})
+        elif action == 'variable':
+            self.values['variables-prevision-dropdown', 'value'] = \
+                self.rng.choice(self.values['variables-prevision-dropdown', 'options'])['value']
+            self.trigger({('variables-prevision-dropdown', 'value')})
+        else:
+            changed = set()
+            for interval in ['interval-component-120s', 'interval-component-300s']:
+                if (interval, 'n_intervals') in self.values:
+                    self.values[interval, 'n_intervals'] = (self.values[interval, 'n_intervals'] or 0) + 1
+                    changed.add((interval, 'n_intervals'))
+            self.trigger(changed)
+
+    def run(self, deadline: float, think_time: float):
+        """Chargement de la page (mise en page, capitale par défaut), puis actions jusqu'à l'échéance"""
+
+        self.count_bytes(self.http.get(self.base_url + "/_dash-layout"))
+        self.trigger({('mapmonde', 'clickData')})
+        actions, weights = zip(*ACTIONS)
+        while time.monotonic() < deadline:
+            self.act(self.rng.choices(actions, weights)[0])
+            if think_time:
+                time.sleep(self.rng.uniform(0, 2 * think_time))
+
+def report(calls: list, duration: float):
+    """Débit, erreurs et latences par callback et au total"""
+
+    print("{:<28} {:>8} {:>8} {:>9} {:>9} {:>9}".format("callback", "appels", "erreurs", "p50 (ms)", "p95 (ms)", "p99 (ms)"))
+    names = sorted({name for name, _, _ in calls})
+    for name in names + [None]:
+        selected = [(latency, ok) for call_name, latency, ok in calls if name is None or call_name == name]
+        latencies = np.array([latency for latency, _ in selected]) * 1000
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        print("{:<28} {:>8d} {:>8d} {:>9.1f} {:>9.1f} {:>9.1f}".format(
+            name or "total", len(selected), sum(not ok for _, ok in selected), p50, p95, p99
+        ))
+    print("Débit : {:.1f} appels/s".format(len(calls) / duration))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=20, help="nombre de sessions simultanées")
+    parser.add_argument("--duration", type=float, default=30.0, help="durée de la mesure, en secondes")
+    parser.add_argument("--think-time", type=float, default=0.0, help="pause moyenne entre deux actions, en secondes")
+    parser.add_argument("--seed", type=int, default=0, help="graine des actions des sessions")
+    parser.add_argument("--url", help="URL d'une application déjà lancée (sinon lancée contre le serveur de substitution)")
+    parser.add_argument("--map-mode", choices=["clientside", "server", "lod"], help="mode de mise à jour de la carte ([map] update_mode)")
+    parser.add_argument("--latency", type=float, default=0.05, help="latence du serveur de substitution, en secondes")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="part des requêtes en échec (503) du serveur de substitution")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="part des requêtes refusées (429) du serveur de substitution")
+    args = parser.parse_args()
+
+    process = stub = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+    else:
+        stub, _ = start_stub(args.latency, error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate)
+        urls = get_stub_urls(stub)
+        overrides = {
+            'one_call_api_base_url': urls['one_call_api_base_url'],
+            'weather_tile_api_base_url': urls['weather_tile_api_base_url'],
+            'refresher_enabled': False,
+            'governor_enabled': False,
+            'history_enabled': False
+        }
+        if args.map_mode:
+            overrides['map_update_mode'] = args.map_mode
+        process, base_url = start_app(overrides)
+
+    callbacks = get_callbacks(base_url)
+    values = get_layout_values(base_url)
+    print("{} sessions, {:.0f} s, callbacks du serveur : {}".format(
+        args.sessions, args.duration, ", ".join(callback['name'] for callback in callbacks)
+    ))
+
+    deadline = time.monotonic() + args.duration
+    sessions = [Session(base_url, callbacks, values, random.Random(args.seed + i)) for i in range(args.sessions)]
+    threads = [threading.Thread(target=session.run, args=(deadline, args.think_time)) for session in sessions]
+    cpu_started = get_server_cpu(base_url) if process else None
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.monotonic() - started
+
+    report([call for session in sessions for call in session.calls], duration)
+    transferred = sum(session.transferred_bytes for session in sessions) / len(sessions)
+    decoded = sum(session.decoded_bytes for session in sessions) / len(sessions)
+    print("Octets reçus par session : {:.0f} Kio transférés pour {:.0f} Kio décompressés ({:.0%} économisés)".format(
+        transferred / 1024, decoded / 1024, 1 - transferred / decoded if decoded else 0
+    ))
+    if process:
+        cpu = get_server_cpu(base_url) - cpu_started
+        print("CPU du serveur : {:.2f} s ({:.0%} d'un cœur)".format(cpu, cpu / duration))
+        print("Appels au serveur de substitution : {}".format(
+            ", ".join("{} {} : {}".format(service, status, count) for (service, status), count in sorted(stub.status_counts.items()))
+        ))
+        process.terminate()
+        process.join()
+        stub.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# coding: utf-8
+
+"""Temps de démarrage d'un processus : import de main.py et première réponse, sans puis avec les artefacts de démarrage
+
+Lancement depuis la racine du projet : python -m benchmarks.bench_startup [nombre de démarrages]
+"""
+
+import json
+import shutil
+import statistics
+import subprocess
+import sys
+
+from components.config import root_dir
+from components.startup import artifacts_dir
+
+
+# Code exécuté dans un nouveau processus : durée d'import de main.py, puis de la première requête de mise en page
+CHILD_CODE = """
+import json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+response = main.application.test_client().get("/_dash-layout")
+responded = time.perf_counter()
+print(json.dumps({'import_s': imported - started, 'first_response_s': responded - started, 'status': response.status_code}))
+"""
+
+
+def measure_boot():
+    """Mesures d'un démarrage dans un nouveau processus"""
+
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD_CODE], cwd=root_dir, check=True, capture_output=True, text=True
+    ).stdout
+
+    return json.loads(output.strip().splitlines()[-1])
+
+def summarize(label: str, boots: list[dict]):
+    print("{:<28} import {:6.3f} s   première réponse {:6.3f} s".format(
+        label,
+        statistics.median(boot['import_s'] for boot in boots),
+        statistics.median(boot['first_response_s'] for boot in boots)
+    ))
+
+def main(count: int):
+    # Sans artefact : chaque démarrage reconstruit la carte et relit le fichier des capitales
+    cold = []
+    for _ in range(count):
+        shutil.rmtree(artifacts_dir, ignore_errors=True)
+        cold.append(measure_boot())
+
+    # Avec artefact : écrit par le dernier démarrage ci-dessus
+    warm = [measure_boot() for _ in range(count)]
+
+    print("{} démarrages (médianes)".format(count))
+    summarize("sans artefact", cold)
+    summarize("avec artefact", warm)
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
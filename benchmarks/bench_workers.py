@@ -0,0 +1,76 @@
+# coding: utf-8
+
+"""Appels à l'API One Call de plusieurs processus demandant les mêmes capitales en même temps,
+avec le cache propre à chaque processus puis avec le cache partagé (SQLite)
+
+Lancement depuis la racine du projet : python -m benchmarks.bench_workers [processus] [threads par processus] [latence en secondes]
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from components import api, governor
+from components.capitals import capitals
+from components.config import cache_ttl, cache_lease_timeout, cache_poll_interval
+from components.shared_cache import SharedCache
+
+from .upstream_stub import start_stub
+
+
+# Capitales demandées par chaque thread de chaque processus
+CAPITAL_COUNT = 20
+
+
+def run_worker(url: str, shared_path: str, threads: int, barrier):
+    """Processus de travail : chaque thread demande toutes les capitales ; renvoie la durée et les températures obtenues"""
+
+    api.shared_cache = SharedCache(shared_path, cache_ttl, cache_lease_timeout, cache_poll_interval) if shared_path else None
+    governor.budget = None
+    locations = list(zip(capitals['CapitalLatitude'], capitals['CapitalLongitude']))[:CAPITAL_COUNT]
+
+    def request_all():
+        return [float(api.get_weather_results(lat, lon, url, "")[0]['temp']) for lat, lon in locations]
+
+    barrier.wait()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(lambda _: request_all(), range(threads)))
+
+    return time.perf_counter() - started, results[0]
+
+def run(url: str, shared_path: str, processes: int, threads: int):
+    """Lancement simultané des processus ; renvoie la durée (du plus lent) et les résultats de chacun"""
+
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Manager().Barrier(processes)
+    with context.Pool(processes) as pool:
+        outcomes = pool.starmap(run_worker, [(url, shared_path, threads, barrier)] * processes)
+
+    return max(duration for duration, _ in outcomes), [results for _, results in outcomes]
+
+def main(processes: int, threads: int, latency: float):
+    server, url = start_stub(latency)
+    print("{} processus x {} threads, {} capitales, latence amont {:.0f} ms".format(processes, threads, CAPITAL_COUNT, latency * 1000))
+
+    with tempfile.TemporaryDirectory() as directory:
+        for label, shared_path in [("cache par processus", None), ("cache partagé", os.path.join(directory, "shared.sqlite"))]:
+            server.request_count = 0
+            duration, results = run(url, shared_path, processes, threads)
+            consistent = all(result == results[0] for result in results)
+            print("{:<20} {:4d} appels amont en {:.2f} s (résultats identiques entre processus : {})".format(
+                label, server.request_count, duration, "oui" if consistent else "non"
+            ))
+
+    server.shutdown()
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(
+        int(args[0]) if len(args) > 0 else 4,
+        int(args[1]) if len(args) > 1 else 4,
+        float(args[2]) if len(args) > 2 else 0.2
+    )
@@ -0,0 +1,113 @@
+# coding: utf-8
+
+import glob
+import json
+import os
+import random
+
+
+# Réponses One Call figées sur disque (format 2.5, générées une fois ; averses sur Singapour, changement d'heure européen)
+fixtures_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+WEATHER_CONDITIONS = [
+    (800, "Clear", "clear sky", "01d"),
+    (801, "Clouds", "few clouds", "02d"),
+    (803, "Clouds", "broken clouds", "04n"),
+    (500, "Rain", "light rain", "10d"),
+    (600, "Snow", "light snow", "13n")
+]
+
+
+def generate_weather(rng: random.Random):
+    """Liste 'weather' d'une entrée One Call"""
+
+    identifier, main, description, icon = rng.choice(WEATHER_CONDITIONS)
+
+    return [{'id': identifier, 'main': main, 'description': description, 'icon': icon}]
+
+def generate_one_call_payload(lat: float, lon: float, dt: int=1634558400, seed: int=0):
+    """Réponse One Call 2.5 synthétique (current, minutely, hourly, daily) pour un point"""
+
+    rng = random.Random(seed)
+    base_temp = 30 - abs(lat) / 2
+    current = {
+        'dt': dt,
+        'sunrise': dt - 21600,
+        'sunset': dt + 21600,
+        'temp': round(base_temp + rng.uniform(-3, 3), 2),
+        'feels_like': round(base_temp + rng.uniform(-5, 2), 2),
+        'pressure': rng.randint(990, 1030),
+        'humidity': rng.randint(20, 100),
+        'dew_point': round(base_temp - rng.uniform(2, 10), 2),
+        'uvi': round(rng.uniform(0, 8), 2),
+        'clouds': rng.randint(0, 100),
+        'visibility': 10000,
+        'wind_speed': round(rng.uniform(0, 15), 2),
+        'wind_deg': rng.randint(0, 359),
+        'weather': generate_weather(rng)
+    }
+    hourly = [
+        {
+            'dt': dt + 3600 * hour,
+            'temp': round(base_temp + rng.uniform(-5, 5), 2),
+            'feels_like': round(base_temp + rng.uniform(-7, 4), 2),
+            'pressure': rng.randint(990, 1030),
+            'humidity': rng.randint(20, 100),
+            'dew_point': round(base_temp - rng.uniform(2, 10), 2),
+            'uvi': round(rng.uniform(0, 8), 2),
+            'clouds': rng.randint(0, 100),
+            'visibility': 10000,
+            'wind_speed': round(rng.uniform(0, 15), 2),
+            'wind_deg': rng.randint(0, 359),
+            'wind_gust': round(rng.uniform(0, 25), 2),
+            'weather': generate_weather(rng),
+            'pop': round(rng.uniform(0, 1), 2)
+        }
+        for hour in range(48)
+    ]
+    minutely = [{'dt': dt + 60 * minute, 'precipitation': 0} for minute in range(60)]
+    daily = [
+        {
+            'dt': dt + 86400 * day,
+            'sunrise': dt + 86400 * day - 21600,
+            'sunset': dt + 86400 * day + 21600,
+            'moonrise': dt + 86400 * day,
+            'moonset': dt + 86400 * day + 43200,
+            'moon_phase': 0.5,
+            'temp': {'day': base_temp, 'min': base_temp - 5, 'max': base_temp + 5, 'night': base_temp - 3, 'eve': base_temp, 'morn': base_temp - 4},
+            'feels_like': {'day': base_temp, 'night': base_temp - 4, 'eve': base_temp - 1, 'morn': base_temp - 5},
+            'pressure': rng.randint(990, 1030),
+            'humidity': rng.randint(20, 100),
+            'dew_point': round(base_temp - rng.uniform(2, 10), 2),
+            'wind_speed': round(rng.uniform(0, 15), 2),
+            'wind_deg': rng.randint(0, 359),
+            'wind_gust': round(rng.uniform(0, 25), 2),
+            'weather': generate_weather(rng),
+            'clouds': rng.randint(0, 100),
+            'pop': round(rng.uniform(0, 1), 2),
+            'uvi': round(rng.uniform(0, 8), 2)
+        }
+        for day in range(8)
+    ]
+
+    return {
+        'lat': lat,
+        'lon': lon,
+        'timezone': "UTC",
+        'timezone_offset': 0,
+        'current': current,
+        'minutely': minutely,
+        'hourly': hourly,
+        'daily': daily
+    }
+
+def load_fixtures():
+    """Lecture des réponses One Call enregistrées, indexées par nom de fichier"""
+
+    fixtures = {}
+    for path in sorted(glob.glob(os.path.join(fixtures_dir, "onecall_*.json"))):
+        with open(path, encoding="utf-8") as fixture_file:
+            fixtures[os.path.basename(path)[len("onecall_"):-len(".json")]] = json.load(fixture_file)
+
+    return fixtures
@@ -0,0 +1,164 @@
+# coding: utf-8
+
+"""Suite de mesures hors ligne : lecture des réponses One Call, callbacks et construction des figures
+
+Lancement depuis la racine du projet :
+    python -m benchmarks.suite                 mesure et affichage
+    python -m benchmarks.suite --save          mesure et enregistrement comme référence
+    python -m benchmarks.suite --compare       mesure et comparaison à la référence (code de sortie non nul en cas de régression)
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+import tracemalloc
+
+import plotly.utils
+import requests
+
+from components import api, governor, upstream
+from components.capitals import capitals, capital_index
+from components.config import api_key, init_layer, weather_tile_api_base_url, \
+    scatter_mapbox_marker_color, datetime_label, variables
+from components import callbacks, figures, store
+
+from .payloads import load_fixtures
+
+
+# Emplacement par défaut des résultats de référence
+baseline_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# relayoutData d'une vue de l'Europe, pour la carte à niveau de détail
+LOD_REGIONAL_VIEW = {'mapbox.zoom': 4, 'mapbox._derived': {'coordinates': [[-12, 60], [30, 60], [30, 35], [-12, 35]]}}
+
+
+class FixtureSession:
+    """Remplaçant de la session HTTP : toute requête reçoit la même réponse One Call enregistrée"""
+
+    def __init__(self, payload: dict):
+        self.content = json.dumps(payload).encode("utf-8")
+
+    def get(self, url: str, timeout=None):
+        response = requests.Response()
+        response.status_code = 200
+        response._content = self.content
+        response.url = url
+
+        return response
+
+
+def unwrap(callback):
+    """Fonction d'origine d'un callback enregistré auprès de Dash"""
+
+    return getattr(callback, "__wrapped__", callback)
+
+def uncached(function):
+    """Exécution sans cache ni stockage : chaque appel refait la lecture complète de la réponse"""
+
+    def run(*args):
+        api.weather_cache.clear()
+        store.result_store.clear()
+        return function(*args)
+
+    return run
+
+def build_cases(payload: dict):
+    """Cas mesurés : nom et fonction sans argument"""
+
+    capitale_data, _ = unwrap(callbacks.store_click_data)({'points': [{'hovertext': "Paris"}]})
+    current_token, hourly_token = uncached(unwrap(callbacks.stream_data))(0, capitale_data)
+    current, hourly = store.get_results(current_token)
+    init_map = figures.create_map(capitals, init_layer, weather_tile_api_base_url, api_key, scatter_mapbox_marker_color)
+    init_map_json = json.loads(json.dumps(init_map, cls=plotly.utils.PlotlyJSONEncoder))
+    display_hourly = callbacks.to_display_frame(hourly)
+
+    return {
+        'parsing.get_current_weather_results': lambda: api.get_current_weather_results(payload),
+        'parsing.get_hourly_weather_results': lambda: api.get_hourly_weather_results(payload),
+        'callbacks.store_click_data': lambda: unwrap(callbacks.store_click_data)({'points': [{'hovertext': "Tokyo"}]}),
+        'callbacks.stream_data.cold': lambda: uncached(unwrap(callbacks.stream_data))(0, capitale_data),
+        'callbacks.stream_data.cached': lambda: unwrap(callbacks.stream_data)(0, capitale_data),
+        'callbacks.update_map': lambda: callbacks.update_map(capitale_data, 0, "wind_new", init_map_json),
+        'callbacks.create_lod_figure.world': lambda: callbacks.create_lod_figure("Paris", "wind_new", {'mapbox.zoom': 1}),
+        'callbacks.create_lod_figure.regional': lambda: callbacks.create_lod_figure("Paris", "wind_new", LOD_REGIONAL_VIEW),
+        'callbacks.indicateur': lambda: callbacks.build_indicateur(current_token),
+        'callbacks.serie_temp': lambda: callbacks.build_serie_temp(hourly_token, "temp"),
+        'callbacks.tab': lambda: callbacks.build_tab(hourly_token),
+        'figures.create_map': lambda: figures.create_map(capitals, init_layer, weather_tile_api_base_url, api_key, scatter_mapbox_marker_color),
+        'figures.color_capital_map': lambda: figures.color_capital_map(init_map, "Tokyo", capital_index),
+        'figures.create_indicateur': lambda: figures.create_indicateur(current),
+        'figures.create_serie_temp': lambda: figures.create_serie_temp(display_hourly, "temp", "Température"),
+        'figures.create_table': lambda: figures.create_table(display_hourly, datetime_label, variables)
+    }
+
+def measure(function, repeat: int=5, min_time: float=0.2):
+    """Temps moyen d'un appel (meilleure série, en ms) et pic de mémoire allouée pendant un appel (en Kio)"""
+
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    duration = min(timer.repeat(repeat=repeat, number=number)) / number
+
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {'time_ms': duration * 1000, 'peak_kib': peak / 1024}
+
+def run(fixture_name: str):
+    """Mesure de tous les cas sur une réponse enregistrée"""
+
+    payload = load_fixtures()[fixture_name]
+    upstream.session = FixtureSession(payload)
+    # Aucun appel réel à OpenWeather : mesures sans budget des appels
+    governor.budget = None
+
+    return {name: measure(function) for name, function in build_cases(payload).items()}
+
+def compare(results: dict, baseline: dict, threshold: float):
+    """Liste des cas dont le temps ou le pic de mémoire dépasse la référence de plus de threshold (en proportion)"""
+
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for metric in ['time_ms', 'peak_kib']:
+            if result[metric] > baseline[name][metric] * (1 + threshold):
+                regressions.append((name, metric, baseline[name][metric], result[metric]))
+
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixture", default="paris", help="réponse One Call enregistrée à utiliser")
+    parser.add_argument("--baseline", default=baseline_path, help="fichier des résultats de référence")
+    parser.add_argument("--save", action="store_true", help="enregistre les résultats comme référence")
+    parser.add_argument("--compare", action="store_true", help="compare les résultats à la référence")
+    parser.add_argument("--threshold", type=float, default=0.25, help="hausse tolérée par rapport à la référence")
+    args = parser.parse_args()
+
+    results = run(args.fixture)
+    for name, result in results.items():
+        print("{:<42} {:10.3f} ms {:10.1f} Kio".format(name, result['time_ms'], result['peak_kib']))
+
+    if args.save:
+        with open(args.baseline, "w", encoding="utf-8") as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+        print("Référence enregistrée dans {}".format(args.baseline))
+
+    if args.compare:
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.threshold)
+        for name, metric, reference, value in regressions:
+            print("RÉGRESSION {} {} : {:.3f} -> {:.3f}".format(name, metric, reference, value))
+        if regressions:
+            return 1
+        print("Aucune régression au-delà de {:.0%}".format(args.threshold))
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
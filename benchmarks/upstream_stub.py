@@ -0,0 +1,193 @@
+# coding: utf-8
+
+"""Serveur local de substitution à OpenWeather (API One Call, tuiles météo) et au fond de carte : réponses synthétiques
+ou enregistrées pour tout point, latence, taux d'erreurs 503 et de réponses 429 réglables
+
+Lancement autonome depuis la racine du projet : python -m benchmarks.upstream_stub [--port 8060] [--latency 0.2] ...
+puis remplacement des URL de 'config.ini' par celles affichées au démarrage
+"""
+
+import argparse
+import collections
+import functools
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from .payloads import generate_one_call_payload, load_fixtures
+
+
+# Chemins des tuiles météo (/map/<couche>/<z>/<x>/<y>.png) et du fond de carte (.../tile/<z>/<y>/<x>)
+WEATHER_TILE_PATH = re.compile(r"/map/(?P<layer>[\w-]+)/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)\.png$")
+BASEMAP_TILE_PATH = re.compile(r"/tile/(?P<z>\d+)/(?P<y>\d+)/(?P<x>\d+)$")
+
+# Côté des tuiles servies, en pixels, et nombre de variantes de tuiles par couche
+TILE_SIZE = 256
+TILE_VARIANTS = 8
+
+
+@functools.lru_cache(maxsize=None)
+def get_tile(layer: str, variant: int):
+    """Tuile PNG unie, de couleur propre à la couche (semi-transparente) et à la variante"""
+
+    from components.overlay import encode_png
+
+    rng = random.Random("{}-{}".format(layer, variant))
+    color = [rng.randint(0, 255) for _ in range(3)] + [255 if layer == "basemap" else 128]
+
+    return encode_png(np.tile(np.array(color, dtype='uint8'), (TILE_SIZE, TILE_SIZE, 1)))
+
+
+class UpstreamStubHandler(BaseHTTPRequestHandler):
+    """Réponses One Call (synthétiques, renouvelées toutes les update_period secondes si update_period n'est pas nul,
+    ou enregistrées : celle du point le plus proche ; sans les parties exclues par exclude=) et tuiles, servies après une latence fixe plus un délai aléatoire
+    d'au plus jitter secondes ; une part error_rate des requêtes échoue (503), une part rate_limit_rate est refusée (429)"""
+
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    jitter = 0.0
+    error_rate = 0.0
+    rate_limit_rate = 0.0
+    update_period = 0.0
+    started = 0.0
+    # Réponses enregistrées, None pour des réponses synthétiques
+    fixtures = None
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        weather_tile = WEATHER_TILE_PATH.search(parts.path)
+        if parts.path.endswith("/onecall"):
+            service = "one_call"
+        elif weather_tile or BASEMAP_TILE_PATH.search(parts.path):
+            service = "tiles"
+        else:
+            service = "other"
+        time.sleep(self.latency + random.uniform(0, self.jitter))
+
+        draw = random.random()
+        if service == "other":
+            status = 404
+        elif draw < self.rate_limit_rate:
+            status = 429
+        elif draw < self.rate_limit_rate + self.error_rate:
+            status = 503
+        else:
+            status = 200
+        self.server.record(service, status)
+
+        if status != 200:
+            self.send_body(status, "application/json", json.dumps({'cod': status, 'message': self.responses[status][0]}).encode("utf-8"))
+        elif service == "one_call":
+            query = parse_qs(parts.query)
+            payload = self.get_one_call_payload(float(query['lat'][0]), float(query['lon'][0]))
+            # Parties exclues de la réponse, comme l'API
+            for part in query.get('exclude', [""])[0].split(","):
+                payload.pop(part, None)
+            self.send_body(200, "application/json", json.dumps(payload).encode("utf-8"))
+        else:
+            layer = weather_tile.group('layer') if weather_tile else "basemap"
+            self.send_body(200, "image/png", get_tile(layer, zlib.crc32(parts.path.encode('utf-8')) % TILE_VARIANTS))
+
+    def get_one_call_payload(self, lat: float, lon: float):
+        """Réponse One Call d'un point"""
+
+        if self.fixtures:
+            payload = dict(min(self.fixtures, key=lambda fixture: (fixture['lat'] - lat) ** 2 + (fixture['lon'] - lon) ** 2))
+            payload['lat'], payload['lon'] = lat, lon
+
+            return payload
+
+        period = int((time.monotonic() - self.started) // self.update_period) if self.update_period else 0
+
+        return generate_one_call_payload(lat, lon, dt=1634558400 + 600 * period, seed=period)
+
+    def send_body(self, status: int, content_type: str, body: bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if status == 429:
+            self.send_header("Retry-After", "1")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class UpstreamStubServer(ThreadingHTTPServer):
+    """Serveur comptant les requêtes reçues : au total, et par service et code de réponse"""
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple, handler):
+        super().__init__(address, handler)
+        self.request_count = 0
+        self.status_counts = collections.Counter()
+        self.count_lock = threading.Lock()
+
+    def record(self, service: str, status: int):
+        with self.count_lock:
+            self.request_count += 1
+            self.status_counts[service, status] += 1
+
+def get_stub_urls(server: UpstreamStubServer):
+    """URL du serveur à reporter dans 'config.ini' (mêmes modèles que les URL d'origine)"""
+
+    root = "http://{}:{}".format(*server.server_address[:2])
+
+    return {
+        'one_call_api_base_url': root + "/data/2.5/onecall?lat={}&lon={}&appid={}&units=metric&exclude=minutely,daily,alerts",
+        'weather_tile_api_base_url': root + "/map/{}/{}/{}/{}.png?appid={}",
+        'basemap_tile_url': root + "/basemap/tile/{z}/{y}/{x}"
+    }
+
+def start_stub(latency: float=0.0, update_period: float=0.0, error_rate: float=0.0, rate_limit_rate: float=0.0, jitter: float=0.0, recorded: bool=False, port: int=0):
+    """Démarrage du serveur dans un thread ; renvoie le serveur et le modèle d'URL One Call à utiliser"""
+
+    handler = type("Handler", (UpstreamStubHandler,), {
+        'latency': latency,
+        'jitter': jitter,
+        'error_rate': error_rate,
+        'rate_limit_rate': rate_limit_rate,
+        'update_period': update_period,
+        'started': time.monotonic(),
+        'fixtures': list(load_fixtures().values()) if recorded else None
+    })
+    server = UpstreamStubServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server, get_stub_urls(server)['one_call_api_base_url']
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8060, help="port d'écoute")
+    parser.add_argument("--latency", type=float, default=0.0, help="latence fixe, en secondes")
+    parser.add_argument("--jitter", type=float, default=0.0, help="délai aléatoire ajouté à la latence, au plus, en secondes")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="part des requêtes en échec (503)")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="part des requêtes refusées (429)")
+    parser.add_argument("--update-period", type=float, default=0.0, help="période de renouvellement des réponses synthétiques, en secondes")
+    parser.add_argument("--recorded", action="store_true", help="réponses enregistrées (benchmarks/fixtures) plutôt que synthétiques")
+    args = parser.parse_args()
+
+    server, _ = start_stub(args.latency, args.update_period, args.error_rate, args.rate_limit_rate, args.jitter, args.recorded, args.port)
+    print("URL à reporter dans 'config.ini' :")
+    for name, url in get_stub_urls(server).items():
+        print("{}={}".format(name, url))
+
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        pass
+    server.shutdown()
+    for (service, status), count in sorted(server.status_counts.items()):
+        print("{:<10} {} : {}".format(service, status, count))
+
+if __name__ == '__main__':
+    main()
@@ -1,49 +1,225 @@
 # coding: utf-8
 
+from concurrent.futures import ThreadPoolExecutor
 import datetime as dt
 import json
-import requests
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
 
+import numpy as np
 import pandas as pd
 
+from . import metrics, upstream
+from .cache import TTLCache
+from .config import cache_ttl, cache_maxsize, cache_stale_ttl, cache_coordinates_precision, cache_backend, cache_shared_path, \
+    cache_lease_timeout, cache_poll_interval, http_max_concurrency, variables, payload_projection, payload_fields, \
+    refresher_min_interval
+from .shared_cache import SharedCache
 
-def get_current_weather_results(weather_dict: dict):
-    """Extraction des données currentes du dictionnaire des résultats météo global"""
-
-    # Construction et mise en forme du DataFrame
-    current = pd.Series(weather_dict['current'])
-    current['dt'] = dt.datetime.fromtimestamp(current['dt'])
-    current['sunrise'] = dt.datetime.fromtimestamp(current['sunrise'])
-    current['sunset'] = dt.datetime.fromtimestamp(current['sunset'])
-    current['weather_condition'] = current['weather'][0]['main']
-    current['weather_icon'] = current['weather'][0]['icon']
-    current.drop(['weather'], inplace=True)
-
-    return current
-
-def get_hourly_weather_results(weather_dict: dict):
-    """Extraction des données horaires prévisionnelles du dictionnaire des résultats météo global"""
-
-    # Construction et mise en forme du DataFrame
-    hourly = pd.DataFrame(weather_dict['hourly'])
-    hourly.loc[:,'weather_condition'] = hourly['weather'].map(lambda ls: ls[0]['main'])
-    hourly.loc[:,'weather_icon'] = hourly['weather'].map(lambda ls: ls[0]['icon'])
-    hourly.drop(columns=['weather'], inplace=True)
-    hourly.loc[:,'dt'] = hourly['dt'].map(dt.datetime.fromtimestamp)
-    
-    return hourly
-
-def get_weather_results(lat: float, lon: float, one_call_api_base_url: str, api_key: str):
-    """Obtention des résultats météo currents et prévisionnels"""
-    
-    # Appel API
-    url = one_call_api_base_url.format(lat, lon, api_key)
-    response = json.loads(requests.get(url).text)
-
-    # Lecture de la réponse, mise en forme des résultats en cas de succès
-    if response.get('cod') and response.get('cod') == 429:
-        raise Exception("Compte OpenWeather bloqué : trop d'appels API effectués ?")
-    current = get_current_weather_results(response)
-    hourly = get_hourly_weather_results(response)
+
+# Cache des résultats météo mis en forme, partagé par toutes les sessions du processus (résultats expirés conservés
+# pour être servis si OpenWeather ne peut être appelé)
+weather_cache = TTLCache(ttl=cache_ttl, maxsize=cache_maxsize, stale_ttl=cache_stale_ttl)
+metrics.watch_cache("weather", weather_cache)
+
+# Réponses brutes de l'API partagées par les processus de la machine (None : chaque processus appelle l'API seul)
+shared_cache = SharedCache(cache_shared_path, cache_ttl, cache_lease_timeout, cache_poll_interval) \
+    if cache_backend == "sqlite" else None
+
+# Fonctions appelées avec (lat, lon, current, hourly) après chaque appel API réussi de ce processus (historique, etc.)
+fetch_listeners = []
+
+# Fonctions appelées avec (lat, lon, current, hourly) pour chaque nouveau résultat placé dans le cache du processus,
+# qu'il ait été obtenu par ce processus ou par un autre (état propre au processus : classements, onglets abonnés)
+result_listeners = []
+
+# Champs conservés lors de la mise en forme des résultats (None : tous), complétés par les fonctions activées
+kept_fields = set(variables.values()) | set(payload_fields) if payload_projection else None
+
+# Verrous par point : un seul appel API par point absent du cache, les autres requêtes l'attendent
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+# Dates du point courant, toujours conservées
+TIMESTAMP_FIELDS = ['dt', 'sunrise', 'sunset']
+
+
+def keep_fields(fields: list[str]):
+    """Ajout de champs à conserver lors de la mise en forme des résultats (à appeler avant les premiers appels API)"""
+
+    if kept_fields is not None:
+        kept_fields.update(fields)
+
+def to_local_datetimes(timestamps: np.ndarray):
+    """Conversion en une seule opération de timestamps Unix en dates et heures locales naïves (comme datetime.fromtimestamp)"""
+
+    seconds = np.asarray(timestamps, dtype='int64')
+    if seconds.size == 0:
+        return seconds.astype('datetime64[ns]')
+
+    # Un seul décalage horaire si la période ne traverse pas de changement d'heure, un décalage par instant sinon
+    first_offset, last_offset = (time.localtime(int(second)).tm_gmtoff for second in (seconds[0], seconds[-1]))
+    if first_offset == last_offset:
+        offsets = first_offset
+    else:
+        offsets = np.array([time.localtime(int(second)).tm_gmtoff for second in seconds])
+
+    return (seconds + offsets).astype('datetime64[s]').astype('datetime64[ns]')
+
+def to_categorical(values: list[str]):
+    """Construction d'une variable catégorielle à partir de codes calculés en un passage"""
+
+    categories = list(dict.fromkeys(values))
+    codes = {category: code for code, category in enumerate(categories)}
+
+    return pd.Categorical.from_codes(np.array([codes[value] for value in values], dtype='int16'), categories)
+
+def get_current_weather_results(weather_dict: dict, kept: set[str]=None):
+    """Extraction des données currentes du dictionnaire des résultats météo global (seulement les champs donnés, sinon tous)"""
+
+    # Mise en forme des champs sur le dictionnaire, puis construction de la série en une fois
+    current = dict(weather_dict['current'])
+    weather = current.pop('weather')[0]
+    if kept is not None:
+        current = {field: value for field, value in current.items() if field in kept or field in TIMESTAMP_FIELDS}
+    for field in TIMESTAMP_FIELDS:
+        current[field] = dt.datetime.fromtimestamp(current[field])
+    current['weather_condition'] = weather['main']
+    current['weather_icon'] = weather['icon']
+
+    return pd.Series(current)
+
+def get_hourly_weather_results(weather_dict: dict, kept: set[str]=None):
+    """Extraction des données horaires prévisionnelles du dictionnaire des résultats météo global (seulement les champs
+    donnés, sinon tous)"""
+
+    # Champs présents dans au moins une heure, en distinguant ceux imbriqués (weather, rain, snow)
+    records = weather_dict['hourly']
+    fields = dict.fromkeys(
+        field for record in records for field in record if kept is None or field in kept or field in ('dt', 'weather')
+    )
+    nested_fields = {field for record in records for field, value in record.items() if isinstance(value, (dict, list))}
+    numeric_fields = [field for field in fields if field not in nested_fields and field != 'dt']
+
+    # Valeurs numériques lues en une matrice réelle simple précision, champs de 'weather' lus en un seul passage
+    values = np.array([[record.get(field, np.nan) for field in numeric_fields] for record in records], dtype='float32')
+    conditions, icons = zip(*[(record['weather'][0]['main'], record['weather'][0]['icon']) for record in records])
+
+    # Construction du DataFrame en une fois, colonne par colonne
+    columns = {'dt': to_local_datetimes([record['dt'] for record in records])}
+    columns.update(zip(numeric_fields, values.T))
+    columns.update({field: [record.get(field, np.nan) for record in records] for field in fields if field in nested_fields - {'weather'}})
+    columns['weather_condition'] = to_categorical(conditions)
+    columns['weather_icon'] = to_categorical(icons)
+
+    return pd.DataFrame(columns)
+
+def get_location(lat: float, lon: float):
+    """Coordonnées arrondies d'un point (début des clés de cache), pour tous les modules qui suivent des points"""
+
+    return round(float(lat), cache_coordinates_precision), round(float(lon), cache_coordinates_precision)
+
+def get_weather_cache_key(lat: float, lon: float, one_call_api_base_url: str):
+    """Clé de cache d'un point : coordonnées arrondies, unités et parties exclues de la réponse"""
+
+    query = parse_qs(urlsplit(one_call_api_base_url).query)
+    units = query.get('units', ["standard"])[0]
+    exclude = ",".join(sorted(query.get('exclude', [""])[0].split(",")))
+
+    return get_location(lat, lon) + (units, exclude)
+
+def evict_weather_results(lat: float, lon: float):
+    """Suppression du cache de tous les résultats météo d'un point, quelles que soient les unités et exclusions"""
+
+    location = get_location(lat, lon)
+
+    return weather_cache.evict(lambda key: key[:2] == location)
+
+def fetch_payload(url: str):
+    """Corps de la réponse de l'API One Call"""
+
+    response = upstream.get(url)
+    response.raise_for_status()
+
+    return response.content
+
+def get_weather_results(lat: float, lon: float, one_call_api_base_url: str, api_key: str, refresh: bool=False):
+    """Obtention des résultats météo currents et prévisionnels (servis depuis le cache s'ils sont encore valides, sauf rafraîchissement forcé)"""
+
+    # Résultats déjà mis en forme pour ce point : pas d'appel API ni de lecture
+    cache_key = get_weather_cache_key(lat, lon, one_call_api_base_url)
+    if not refresh:
+        cached = weather_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    # Un seul appel à la fois par point dans le processus : les requêtes simultanées attendent son résultat
+    with _inflight_lock:
+        key_lock = _inflight.setdefault(cache_key, threading.Lock())
+    try:
+        with key_lock:
+            # Les résultats ont pu être obtenus par une autre requête pendant l'attente du verrou
+            if not refresh:
+                cached = weather_cache.get(cache_key)
+                if cached is not None:
+                    return cached
+            return fetch_weather_results(cache_key, lat, lon, one_call_api_base_url.format(lat, lon, api_key), refresh)
+    finally:
+        with _inflight_lock:
+            _inflight.pop(cache_key, None)
+
+def fetch_weather_results(cache_key: tuple, lat: float, lon: float, url: str, refresh: bool):
+    """Appel API et mise en forme des résultats d'un point, placés dans le cache"""
+
+    # Appel API, ou réponse obtenue par un autre processus (un seul appel à la fois par point pour tous les processus)
+    try:
+        if shared_cache is None:
+            payload, ttl, fetched = fetch_payload(url), None, True
+        else:
+            # Rafraîchissement : réponse d'un autre processus acceptée si elle a moins de min_interval secondes
+            # (chaque processus a son propre thread de rafraîchissement)
+            payload, ttl, fetched = shared_cache.get_or_fetch(
+                "|".join(map(str, cache_key)),
+                lambda: fetch_payload(url),
+                refresher_min_interval if refresh else None
+            )
+    except upstream.UpstreamError:
+        # Budget épuisé ou OpenWeather indisponible : derniers résultats connus plutôt qu'une erreur
+        # (sauf rafraîchissement forcé, dont l'échec doit être signalé)
+        stale = None if refresh else weather_cache.get_stale(cache_key)
+        if stale is None:
+            raise
+        metrics.stale_results.labels("one_call").inc()
+        return stale
+    response = json.loads(payload)
+
+    # Mise en forme des résultats
+    current = get_current_weather_results(response, kept_fields)
+    hourly = get_hourly_weather_results(response, kept_fields)
+    weather_cache.set(cache_key, (current, hourly), ttl=ttl)
+    for listener in result_listeners:
+        listener(lat, lon, current, hourly)
+    # Les résultats obtenus par un autre processus ont déjà été enregistrés par celui-ci
+    if fetched:
+        for listener in fetch_listeners:
+            listener(lat, lon, current, hourly)
 
     return current, hourly
+
+def get_weather_results_many(locations: list[tuple[float, float]], one_call_api_base_url: str, api_key: str, refresh: bool=False, max_concurrency: int=http_max_concurrency):
+    """Obtention concurrente des résultats météo de plusieurs points : résultats et erreurs indexés par (lat, lon)"""
+
+    results, errors = {}, {}
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        futures = {
+            (lat, lon): executor.submit(get_weather_results, lat, lon, one_call_api_base_url, api_key, refresh)
+            for lat, lon in dict.fromkeys(locations)
+        }
+        for location, future in futures.items():
+            try:
+                results[location] = future.result()
+            except Exception as error:
+                errors[location] = error
+
+    return results, errors
@@ -16,6 +16,8 @@ app = dash.Dash(
         "https://stackpath.bootstrapcdn.com/bootstrap/4.3.1/js/bootstrap.min.js"
     ],
     title="Météo SAYATO",
-    update_title="Rafraîchissement..."
+    update_title="Rafraîchissement...",
+    # Compression des réponses assurée par compression.py (section [compression] de 'config.ini')
+    compress=False
 )
 application = app.server
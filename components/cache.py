@@ -0,0 +1,85 @@
+# coding: utf-8
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class TTLCache:
+    """Cache en mémoire partagé entre les threads du processus : durée de vie par entrée et taille bornée (LRU) ;
+    les entrées expirées restent disponibles pour get_stale pendant stale_ttl secondes"""
+
+    def __init__(self, ttl: float, maxsize: int, stale_ttl: float=0.0):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.stale_ttl = stale_ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Renvoie la valeur associée à la clé si elle est présente et non expirée, None sinon"""
+
+        with self._lock:
+            entry = self._entries.get(key)
+            now = time.monotonic()
+            if entry is None or entry[0] < now:
+                self.misses += 1
+                if entry is not None and entry[0] + self.stale_ttl < now:
+                    del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def get_stale(self, key: Hashable) -> Optional[Any]:
+        """Renvoie la valeur associée à la clé, même expirée depuis moins de stale_ttl secondes, None sinon"""
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] + self.stale_ttl < time.monotonic():
+                return None
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float]=None):
+        """Enregistre une valeur (pour la durée de vie du cache, sauf durée propre), en évinçant l'entrée la moins
+        récemment utilisée si le cache est plein"""
+
+        with self._lock:
+            self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def items(self) -> list[tuple[Hashable, Any]]:
+        """Copie des entrées non expirées, sans modifier l'ordre d'utilisation ni les compteurs"""
+
+        now = time.monotonic()
+        with self._lock:
+            return [(key, entry[1]) for key, entry in self._entries.items() if entry[0] >= now]
+
+    def evict(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Supprime les entrées dont la clé vérifie le prédicat et renvoie leur nombre"""
+
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                del self._entries[key]
+
+        return len(keys)
+
+    def clear(self):
+        """Vide le cache et remet les compteurs à zéro"""
+
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict[str, int]:
+        """Compteurs de succès et d'échecs du cache, et nombre d'entrées"""
+
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
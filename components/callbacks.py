@@ -1,35 +1,90 @@
 # coding: utf-8
 
+import functools
 import json
 
-from babel.dates import format_datetime
-from bson import json_util
-from dash.dependencies import Input, Output, State
+import dash
+from dash import no_update
+from dash.dependencies import ClientsideFunction, Input, Output, State
+from dash.exceptions import PreventUpdate
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
 
+from . import metrics
 from .api import get_weather_results
+from .cache import TTLCache
 from .app import app
-from .capitals import capitals
-from .config import api_key, one_call_api_base_url, weather_tile_api_base_url, datetime_label, variables, \
-    scatter_mapbox_marker_color, scatter_mapbox_marker_color_selected
-from .figures import color_capital_map, create_indicateur, create_serie_temp, create_table, load_tile_map
+from .capitals import capital_index
+from .config import api_key, one_call_api_base_url, map_weather_tile_base_url, map_basemap_tile_url, datetime_label, \
+    variables, scatter_mapbox_marker_color, scatter_mapbox_marker_color_selected, map_update_mode, map_lod_cell_size, \
+    map_lod_max_markers, map_lod_cluster_radius, map_lod_viewport_margin, map_weather_layer, overlay_url, push_mode, \
+    store_ttl, store_maxsize
+from .figures import color_capital_map, create_indicateur, create_serie_temp, create_table, load_tile_map, \
+    get_lod_map_template, create_lod_map
+from .lod import LevelOfDetail, get_viewport
+from .overlay import get_overlay_version
+from .refresher import record_view
+from .store import get_results, has_results, put_results
 
 
-@app.callback(
-    [
-        Output('current', 'data'),
-        Output('hourly', 'data')
-    ],
-    [
-        Input('interval-component-120s', 'n_intervals'),
-        Input('capitale', 'data')
-    ]
-)
-def stream_data(n_intervals, capitale_data):
-    """Appels API récurrents pour obtenir les dernières données météo ponctuelles"""
+def to_display_frame(hourly: pd.DataFrame):
+    """Copie des prévisions pour l'affichage : réels simple précision repassés en double précision et arrondis
+    (OpenWeather fournit 2 décimales au plus)"""
+
+    float_columns = hourly.select_dtypes('float32').columns
+
+    return hourly.astype(dict.fromkeys(float_columns, 'float64')).round(2)
+
+# Figures déjà construites, par callback et jetons des données : les onglets affichant les mêmes données les partagent
+figure_cache = TTLCache(ttl=store_ttl, maxsize=store_maxsize)
+metrics.watch_cache("figures", figure_cache)
+
+def get_cached_figure(key: tuple, build, token: str, *args):
+    """Figure construite par build(token, *args), servie depuis le cache des figures si elle y est déjà ; mise en cache
+    seulement si elle a été construite avec la version des données désignée par le jeton"""
+
+    figure = figure_cache.get(key)
+    if figure is None:
+        figure = build(token, *args)
+        if has_results(token):
+            figure_cache.set(key, figure)
+
+    return figure
+
+@functools.lru_cache()
+def get_day_abbreviations(locale: str):
+    """Noms abrégés des jours de la semaine (du lundi au dimanche), lus une seule fois par langue
+    (import différé de babel au premier affichage du tableau)"""
+
+    from babel.dates import get_day_names
+
+    day_names = get_day_names('abbreviated', locale=locale)
 
-    # Requêtage de l'API et mise en forme des résultats en sortie
+    return np.array([day_names[day] for day in range(7)], dtype=object)
+
+def format_datetime_labels(datetimes: pd.Series, locale: str="fr"):
+    """Libellés « jour abrégé heure » des dates (équivalents au format babel "EEE H" suivi de "h"), calculés en bloc"""
+
+    day_abbreviations = get_day_abbreviations(locale)
+
+    return day_abbreviations[datetimes.dt.dayofweek.to_numpy()] + " " + datetimes.dt.hour.to_numpy().astype(str).astype(object) + "h"
+
+@functools.lru_cache()
+def count_dependent_callbacks(component_id: str, component_property: str):
+    """Nombre de callbacks déclenchés par une propriété d'un composant (1 pour current.data, 2 pour hourly.data)"""
+
+    return sum(
+        any(item['id'] == component_id and item['property'] == component_property for item in spec['inputs'])
+        for spec in app.callback_map.values()
+    )
+
+
+def stream_data(n_intervals, capitale_data, previous_current=None, previous_hourly=None):
+    """Appels API récurrents pour obtenir les dernières données météo ponctuelles ; seules les zones de stockage dont
+    les données ont changé sont mises à jour, pour ne pas relancer les callbacks qui en dépendent"""
+
+    # Requêtage de l'API ; les résultats restent sur le serveur, les zones de stockage ne reçoivent que leur jeton
     capitale_data = json.loads(capitale_data)
     current, hourly = get_weather_results(
         capitale_data['CapitalLatitude'],
@@ -37,10 +92,49 @@ def stream_data(n_intervals, capitale_data):
         one_call_api_base_url,
         api_key
     )
-    current = current.to_json(date_format='iso', orient='index')
-    hourly = hourly.to_json(date_format='iso', orient='records')
+    tokens = put_results(capitale_data['CapitalLatitude'], capitale_data['CapitalLongitude'], current, hourly)
+
+    outputs = []
+    for store, token, previous in zip(['current', 'hourly'], tokens, [previous_current, previous_hourly]):
+        changed = token != previous
+        metrics.observe_stream_update(store, changed, count_dependent_callbacks(store, 'data'))
+        outputs.append(token if changed else no_update)
+    if all(output is no_update for output in outputs):
+        raise PreventUpdate
+
+    return tuple(outputs)
 
-    return current, hourly
+stream_outputs = [
+    Output('current', 'data'),
+    Output('hourly', 'data')
+]
+stream_states = [
+    State('current', 'data'),
+    State('hourly', 'data')
+]
+if push_mode == "sse":
+    # Mises à jour poussées par le serveur (assets/push.js) : abonnement aux messages de la capitale sélectionnée,
+    # dont les jetons sont recopiés dans les zones de stockage par le navigateur, sans appel au serveur
+    app.clientside_callback(
+        ClientsideFunction(namespace="push", function_name="subscribe"),
+        Output('push-subscription', 'data'),
+        Input('capitale', 'data'),
+        State('push-settings', 'data')
+    )
+    app.clientside_callback(
+        ClientsideFunction(namespace="push", function_name="receive"),
+        stream_outputs,
+        Input('push-weather', 'value'),
+        stream_states
+    )
+    layer_trigger = Input('push-layer', 'value')
+else:
+    app.callback(
+        stream_outputs,
+        [Input('interval-component-120s', 'n_intervals'), Input('capitale', 'data')],
+        stream_states
+    )(stream_data)
+    layer_trigger = Input('interval-component-300s', 'n_intervals')
 
 @app.callback(
     [
@@ -53,26 +147,28 @@ def store_click_data(capitale_data):
     """Callback intermédiaire sauvegardant la ville cliquée sur le navigateur du client"""
 
     if capitale_data:
-        # Capitale sélectionnée par clic de l'utilisateur
-        capital_name = capitale_data['points'][0]['hovertext']
-        capitale_data = capitals.set_index('CapitalName').loc[capital_name,:].to_dict()
-        capitale_data['CapitalName'] = capital_name
+        # Capitale sélectionnée par clic de l'utilisateur : point survolé, ou à défaut capitale la plus proche du clic
+        point = capitale_data['points'][0]
+        capital_name = point.get('hovertext')
+        if capital_name not in capital_index.positions:
+            capital_name = capital_index.names[capital_index.nearest(point['lat'], point['lon'])]
+        capitale_data = capital_index.get_record(capital_name)
+        record_view(capital_name)
     else:
         # Capitale sélectionnée au départ par défaut : la première du tableau des capitales
-        capitale_data = capitals.iloc[0].to_dict()
+        capitale_data = dict(capital_index.records[0])
         capital_name = capitale_data['CapitalName']
 
     return json.dumps(capitale_data), capital_name
 
-@app.callback(
-    Output('mapmonde', 'figure'),
-    [
-        Input('capitale', 'data'),
-        Input('interval-component-300s', 'n_intervals'),
-        Input('layers-dropdown', 'value')
-    ],
-    State('mapmonde', 'figure')
-)
+def get_overlay_url(selected_layer: str):
+    """URL versionnée de la couche interpolée localement, None si la couche météo vient des tuiles OpenWeather"""
+
+    if map_weather_layer != "overlay":
+        return None
+
+    return "{}?v={}".format(overlay_url.format(selected_layer), get_overlay_version(selected_layer))
+
 def update_map(capitale_data, _, selected_layer, fig_json):
     """Mise à jour de la carte : coloration de la ville cliquée, et mise à jour de la couche météo selon les choix de l'utilisateur et un compteur d'intervalles"""
 
@@ -84,14 +180,80 @@ def update_map(capitale_data, _, selected_layer, fig_json):
     color_capital_map(
         fig,
         capitale_data['CapitalName'],
-        capitals,
+        capital_index,
         marker_color=scatter_mapbox_marker_color,
         marker_color_selected=scatter_mapbox_marker_color_selected
     )
-    load_tile_map(fig, selected_layer, weather_tile_api_base_url, api_key)
+    load_tile_map(fig, selected_layer, map_weather_tile_base_url, api_key, map_basemap_tile_url, get_overlay_url(selected_layer))
 
     return fig
 
+# Index des capitales par cellule de grille pour le mode niveau de détail
+capital_lod = LevelOfDetail(
+    capital_index.latitudes,
+    capital_index.longitudes,
+    map_lod_cell_size,
+    map_lod_max_markers,
+    map_lod_cluster_radius
+)
+
+def create_lod_figure(capital_name, selected_layer, relayout_data):
+    """Carte à niveau de détail pour une vue : seuls les points de la vue, regroupés s'ils sont trop nombreux"""
+
+    zoom, bounds = get_viewport(relayout_data, 1, map_lod_viewport_margin)
+    positions, clusters = capital_lod.select(bounds, zoom)
+
+    return create_lod_map(
+        get_lod_map_template(
+            selected_layer,
+            map_weather_tile_base_url,
+            api_key,
+            scatter_mapbox_marker_color,
+            map_basemap_tile_url,
+            get_overlay_url(selected_layer)
+        ),
+        capital_index,
+        positions,
+        clusters,
+        capital_name,
+        marker_color=scatter_mapbox_marker_color,
+        marker_color_selected=scatter_mapbox_marker_color_selected
+    )
+
+def update_map_lod(capitale_data, _, selected_layer, relayout_data):
+    """Mise à jour de la carte à niveau de détail selon la vue actuelle, la ville cliquée et la couche météo"""
+
+    # Événements de la carte sans changement de vue (redimensionnement, etc.) : marqueurs inchangés
+    triggered = [trigger['prop_id'] for trigger in dash.callback_context.triggered]
+    if triggered == ['mapmonde.relayoutData'] and 'mapbox._derived' not in (relayout_data or {}):
+        raise PreventUpdate
+
+    capital_name = json.loads(capitale_data)['CapitalName'] if capitale_data else None
+
+    return create_lod_figure(capital_name, selected_layer, relayout_data)
+
+update_map_inputs = [
+    Input('capitale', 'data'),
+    layer_trigger,
+    Input('layers-dropdown', 'value')
+]
+if map_update_mode == "lod":
+    # Marqueurs recalculés sur le serveur à chaque déplacement ou zoom de la carte
+    app.callback(Output('mapmonde', 'figure'), update_map_inputs + [Input('mapmonde', 'relayoutData')])(update_map_lod)
+elif map_update_mode == "clientside":
+    # Mise à jour de la carte dans le navigateur (assets/map.js) : la figure ne transite pas par le serveur
+    app.clientside_callback(
+        ClientsideFunction(namespace="map", function_name="update_map"),
+        Output('mapmonde', 'figure'),
+        update_map_inputs,
+        [
+            State('mapmonde', 'figure'),
+            State('map-settings', 'data')
+        ]
+    )
+else:
+    app.callback(Output('mapmonde', 'figure'), update_map_inputs, State('mapmonde', 'figure'))(update_map)
+
 @app.callback(
     Output('indicateur','figure'),
     Input('current','data')
@@ -99,8 +261,13 @@ def update_map(capitale_data, _, selected_layer, fig_json):
 def indicateur(current):
     """Mise à jour des indicateurs pour les données courantes"""
 
-    # Construction de la série correspondant aux données actuelles
-    series_current = pd.Series(json.loads(current, object_hook=json_util.object_hook))
+    return get_cached_figure(('indicateur', current), build_indicateur, current)
+
+def build_indicateur(current):
+    """Construction des indicateurs"""
+
+    # Série des données actuelles, conservée sur le serveur
+    series_current, _ = get_results(current)
 
     return create_indicateur(series_current)
 
@@ -114,9 +281,14 @@ def indicateur(current):
 def serie_temp(hourly, variable_selected):
     """Mise à jour du graphique des prévisions pour la variable sélectionnée"""
 
-    # Construction du DataFrame correspondant aux prévisions
-    hourly_df = pd.DataFrame(json.loads(hourly, object_hook=json_util.object_hook))
-    hourly_df.loc[:,'dt'] = pd.to_datetime(hourly_df['dt'])
+    return get_cached_figure(('serie_temp', hourly, variable_selected), build_serie_temp, hourly, variable_selected)
+
+def build_serie_temp(hourly, variable_selected):
+    """Construction du graphique des prévisions"""
+
+    # DataFrame des prévisions, conservé sur le serveur
+    _, hourly_df = get_results(hourly)
+    hourly_df = to_display_frame(hourly_df)
 
     # Noms de la variable sélectionnée
     variable_label = {v: k for k, v in variables.items()}[variable_selected]
@@ -130,10 +302,15 @@ def serie_temp(hourly, variable_selected):
 def tab(hourly):
     """Mise à jour du tableau des prévisions"""
 
-    # Construction du DataFrame correspondant aux prévisions
-    hourly_df = pd.DataFrame(json.loads(hourly, object_hook=json_util.object_hook))
+    return get_cached_figure(('tab', hourly), build_tab, hourly)
+
+def build_tab(hourly):
+    """Construction du tableau des prévisions"""
+
+    # DataFrame des prévisions, conservé sur le serveur (copié avant mise en forme)
+    _, hourly_df = get_results(hourly)
+    hourly_df = to_display_frame(hourly_df)
     # Mise en forme des dates au format français
-    hourly_df.loc[:,'dt'] = pd.to_datetime(hourly_df['dt'])
-    hourly_df.loc[:,'dt'] = hourly_df['dt'].apply(lambda d: format_datetime(d, "EEE H", locale="fr")) + "h"
+    hourly_df['dt'] = format_datetime_labels(hourly_df['dt'])
 
     return create_table(hourly_df, datetime_label, variables)
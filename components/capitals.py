@@ -2,11 +2,80 @@
 
 import os
 
+import numpy as np
 import pandas as pd
 
+from .startup import load_or_build
+
 
 # Emplacement du répertoire racine du projet
 root_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
 
+
+def to_unit_vectors(latitudes: np.ndarray, longitudes: np.ndarray):
+    """Coordonnées cartésiennes sur la sphère unité : la distance euclidienne y varie comme la distance orthodromique"""
+
+    lat, lon = np.radians(latitudes), np.radians(longitudes)
+
+    return np.column_stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
+
+
+class CapitalIndex:
+    """Index des capitales construit une fois au chargement : accès par nom en temps constant et recherche de la plus proche"""
+
+    def __init__(self, capitals_df: pd.DataFrame):
+        self.names = capitals_df['CapitalName'].to_numpy()
+        self.latitudes = np.ascontiguousarray(capitals_df['CapitalLatitude'], dtype='float64')
+        self.longitudes = np.ascontiguousarray(capitals_df['CapitalLongitude'], dtype='float64')
+        self.records = capitals_df.to_dict('records')
+        # Informations affichées au survol des points de la carte
+        self.hover_data = capitals_df[['CapitalName', 'CountryName', 'ContinentName']].to_numpy()
+
+        # Position de chaque nom dans le tableau (première occurrence pour les homonymes)
+        self.positions = {}
+        for position, name in enumerate(self.names):
+            self.positions.setdefault(name, position)
+
+        self._tree = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def get_position(self, capital_name: str):
+        """Position de la capitale dans le tableau des capitales"""
+
+        return self.positions[capital_name]
+
+    def get_record(self, capital_name: str):
+        """Copie de la ligne de la capitale sous forme de dictionnaire"""
+
+        return dict(self.records[self.positions[capital_name]])
+
+    @property
+    def tree(self):
+        """Arbre k-d des capitales, construit au premier usage (scipy n'est importé qu'à ce moment)"""
+
+        if self._tree is None:
+            from scipy.spatial import cKDTree
+            self._tree = cKDTree(to_unit_vectors(self.latitudes, self.longitudes))
+
+        return self._tree
+
+    def nearest(self, lat: float, lon: float, k: int=1):
+        """Position(s) de la ou des k capitales les plus proches d'un point"""
+
+        _, positions = self.tree.query(to_unit_vectors(np.atleast_1d(lat), np.atleast_1d(lon))[0], k=k)
+
+        return positions
+
+
 # Ressource : liste des capitales mondiales avec leurs coordonnées
-capitals = pd.read_csv(os.path.join(root_dir, "data", "concap.csv")).dropna().reset_index(drop=True)
+def read_capitals():
+    """Lecture du fichier des capitales"""
+
+    return pd.read_csv(os.path.join(root_dir, "data", "concap.csv")).dropna().reset_index(drop=True)
+
+capitals = load_or_build("capitals", read_capitals)
+
+# Index des capitales, partagé par les callbacks et les figures
+capital_index = CapitalIndex(capitals)
@@ -21,12 +21,21 @@ def generate_dropdown(options: dict[str, str], init_value: str, identifier: str,
         id=identifier
     )
 
-def generate_layout(layers: dict[str, str]={}, variables: dict[str, str]={}, init_layer: str="", init_variable: str="", variables_quanti: list[str]=[], init_map: go.Figure=go.Figure()):
-    """Construction de la mise en page du tableau de bord"""
+def generate_layout(layers: dict[str, str]={}, variables: dict[str, str]={}, init_layer: str="", init_variable: str="", variables_quanti: list[str]=[], init_map: go.Figure=go.Figure(), map_settings: dict[str, str]={}, push_settings: Optional[dict[str, str]]=None):
+    """Construction de la mise en page du tableau de bord (avec push_settings, mises à jour poussées par le serveur
+    au lieu des compteurs d'intervalles)"""
 
     dropdown_layers = generate_dropdown(layers, init_layer, "layers-dropdown")
     dropdown_variables = generate_dropdown(variables, init_variable, "variables-prevision-dropdown", options_filter=variables_quanti)
 
+    # Mises à jour poussées : adresse des messages, et champs cachés recevant les messages (assets/push.js)
+    push_components = [] if push_settings is None else [
+        dcc.Store(id='push-settings', data=push_settings),
+        dcc.Store(id='push-subscription'),
+        dcc.Input(id='push-weather', type="text", style={'display': "none"}),
+        dcc.Input(id='push-layer', type="text", style={'display': "none"})
+    ]
+
     layout = html.Div([
         html.Div([
             html.Div([
@@ -181,25 +190,30 @@ def generate_layout(layers: dict[str, str]={}, variables: dict[str, str]={}, ini
             dcc.Interval(
                 id='interval-component-300s',
                 interval=300 * 1000,
-                n_intervals=0
+                n_intervals=0,
+                disabled=push_settings is not None
             ),
 
             # Compteur d'intervalles 120s
             dcc.Interval(
                 id='interval-component-120s',
                 interval=120 * 1000,
-                n_intervals=0
+                n_intervals=0,
+                disabled=push_settings is not None
             ),
             
+            # Zone de stockage des paramètres de mise à jour de la carte dans le navigateur (URL des tuiles, couleurs)
+            dcc.Store(id='map-settings', data=map_settings),
+
             # Zone de stockage du texte JSON sur la capitale sélectionnée
             dcc.Store(id='capitale'),
             
-            # Zone de stockage du texte JSON sur les données actuelles de la capitale sélectionnée
+            # Zone de stockage du jeton désignant les données actuelles de la capitale sélectionnée (conservées sur le serveur)
             dcc.Store(id='current'),
             
-            # Zone de stockage du texte JSON sur les données prévisionnelles de la capitale sélectionnée
+            # Zone de stockage du jeton désignant les données prévisionnelles de la capitale sélectionnée (conservées sur le serveur)
             dcc.Store(id='hourly')
-        ], className='row')
+        ] + push_components, className='row')
     ], className="container-fluid")
 
     return layout
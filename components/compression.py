@@ -0,0 +1,185 @@
+# coding: utf-8
+
+import functools
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+from typing import Callable
+
+import brotli
+import flask
+
+from . import metrics
+from .config import compression_algorithms, compression_min_size, compression_gzip_level, compression_br_level, \
+    compression_static_max_age
+
+
+# Types MIME des réponses compressées (les images PNG et JPEG le sont déjà)
+COMPRESSIBLE_MIMETYPES = {
+    "application/json",
+    "application/javascript",
+    "text/javascript",
+    "text/css",
+    "text/html",
+    "text/plain",
+    "image/svg+xml"
+}
+
+# Corps compressés des réponses statiques (assets, composants Dash, mise en page), par chemin :
+# version (date de modification ou ETag) et corps par algorithme
+precompressed = {}
+_precompressed_lock = threading.Lock()
+
+# Mise en page sérialisée une seule fois (si elle n'est pas une fonction) : ETag et corps
+_layout = {}
+
+
+def encode(body: bytes, algorithm: str):
+    """Compression d'un corps de réponse"""
+
+    if algorithm == "br":
+        return brotli.compress(body, quality=compression_br_level)
+
+    return gzip.compress(body, compresslevel=compression_gzip_level)
+
+def choose_algorithm(accept_encoding: str):
+    """Premier algorithme de la configuration accepté par le navigateur (en-tête Accept-Encoding), None sinon"""
+
+    accepted = set()
+    for item in accept_encoding.split(","):
+        name, _, parameters = item.partition(";")
+        try:
+            quality = float(parameters.strip()[2:]) if parameters.strip().startswith("q=") else 1.0
+        except ValueError:
+            quality = 0.0
+        if quality > 0:
+            accepted.add(name.strip().lower())
+    for algorithm in compression_algorithms:
+        if algorithm in accepted or "*" in accepted:
+            return algorithm
+
+    return None
+
+def is_compressible(filename: str):
+    """Fichier dont le type MIME se prête à la compression"""
+
+    return mimetypes.guess_type(filename)[0] in COMPRESSIBLE_MIMETYPES
+
+def get_encoded(path: str, version, read: Callable[[], bytes], algorithm: str):
+    """Corps compressé d'une réponse statique, compressé une seule fois par version et par algorithme"""
+
+    with _precompressed_lock:
+        entry = precompressed.get(path)
+        if entry is None or entry[0] != version:
+            entry = precompressed[path] = (version, {})
+        encoded = entry[1].get(algorithm)
+    if encoded is None:
+        encoded = encode(read(), algorithm)
+        with _precompressed_lock:
+            entry[1][algorithm] = encoded
+
+    return encoded
+
+def get_route(app, endpoint: str):
+    """Type de route d'une requête, pour les mesures et la réutilisation des corps compressés"""
+
+    prefix = app.config.routes_pathname_prefix
+    if endpoint == prefix + "_dash-update-component":
+        return "callback"
+    if endpoint == prefix + "_dash-layout":
+        return "layout"
+    if endpoint and endpoint.startswith(prefix + "_dash-component-suites"):
+        return "component_suites"
+    if endpoint and endpoint.endswith("dash_assets.static"):
+        return "assets"
+
+    return "other"
+
+def precompress_assets(app):
+    """Compression au démarrage des fichiers compressibles du dossier des assets, pour chaque algorithme"""
+
+    url_prefix = "{}{}/".format(app.config.routes_pathname_prefix, app.config.assets_url_path.strip("/"))
+    for directory, _, filenames in os.walk(app.config.assets_folder):
+        for filename in filter(is_compressible, filenames):
+            path = os.path.join(directory, filename)
+            if os.path.getsize(path) < compression_min_size:
+                continue
+            with open(path, "rb") as asset_file:
+                body = asset_file.read()
+            url_path = url_prefix + os.path.relpath(path, app.config.assets_folder).replace(os.sep, "/")
+            for algorithm in compression_algorithms:
+                get_encoded(url_path, os.path.getmtime(path), lambda: body, algorithm)
+
+def serve_layout(app, view):
+    """Route de la mise en page : sérialisée une seule fois, avec un ETag permettant au navigateur de la revalider
+    (réponse 304 sans corps si elle n'a pas changé)"""
+
+    entry = _layout.get('entry')
+    if entry is None or callable(app.layout):
+        body = view().get_data()
+        entry = (hashlib.sha1(body).hexdigest(), body)
+        if not callable(app.layout):
+            _layout['entry'] = entry
+    etag, body = entry
+
+    response = flask.Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+
+    return response.make_conditional(flask.request)
+
+def compress_response(app, response: flask.Response):
+    """Mise en cache des assets versionnés, et compression des réponses selon l'en-tête Accept-Encoding (corps
+    statiques compressés une seule fois), avec mesure des octets économisés"""
+
+    request = flask.request
+    route = get_route(app, request.endpoint)
+    if route == "assets" and response.status_code in (200, 304):
+        # Fichiers versionnés par Dash (?m=date de modification) : gardés en cache par le navigateur
+        response.cache_control.public = True
+        if "m" in request.args:
+            response.cache_control.no_cache = None
+            response.cache_control.max_age = compression_static_max_age
+        else:
+            response.cache_control.no_cache = True
+
+    # Réponses vides, non compressibles, déjà compressées, ou diffusées au fil de l'eau (Server-Sent Events)
+    if response.status_code != 200 or response.mimetype not in COMPRESSIBLE_MIMETYPES \
+            or "Content-Encoding" in response.headers or (response.is_streamed and route != "assets"):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    response.direct_passthrough = False
+    body = response.get_data()
+    algorithm = choose_algorithm(request.headers.get("Accept-Encoding", ""))
+    if algorithm is None or len(body) < compression_min_size:
+        metrics.observe_compression(route, len(body), len(body))
+        return response
+
+    if route == "assets":
+        version = os.path.getmtime(os.path.join(app.config.assets_folder, *request.view_args['filename'].split("/")))
+        encoded = get_encoded(request.path, version, lambda: body, algorithm)
+    elif route in ("layout", "component_suites"):
+        encoded = get_encoded(request.path, response.get_etag()[0], lambda: body, algorithm)
+    else:
+        encoded = encode(body, algorithm)
+
+    response.set_data(encoded)
+    response.headers['Content-Encoding'] = algorithm
+    # Corps différent selon l'encodage : ETag faible, toujours accepté par la comparaison de If-None-Match
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    metrics.observe_compression(route, len(body), len(encoded))
+
+    return response
+
+def register(app):
+    """Compression des réponses du serveur, mise en page servie avec un ETag, et assets compressés au démarrage"""
+
+    layout_endpoint = app.config.routes_pathname_prefix + "_dash-layout"
+    app.server.view_functions[layout_endpoint] = functools.partial(serve_layout, app, app.server.view_functions[layout_endpoint])
+    precompress_assets(app)
+    app.server.after_request(functools.partial(compress_response, app))
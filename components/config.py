@@ -22,3 +22,94 @@ variables_quanti = config['variables_quanti']['variables_quanti'].strip().split(
 init_variable = config['init_variable']['init_variable']
 scatter_mapbox_marker_color = config['scatter_mapbox_style']['marker_color']
 scatter_mapbox_marker_color_selected = config['scatter_mapbox_style']['marker_color_selected']
+cache_ttl = config['cache'].getfloat('ttl')
+cache_maxsize = config['cache'].getint('maxsize')
+cache_stale_ttl = config['cache'].getfloat('stale_ttl')
+cache_coordinates_precision = config['cache'].getint('coordinates_precision')
+cache_backend = config['cache']['backend']
+cache_shared_path = config['cache']['shared_path']
+cache_lease_timeout = config['cache'].getfloat('lease_timeout')
+cache_poll_interval = config['cache'].getfloat('poll_interval')
+http_pool_connections = config['http'].getint('pool_connections')
+http_pool_maxsize = config['http'].getint('pool_maxsize')
+http_connect_timeout = config['http'].getfloat('connect_timeout')
+http_read_timeout = config['http'].getfloat('read_timeout')
+http_max_concurrency = config['http'].getint('max_concurrency')
+http_max_retries = config['http'].getint('max_retries')
+http_backoff_factor = config['http'].getfloat('backoff_factor')
+http_backoff_max = config['http'].getfloat('backoff_max')
+refresher_enabled = config['refresher'].getboolean('enabled')
+refresher_requests_per_minute = config['refresher'].getfloat('requests_per_minute')
+refresher_min_interval = config['refresher'].getfloat('min_interval')
+store_ttl = config['store'].getfloat('ttl')
+store_maxsize = config['store'].getint('maxsize')
+map_update_mode = config['map']['update_mode']
+map_lod_cell_size = config['map'].getfloat('lod_cell_size')
+map_lod_max_markers = config['map'].getint('lod_max_markers')
+map_lod_cluster_radius = config['map'].getfloat('lod_cluster_radius')
+map_lod_viewport_margin = config['map'].getfloat('lod_viewport_margin')
+map_weather_layer = config['map']['weather_layer']
+overlay_url = config['overlay']['url']
+overlay_width = config['overlay'].getint('width')
+overlay_height = config['overlay'].getint('height')
+overlay_power = config['overlay'].getfloat('power')
+overlay_colorscale = config['overlay']['colorscale']
+overlay_opacity = config['overlay'].getfloat('opacity')
+overlay_fields = dict(config['overlay_fields'])
+payload_projection = config['payload'].getboolean('projection')
+payload_fields = config['payload']['fields'].strip().split(sep="\n")
+rankings_enabled = config['rankings'].getboolean('enabled')
+rankings_path = config['rankings']['path']
+rankings_hours = config['rankings'].getint('hours')
+rankings_max_n = config['rankings'].getint('max_n')
+push_mode = config['push']['mode']
+push_path = config['push']['path']
+push_refresh_interval = config['push'].getfloat('refresh_interval')
+push_layer_interval = config['push'].getfloat('layer_interval')
+push_keepalive = config['push'].getfloat('keepalive')
+tiles_proxy_enabled = config['tiles'].getboolean('proxy_enabled')
+tiles_proxy_base_url = config['tiles']['proxy_base_url']
+tiles_basemap_tile_url = config['tiles']['basemap_tile_url']
+tiles_cache_dir = config['tiles']['cache_dir']
+tiles_memory_maxsize = config['tiles'].getint('memory_maxsize')
+tiles_disk_maxsize = config['tiles'].getint('disk_maxsize')
+tiles_weather_ttl = config['tiles'].getfloat('weather_ttl')
+tiles_basemap_ttl = config['tiles'].getfloat('basemap_ttl')
+
+# URL des tuiles données au navigateur : proxy local (sans clé API, chemin complété par l'adresse de la page dans le
+# navigateur) s'il est activé, serveurs d'origine sinon
+if tiles_proxy_enabled:
+    map_weather_tile_base_url = tiles_proxy_base_url
+    map_basemap_tile_url = tiles_proxy_base_url.format("basemap", "{z}", "{x}", "{y}")
+else:
+    map_weather_tile_base_url = weather_tile_api_base_url
+    map_basemap_tile_url = tiles_basemap_tile_url
+governor_enabled = config['governor'].getboolean('enabled')
+governor_per_minute = config['governor'].getfloat('per_minute')
+governor_per_month = config['governor'].getint('per_month')
+governor_interactive_reserve = config['governor'].getfloat('interactive_reserve')
+governor_max_wait = config['governor'].getfloat('max_wait')
+governor_state_path = config['governor']['state_path']
+governor_flush_interval = config['governor'].getfloat('flush_interval')
+governor_status_path = config['governor']['status_path']
+history_enabled = config['history'].getboolean('enabled')
+history_path = config['history']['path']
+history_flush_interval = config['history'].getfloat('flush_interval')
+history_retention_days = config['history'].getfloat('retention_days')
+compression_enabled = config['compression'].getboolean('enabled')
+compression_algorithms = [algorithm.strip() for algorithm in config['compression']['algorithms'].split(",")]
+compression_min_size = config['compression'].getint('min_size')
+compression_gzip_level = config['compression'].getint('gzip_level')
+compression_br_level = config['compression'].getint('br_level')
+compression_static_max_age = config['compression'].getint('static_max_age')
+profiling_env_var = config['profiling']['env_var']
+profiling_header = config['profiling']['header']
+profiling_token = config['profiling']['token']
+profiling_output_dir = config['profiling']['output_dir']
+profiling_max_entries = config['profiling'].getint('max_entries')
+profiling_window = config['profiling'].getfloat('window')
+profiling_path = config['profiling']['path']
+metrics_enabled = config['metrics'].getboolean('enabled')
+metrics_path = config['metrics']['path']
+startup_artifacts_enabled = config['startup'].getboolean('artifacts_enabled')
+startup_artifacts_dir = config['startup']['artifacts_dir']
@@ -1,25 +1,65 @@
 # coding: utf-8
 
+import functools
+from typing import Optional
+
+import numpy as np
 import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
 
+from .capitals import CapitalIndex
+from .overlay import get_image_coordinates
+
+
+# Tuiles du fond de carte USGS Topo
+USGS_TOPO_TILE_URL = "https://basemap.nationalmap.gov/arcgis/rest/services/USGSTopo/MapServer/tile/{z}/{y}/{x}"
+
+# Infobulle des points de la carte (nom, pays et continent dans customdata)
+CAPITAL_HOVERTEMPLATE = """
+        <b>%{customdata[0]}</b>
+        <br />
+        <i>Country:</i> %{customdata[1]}
+        <br />
+        <i>Continent:</i> %{customdata[2]}
+    """
+
 
-def color_capital_map(fig: go.Figure, selected_capital_name: dict[str, str], capitals_df: pd.DataFrame, marker_color: str="blue", marker_color_selected: str="red"):
+def color_capital_map(fig: go.Figure, selected_capital_name: str, capital_index: CapitalIndex, marker_color: str="blue", marker_color_selected: str="red"):
     """Colorie les points de la carte en différenciant celui correspondant à la capitale sélectionnée"""
 
-    colors = [marker_color] * capitals_df.shape[0]
-    capital_names = capitals_df.set_index('CapitalName').index
-    clicked_capital_idx = capital_names.get_loc(selected_capital_name)
-    colors[clicked_capital_idx] = marker_color_selected
+    colors = np.full(len(capital_index), marker_color, dtype=object)
+    colors[capital_index.names == selected_capital_name] = marker_color_selected
     fig.update_traces(overwrite=True, marker={"color": colors})
 
     return fig
 
-def load_tile_map(fig: go.Figure, selected_layer: str, weather_tile_api_base_url:str, api_key:str):
+def get_weather_tile_url(selected_layer: str, weather_tile_api_base_url: str, api_key: str):
+    """URL des tuiles de la couche météo, avec les paramètres {z}, {x} et {y} laissés à remplir par la carte"""
+
+    return weather_tile_api_base_url.format(selected_layer, "{z}", "{x}", "{y}", api_key)
+
+def get_weather_layer(selected_layer: str, weather_tile_api_base_url: str, api_key: str, overlay_url: Optional[str]=None):
+    """Couche météo de la carte : tuiles OpenWeather, ou image interpolée localement si son URL est donnée"""
+
+    if overlay_url is not None:
+        return {
+            "below": "traces",
+            "sourcetype": "image",
+            "sourceattribution": "OpenWeather",
+            "source": overlay_url,
+            "coordinates": get_image_coordinates()
+        }
+
+    return {
+        "below": "traces",
+        "sourcetype": "raster",
+        "sourceattribution": "OpenWeather",
+        "source": [get_weather_tile_url(selected_layer, weather_tile_api_base_url, api_key)]
+    }
+
+def load_tile_map(fig: go.Figure, selected_layer: str, weather_tile_api_base_url:str, api_key:str, basemap_tile_url: str=USGS_TOPO_TILE_URL, overlay_url: Optional[str]=None):
     """Charge les couches cartographiques de la carte, en fonction de l'information demandée par l'utilisateur"""
 
-    weather_tile_url = weather_tile_api_base_url.format(selected_layer, "{z}", "{x}", "{y}", api_key)
     fig.update_layout(
         mapbox_style="white-bg",
         mapbox_layers=[
@@ -27,24 +67,20 @@ def load_tile_map(fig: go.Figure, selected_layer: str, weather_tile_api_base_url
                 "below": "traces",
                 "sourcetype": "raster",
                 "sourceattribution": "ESRI",
-                "source": [
-                    "https://basemap.nationalmap.gov/arcgis/rest/services/USGSTopo/MapServer/tile/{z}/{y}/{x}"
-                ]
+                "source": [basemap_tile_url]
             },
-            {
-                "below": "traces",
-                "sourcetype": "raster",
-                "sourceattribution": "OpenWeather",
-                "source": [weather_tile_url]
-            }
+            get_weather_layer(selected_layer, weather_tile_api_base_url, api_key, overlay_url)
         ]
     )
 
     return fig
 
-def create_map(capitals_df: pd.DataFrame, selected_layer: str, weather_tile_api_base_url:str, api_key:str, scatter_mapbox_marker_color: str="blue"):
+def create_map(capitals_df: pd.DataFrame, selected_layer: str, weather_tile_api_base_url:str, api_key:str, scatter_mapbox_marker_color: str="blue", basemap_tile_url: str=USGS_TOPO_TILE_URL, overlay_url: Optional[str]=None):
     """Création de la carte : couche ESRI, couche météo et points correspondants aux villes"""
 
+    # Import différé : plotly.express n'est utile qu'à la construction de la carte initiale
+    import plotly.express as px
+
     fig = px.scatter_mapbox(
         capitals_df,
         lat="CapitalLatitude",
@@ -61,28 +97,31 @@ def create_map(capitals_df: pd.DataFrame, selected_layer: str, weather_tile_api_
         zoom=1,
         height=600
     )
-    fig.update_traces(hovertemplate="""
-        <b>%{customdata[0]}</b>
-        <br />
-        <i>Country:</i> %{customdata[1]}
-        <br />
-        <i>Continent:</i> %{customdata[2]}
-    """)
-    load_tile_map(fig, selected_layer, weather_tile_api_base_url, api_key)
+    fig.update_traces(hovertemplate=CAPITAL_HOVERTEMPLATE)
+    load_tile_map(fig, selected_layer, weather_tile_api_base_url, api_key, basemap_tile_url, overlay_url)
     # possibilité d'utiliser USGSImageryTopo
     fig.update_layout(margin={"r": 0, "t": 0, "l": 0, "b": 0})
 
     return fig
 
-def create_indicateur(current: pd.Series):
-    """Création des visuels de la section des indicateurs"""
+def from_template(template: dict, trace_updates: list[dict]):
+    """Figure obtenue à partir d'un modèle : seules les traces sont copiées pour y placer les données,
+    la mise en page (déjà validée) est partagée et ne doit pas être modifiée"""
+
+    return {
+        'data': [dict(trace, **updates) for trace, updates in zip(template['data'], trace_updates)],
+        'layout': template['layout']
+    }
+
+@functools.lru_cache()
+def get_indicateur_template():
+    """Modèle de la section des indicateurs, construit et validé une seule fois"""
 
     fig = go.Figure()
 
     # Jauge de température
     fig.add_trace(go.Indicator(
         mode="gauge+number",
-        value=current['humidity'],
         number={'suffix': " %"},
         title={'text': "Humidité"},
         gauge={'axis': {'range': [None, 100]}},
@@ -92,7 +131,6 @@ def create_indicateur(current: pd.Series):
     # Chiffre de la température mesurée
     fig.add_trace(go.Indicator(
         mode="number+delta",
-        value=current['temp'],
         title={'text': "Température mesurée"},
         number={'suffix': " °C"},
         domain={'row': 1, 'column': 0})
@@ -101,7 +139,6 @@ def create_indicateur(current: pd.Series):
     # Chiffre de la vitesse du vent
     fig.add_trace(go.Indicator(
         mode="number+delta",
-        value=current['wind_speed'],
         number={'suffix': " km/h"},
         title={'text': "Vitesse du vent"},
         domain={'row': 0, 'column': 1})
@@ -110,7 +147,6 @@ def create_indicateur(current: pd.Series):
     # Chiffre de la température ressentie
     fig.add_trace(go.Indicator(
         mode="number+delta",
-        value=current['feels_like'],
         title={'text': "Température ressentie"},
         number={'suffix': " °C"},
         domain={'row': 1, 'column': 1})
@@ -134,16 +170,23 @@ def create_indicateur(current: pd.Series):
     fig.update_xaxes(showgrid=False, zeroline=False, visible=False)
     fig.update_yaxes(showgrid=False, zeroline=False, visible=False)
 
-    return fig
+    return fig.to_plotly_json()
 
-def create_serie_temp(df: pd.DataFrame, variable_name: str, variable_label: str):
-    """Création du graphique contenant la courbe des prévisions pour la variable sélectionnée"""
+# Variables affichées par les indicateurs, dans l'ordre des traces du modèle
+INDICATEUR_VARIABLES = ['humidity', 'temp', 'wind_speed', 'feels_like']
+
+def create_indicateur(current: pd.Series):
+    """Création des visuels de la section des indicateurs"""
+
+    return from_template(get_indicateur_template(), [{'value': current[variable]} for variable in INDICATEUR_VARIABLES])
+
+@functools.lru_cache()
+def get_serie_temp_template(variable_label: str):
+    """Modèle du graphique des prévisions pour une variable, construit et validé une seule fois par variable"""
 
     fig = go.Figure()
     fig.add_trace(
         go.Scatter(
-            x=df["dt"],
-            y=df[variable_name],
             hovertemplate="""
                 <i>Date et heure :</i> %{}
                 <br />
@@ -160,23 +203,28 @@ def create_serie_temp(df: pd.DataFrame, variable_name: str, variable_label: str)
     fig.update_xaxes(title_text="Date et heure")
     fig.update_yaxes(title_text=variable_label)
 
-    return fig
+    return fig.to_plotly_json()
 
-def create_table(df: pd.DataFrame, datetime_label: str, variables_dic: dict[str, str]):
-    """Création du tableau des prévisions"""
+def create_serie_temp(df: pd.DataFrame, variable_name: str, variable_label: str):
+    """Création du graphique contenant la courbe des prévisions pour la variable sélectionnée"""
+
+    return from_template(get_serie_temp_template(variable_label), [{'x': df["dt"], 'y': df[variable_name].to_numpy()}])
+
+@functools.lru_cache()
+def get_table_template(header: tuple[str]):
+    """Modèle du tableau des prévisions pour des en-têtes donnés, construit et validé une seule fois"""
 
     fig = go.Figure(
         data=[
             go.Table(
                 header=dict(
-                    values=[datetime_label] + list(variables_dic.keys()),
+                    values=list(header),
                     font=dict(size=14),
                     line_color='darkslategray',
                     fill_color='paleturquoise',
                     align="left"
                 ),
                 cells=dict(
-                    values=[df[var].tolist() for var in ["dt"] + list(variables_dic.values())],
                     line_color='darkslategray',
                     fill_color='lavender',
                     align="left"
@@ -189,4 +237,60 @@ def create_table(df: pd.DataFrame, datetime_label: str, variables_dic: dict[str,
         margin=dict(l=0, r=0, t=0, b=0)
     )
 
-    return fig
+    return fig.to_plotly_json()
+
+def create_table(df: pd.DataFrame, datetime_label: str, variables_dic: dict[str, str]):
+    """Création du tableau des prévisions"""
+
+    template = get_table_template((datetime_label, *variables_dic.keys()))
+    cells = dict(template['data'][0]['cells'], values=[df[var].to_numpy() for var in ["dt"] + list(variables_dic.values())])
+
+    return from_template(template, [{'cells': cells}])
+
+@functools.lru_cache()
+def get_lod_map_template(selected_layer: str, weather_tile_api_base_url: str, api_key: str, scatter_mapbox_marker_color: str="blue", basemap_tile_url: str=USGS_TOPO_TILE_URL, overlay_url: Optional[str]=None):
+    """Modèle de la carte à niveau de détail : trace des villes, trace des groupes de villes et couches cartographiques"""
+
+    fig = go.Figure([
+        go.Scattermapbox(mode="markers", hovertemplate=CAPITAL_HOVERTEMPLATE, name=""),
+        go.Scattermapbox(
+            mode="markers",
+            marker={'color': scatter_mapbox_marker_color, 'opacity': 0.5},
+            hovertemplate="<b>%{customdata} villes</b><extra></extra>",
+            name=""
+        )
+    ])
+    load_tile_map(fig, selected_layer, weather_tile_api_base_url, api_key, basemap_tile_url, overlay_url)
+    fig.update_layout(
+        mapbox={'zoom': 1, 'center': {'lat': 20, 'lon': 0}},
+        # Vue de la carte conservée par le navigateur lorsque le serveur renvoie de nouveaux marqueurs
+        uirevision="mapmonde",
+        showlegend=False,
+        height=600,
+        margin={"r": 0, "t": 0, "l": 0, "b": 0}
+    )
+
+    return fig.to_plotly_json()
+
+def create_lod_map(template: dict, capital_index: CapitalIndex, positions: np.ndarray, clusters: tuple[np.ndarray, np.ndarray, np.ndarray], selected_capital_name: str, marker_color: str="blue", marker_color_selected: str="red"):
+    """Carte à niveau de détail : villes de la vue affichées seules et groupes de villes, à partir du modèle"""
+
+    cluster_latitudes, cluster_longitudes, counts = clusters
+    colors = np.where(capital_index.names[positions] == selected_capital_name, marker_color_selected, marker_color)
+
+    return from_template(template, [
+        {
+            'lat': capital_index.latitudes[positions],
+            'lon': capital_index.longitudes[positions],
+            'hovertext': capital_index.names[positions],
+            'customdata': capital_index.hover_data[positions],
+            'marker': {'color': colors}
+        },
+        {
+            'lat': cluster_latitudes,
+            'lon': cluster_longitudes,
+            'customdata': counts,
+            # Taille des groupes croissant avec le logarithme du nombre de villes
+            'marker': dict(template['data'][1]['marker'], size=np.round(8 + 4 * np.log2(counts), 1))
+        }
+    ])
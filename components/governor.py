@@ -0,0 +1,316 @@
+# coding: utf-8
+
+import atexit
+import contextlib
+import contextvars
+import datetime as dt
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+import flask
+
+from . import metrics
+from .config import root_dir, governor_enabled, governor_per_minute, governor_per_month, governor_interactive_reserve, \
+    governor_max_wait, governor_state_path, governor_flush_interval
+
+
+logger = logging.getLogger(__name__)
+
+# Priorités des appels à OpenWeather
+INTERACTIVE = "interactive"
+TILES = "tiles"
+BACKGROUND = "background"
+
+# Compteur mensuel des appels et seau de jetons par minute (une seule ligne), partagés par les processus de la machine
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    month TEXT PRIMARY KEY,
+    used INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS bucket (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL,
+    blocked_until REAL NOT NULL
+);
+"""
+
+# Priorité fixée pour le contexte en cours (None : déduite de la présence d'une requête d'un navigateur)
+_priority = contextvars.ContextVar("priority", default=None)
+
+
+def get_priority():
+    """Priorité de l'appel en cours : fixée par priority() (tuiles), sinon interactive pendant le traitement d'une
+    requête d'un navigateur (callbacks), arrière-plan dans les autres threads (rafraîchissement, appels groupés)"""
+
+    value = _priority.get()
+    if value is not None:
+        return value
+
+    return INTERACTIVE if flask.has_request_context() else BACKGROUND
+
+@contextlib.contextmanager
+def priority(value: str):
+    """Priorité des appels à OpenWeather effectués dans le bloc"""
+
+    token = _priority.set(value)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+def get_month():
+    """Mois en cours (UTC), période du budget mensuel"""
+
+    return dt.datetime.utcnow().strftime("%Y-%m")
+
+
+class Governor:
+    """Budget des appels à OpenWeather, consulté avant chaque appel : seau de jetons par minute et compteur mensuel
+    partagés par les processus de la machine (base SQLite ; jeton pris sous le verrou d'écriture de la base, appels du
+    mois ajoutés par lots toutes les flush_interval secondes) ; une part de chaque budget est réservée aux appels
+    interactifs (clics), que ni les tuiles ni l'arrière-plan ne peuvent utiliser ; les appels interactifs et les
+    tuiles peuvent attendre un jeton jusqu'à max_wait secondes, les appels d'arrière-plan sont refusés immédiatement"""
+
+    def __init__(self, per_minute: float, per_month: int, interactive_reserve: float, max_wait: float, state_path: str, flush_interval: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+        self.per_month = per_month
+        self.interactive_reserve = interactive_reserve
+        self.max_wait = max_wait
+        self.state_path = os.path.join(root_dir, state_path)
+        self.flush_interval = flush_interval
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        with contextlib.closing(self._connect()) as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+        # Appels du mois de tous les processus (lus au dernier enregistrement, plus ceux de ce processus depuis),
+        # et appels de ce processus pas encore ajoutés au compteur partagé
+        self.month, self.month_used = self.load_state()
+        self.pending = 0
+        self.flushed = time.monotonic()
+        # Appels suspendus jusqu'à cet instant (time.monotonic) après une réponse 429 (seau propre au processus, utilisé
+        # si la base est indisponible)
+        self.blocked_until = 0.0
+        self.granted = Counter()
+        self.denied = Counter()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def _connect(self):
+        """Connexion à la base du budget (ouverte à chaque appel autorisé et à chaque enregistrement, peu fréquents)"""
+
+        connection = sqlite3.connect(self.state_path, timeout=5, isolation_level=None)
+        connection.execute("PRAGMA synchronous=NORMAL")
+
+        return connection
+
+    def load_state(self):
+        """Mois en cours et nombre d'appels du mois déjà enregistrés par les processus"""
+
+        month = get_month()
+        with contextlib.closing(self._connect()) as connection:
+            row = connection.execute("SELECT used FROM usage WHERE month = ?", (month,)).fetchone()
+
+        return month, row[0] if row else 0
+
+    def flush(self):
+        """Ajout au compteur partagé des appels de ce processus pas encore enregistrés (une seule écriture, incrément
+        fait par SQLite sous son verrou), et lecture du total de tous les processus"""
+
+        with self._flush_lock:
+            with self._lock:
+                month, pending = self.month, self.pending
+                self.pending = 0
+                self.flushed = time.monotonic()
+            try:
+                with contextlib.closing(self._connect()) as connection:
+                    connection.execute("BEGIN IMMEDIATE")
+                    connection.execute(
+                        "INSERT INTO usage (month, used) VALUES (?, ?) ON CONFLICT (month) DO UPDATE SET used = used + excluded.used",
+                        (month, pending)
+                    )
+                    used = connection.execute("SELECT used FROM usage WHERE month = ?", (month,)).fetchone()[0]
+                    connection.execute("COMMIT")
+            except sqlite3.Error:
+                # Base indisponible : appels gardés pour le prochain enregistrement
+                logger.exception("Échec de l'enregistrement du budget mensuel")
+                with self._lock:
+                    if self.month == month:
+                        self.pending += pending
+                return
+            with self._lock:
+                if self.month == month:
+                    self.month_used = used + self.pending
+
+    def take_shared_token(self, floor: float):
+        """Prise d'un jeton dans le seau partagé par les processus, s'il en reste au moins floor (lecture et mise à jour
+        sous le verrou d'écriture de la base) : renvoie 0 si le jeton est pris, sinon l'attente nécessaire en secondes"""
+
+        now = time.time()
+        with contextlib.closing(self._connect()) as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute("SELECT tokens, updated, blocked_until FROM bucket WHERE id = 0").fetchone()
+            tokens, updated, blocked_until = row if row is not None else (self.capacity, now, 0.0)
+            tokens = min(self.capacity, tokens + max(0.0, now - updated) * self.rate)
+            if now < blocked_until:
+                wait = blocked_until - now
+            elif tokens < floor:
+                wait = (floor - tokens) / self.rate
+            else:
+                wait = 0.0
+                tokens -= 1
+            connection.execute(
+                "INSERT OR REPLACE INTO bucket (id, tokens, updated, blocked_until) VALUES (0, ?, ?, ?)",
+                (tokens, now, blocked_until)
+            )
+            connection.execute("COMMIT")
+        with self._lock:
+            self.tokens = tokens
+
+        return wait
+
+    def take_local_token(self, now: float, floor: float):
+        """Prise d'un jeton dans le seau propre au processus (base indisponible) : renvoie 0 si le jeton est pris, sinon
+        l'attente nécessaire en secondes"""
+
+        with self._lock:
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            if self.tokens < floor:
+                return (floor - self.tokens) / self.rate
+            self.tokens -= 1
+
+        return 0.0
+
+    def refill(self, now: float):
+        """Ajout des jetons gagnés depuis la dernière mise à jour (seau propre au processus), et passage au mois suivant"""
+
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        month = get_month()
+        if month != self.month:
+            # Appels non enregistrés du mois écoulé abandonnés : seul le mois en cours compte
+            self.month, self.month_used, self.pending = month, 0, 0
+
+    def try_acquire(self, priority: str):
+        """Prise d'un jeton si le budget le permet : renvoie 0 si le jeton est pris, sinon l'attente nécessaire
+        en secondes (infinie si le budget mensuel est épuisé)"""
+
+        now = time.monotonic()
+        with self._lock:
+            self.refill(now)
+            # Les tuiles et les appels d'arrière-plan laissent intacte la part réservée aux appels interactifs
+            reserve = self.interactive_reserve if priority != INTERACTIVE else 0.0
+            if self.month_used >= self.per_month * (1 - reserve):
+                return float("inf")
+            floor = self.capacity * reserve + 1
+        try:
+            wait = self.take_shared_token(floor)
+        except sqlite3.Error:
+            logger.exception("Échec de la lecture du seau de jetons partagé")
+            wait = self.take_local_token(now, floor)
+        if wait > 0:
+            return wait
+        with self._lock:
+            self.month_used += 1
+            self.pending += 1
+            flush_due = now - self.flushed >= self.flush_interval
+        if flush_due:
+            self.flush()
+
+        return 0.0
+
+    def acquire(self, priority: str=None):
+        """Autorisation d'un appel : attente d'un jeton pour un appel interactif ou une tuile (au plus max_wait
+        secondes), refus immédiat pour un appel d'arrière-plan faute de jeton"""
+
+        priority = priority or get_priority()
+        deadline = time.monotonic() + (self.max_wait if priority != BACKGROUND else 0.0)
+        while True:
+            wait = self.try_acquire(priority)
+            if wait == 0:
+                self.granted[priority] += 1
+                return True
+            remaining = deadline - time.monotonic()
+            if wait > remaining:
+                self.denied[priority] += 1
+                metrics.governor_denied.labels(priority).inc()
+                return False
+            time.sleep(wait)
+
+    def on_rate_limited(self, delay: float):
+        """Réponse 429 d'OpenWeather : suspension des appels de tous les processus pendant delay secondes"""
+
+        with self._lock:
+            self.tokens = 0.0
+            self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+        try:
+            with contextlib.closing(self._connect()) as connection:
+                connection.execute(
+                    """INSERT INTO bucket (id, tokens, updated, blocked_until) VALUES (0, 0, ?, ?)
+                    ON CONFLICT (id) DO UPDATE SET tokens = 0, updated = excluded.updated,
+                    blocked_until = MAX(blocked_until, excluded.blocked_until)""",
+                    (time.time(), time.time() + delay)
+                )
+        except sqlite3.Error:
+            logger.exception("Échec de l'enregistrement de la suspension des appels")
+
+    def status(self):
+        """État du budget (seau de jetons partagé, ou propre au processus si la base est indisponible)"""
+
+        now = time.monotonic()
+        with self._lock:
+            self.refill(now)
+            tokens, blocked_for = self.tokens, self.blocked_until - now
+        try:
+            with contextlib.closing(self._connect()) as connection:
+                row = connection.execute("SELECT tokens, updated, blocked_until FROM bucket WHERE id = 0").fetchone()
+            if row is not None:
+                tokens = min(self.capacity, row[0] + max(0.0, time.time() - row[1]) * self.rate)
+                blocked_for = row[2] - time.time()
+        except sqlite3.Error:
+            logger.exception("Échec de la lecture du seau de jetons partagé")
+        with self._lock:
+            return {
+                'minute': {'capacity': self.capacity, 'available': round(tokens, 2)},
+                'month': {'month': self.month, 'limit': self.per_month, 'used': self.month_used},
+                'interactive_reserve': self.interactive_reserve,
+                'blocked_for': round(max(0.0, blocked_for), 2),
+                'granted': dict(self.granted),
+                'denied': dict(self.denied)
+            }
+
+# Budget des appels à OpenWeather (None : appels sans limite)
+budget = Governor(
+    governor_per_minute,
+    governor_per_month,
+    governor_interactive_reserve,
+    governor_max_wait,
+    governor_state_path,
+    governor_flush_interval
+) if governor_enabled else None
+if budget is not None:
+    metrics.watch_governor(budget)
+    # Derniers appels du processus ajoutés au compteur partagé à l'arrêt
+    atexit.register(budget.flush)
+
+
+def serve_status():
+    """Route de l'état du budget des appels à OpenWeather"""
+
+    if budget is None:
+        return flask.jsonify({'enabled': False})
+
+    return flask.jsonify(dict(budget.status(), enabled=True))
+
+def register_status(server, path: str="/governor"):
+    """Ajout de la route de l'état du budget"""
+
+    server.add_url_rule(path, "governor", serve_status)
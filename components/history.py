@@ -0,0 +1,298 @@
+# coding: utf-8
+
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+
+from . import api
+from .config import root_dir, one_call_api_base_url, cache_ttl, history_path, history_flush_interval, \
+    history_retention_days
+
+
+logger = logging.getLogger(__name__)
+
+# Champs numériques conservés pour les données courantes et prévisionnelles
+FIELDS = ['temp', 'feels_like', 'pressure', 'humidity', 'dew_point', 'uvi', 'clouds', 'visibility', 'wind_speed',
+          'wind_deg', 'wind_gust', 'pop']
+
+# Heures de prévisions d'une réponse One Call
+HOURS = 48
+
+# Tables de l'historique, regroupées physiquement (clé primaire WITHOUT ROWID) par point, puis par jour, puis par heure
+# (index par instant de l'appel pour la suppression des anciens résultats, à la place de l'index par point et instant)
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS {table} (
+    location TEXT NOT NULL,
+    date TEXT NOT NULL,
+    dt INTEGER NOT NULL,
+    fetched_at REAL NOT NULL,
+    {extra_columns}{fields},
+    weather_condition TEXT,
+    weather_icon TEXT,
+    PRIMARY KEY (location, date, dt, fetched_at)
+) WITHOUT ROWID;
+DROP INDEX IF EXISTS {table}_fetched_at;
+CREATE INDEX IF NOT EXISTS {table}_fetched_at_time ON {table} (fetched_at);
+"""
+
+# Intervalle (s) entre deux suppressions des résultats plus anciens que la durée de conservation
+PRUNE_INTERVAL = 3600
+
+# Résultats en attente d'écriture, enregistrés par lots par le thread d'écriture
+pending = queue.Queue()
+
+_started = False
+_start_lock = threading.Lock()
+
+
+def connect(path: str=history_path):
+    """Connexion à la base SQLite de l'historique, créée si besoin"""
+
+    path = os.path.join(root_dir, path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    connection = sqlite3.connect(path, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    fields = ",\n    ".join("{} REAL".format(field) for field in FIELDS)
+    connection.executescript(SCHEMA.format(table="hourly", extra_columns="", fields=fields))
+    connection.executescript(SCHEMA.format(table="current", extra_columns="sunrise INTEGER,\n    sunset INTEGER,\n    ", fields=fields))
+
+    return connection
+
+def get_location(lat: float, lon: float):
+    """Identifiant d'un point dans l'historique : la clé de cache (coordonnées arrondies, unités, exclusions)"""
+
+    return "|".join(str(part) for part in api.get_weather_cache_key(lat, lon, one_call_api_base_url))
+
+def to_seconds(datetimes):
+    """Dates et heures locales naïves en secondes (même convention que la lecture des résultats)"""
+
+    return np.asarray(datetimes, dtype='datetime64[s]').astype('int64')
+
+def to_rows(location: str, fetched_at: float, frame: pd.DataFrame, extra_columns: list[str]=[]):
+    """Lignes à insérer, construites colonne par colonne à partir du DataFrame"""
+
+    seconds = to_seconds(frame['dt'])
+    dates = np.datetime_as_string(seconds.astype('datetime64[s]').astype('datetime64[D]'))
+    columns = [
+        np.full(len(frame), location, dtype=object),
+        dates,
+        seconds.tolist(),
+        [float(fetched_at)] * len(frame)
+    ]
+    columns += [to_seconds(frame[column]).tolist() for column in extra_columns]
+    # Valeurs manquantes en None, comme relues dans la base (comparaison avec les dernières lignes enregistrées)
+    columns += [
+        frame[field].astype('float64').astype(object).where(frame[field].notna(), None).tolist()
+        if field in frame.columns else [None] * len(frame)
+        for field in FIELDS
+    ]
+    columns += [frame['weather_condition'].astype(str).tolist(), frame['weather_icon'].astype(str).tolist()]
+
+    return list(zip(*columns))
+
+def get_columns(extra_columns: list[str]=[]):
+    """Colonnes des valeurs d'une ligne, après le point, la date, l'heure et l'instant de l'appel"""
+
+    return extra_columns + FIELDS + ['weather_condition', 'weather_icon']
+
+def read_latest(connection: sqlite3.Connection, table: str, location: str, min_seconds: int, extra_columns: list[str]=[]):
+    """Dernière ligne enregistrée pour chaque heure d'un point à partir de min_seconds, par heure"""
+
+    min_date = str(np.datetime64(min_seconds, 's').astype('datetime64[D]'))
+    rows = connection.execute(
+        "SELECT dt, MAX(fetched_at), {} FROM {} WHERE location = ? AND date >= ? AND dt >= ? GROUP BY dt".format(
+            ", ".join(get_columns(extra_columns)), table
+        ),
+        (location, min_date, min_seconds)
+    )
+
+    return {row[0]: row for row in rows}
+
+def get_changed_rows(connection: sqlite3.Connection, table: str, rows: list[tuple], latest: dict, extra_columns: list[str]=[]):
+    """Lignes d'un point dont les valeurs diffèrent de la dernière ligne enregistrée pour la même heure (latest, mis à jour)"""
+
+    location = rows[0][0]
+    if location not in latest:
+        latest[location] = {
+            dt: row[1:] for dt, row in read_latest(connection, table, location, min(row[2] for row in rows), extra_columns).items()
+        }
+    changed = []
+    for row in rows:
+        stored = latest[location].get(row[2])
+        if stored is None or stored[1:] != row[4:]:
+            changed.append(row)
+            latest[location][row[2]] = (row[3],) + row[4:]
+
+    return changed
+
+def write_batch(connection: sqlite3.Connection, batch: list[tuple]):
+    """Écriture d'un lot de résultats (lat, lon, instant, current, hourly) en une seule transaction : seules les heures
+    nouvelles ou modifiées depuis la dernière ligne enregistrée pour le point sont ajoutées"""
+
+    hourly_rows, current_rows = [], []
+    latest_hourly, latest_current = {}, {}
+    for lat, lon, fetched_at, current, hourly in batch:
+        location = get_location(lat, lon)
+        hourly_rows += get_changed_rows(connection, "hourly", to_rows(location, fetched_at, hourly), latest_hourly)
+        current_rows += get_changed_rows(
+            connection,
+            "current",
+            to_rows(location, fetched_at, current.to_frame().T, extra_columns=['sunrise', 'sunset']),
+            latest_current,
+            extra_columns=['sunrise', 'sunset']
+        )
+
+    placeholders = ", ".join("?" * (6 + len(FIELDS)))
+    with connection:
+        connection.executemany("INSERT OR REPLACE INTO hourly VALUES ({})".format(placeholders), hourly_rows)
+        connection.executemany(
+            "INSERT OR REPLACE INTO current VALUES ({}, ?, ?)".format(placeholders),
+            current_rows
+        )
+
+def prune(connection: sqlite3.Connection, retention_days: float):
+    """Suppression des résultats enregistrés depuis plus de retention_days jours (index par instant de l'appel)"""
+
+    min_fetched_at = time.time() - retention_days * 86400
+    deleted = 0
+    with connection:
+        for table in ["hourly", "current"]:
+            deleted += connection.execute(
+                "DELETE FROM {} WHERE fetched_at < ?".format(table),
+                (min_fetched_at,)
+            ).rowcount
+
+    return deleted
+
+def append(lat: float, lon: float, current: pd.Series, hourly: pd.DataFrame):
+    """Ajout des résultats d'un appel API à l'historique (écrits au prochain lot)"""
+
+    pending.put((lat, lon, time.time(), current, hourly))
+
+def run_writer(connection: sqlite3.Connection, flush_interval: float, retention_days: float=0):
+    """Boucle d'écriture : regroupe les résultats reçus pendant flush_interval secondes, et supprime au plus une fois
+    par PRUNE_INTERVAL les résultats plus anciens que retention_days jours (0 : conservés indéfiniment)"""
+
+    last_pruned = float("-inf")
+    while True:
+        batch = [pending.get()]
+        time.sleep(flush_interval)
+        while not pending.empty():
+            batch.append(pending.get_nowait())
+        try:
+            write_batch(connection, batch)
+        except sqlite3.Error:
+            logger.exception("Échec de l'écriture de %d résultats dans l'historique", len(batch))
+        if retention_days > 0 and time.monotonic() - last_pruned >= PRUNE_INTERVAL:
+            last_pruned = time.monotonic()
+            try:
+                prune(connection, retention_days)
+            except sqlite3.Error:
+                logger.exception("Échec de la suppression des anciens résultats de l'historique")
+
+def read_frame(connection: sqlite3.Connection, table: str, location: str, start: pd.Timestamp, end: pd.Timestamp, extra_columns: list[str]=[]):
+    """Lecture des lignes d'un point entre deux dates et heures, mises en forme comme les résultats de l'API (une ligne
+    par heure et par appel ayant modifié ses valeurs)"""
+
+    bounds = np.array([start, end], dtype='datetime64[s]')
+    start_date, end_date = np.datetime_as_string(bounds.astype('datetime64[D]'))
+    start_seconds, end_seconds = bounds.astype('int64').tolist()
+    frame = pd.read_sql_query(
+        "SELECT fetched_at, dt, {} FROM {} WHERE location = ? AND date BETWEEN ? AND ? AND dt BETWEEN ? AND ? "
+        "ORDER BY fetched_at, dt".format(", ".join(get_columns(extra_columns)), table),
+        connection,
+        params=(location, start_date, end_date, start_seconds, end_seconds)
+    )
+    for column in ['dt'] + extra_columns:
+        frame[column] = frame[column].to_numpy().astype('datetime64[s]').astype('datetime64[ns]')
+    frame['fetched_at'] = api.to_local_datetimes(frame['fetched_at'].astype('int64'))
+    frame[FIELDS] = frame[FIELDS].astype('float32')
+    frame[['weather_condition', 'weather_icon']] = frame[['weather_condition', 'weather_icon']].astype('category')
+
+    return frame
+
+def read_hourly(lat: float, lon: float, start: pd.Timestamp, end: pd.Timestamp, connection: sqlite3.Connection=None):
+    """Prévisions horaires enregistrées pour un point, pour les heures comprises entre start et end"""
+
+    if connection is not None:
+        return read_frame(connection, "hourly", get_location(lat, lon), start, end)
+    with closing(connect()) as connection:
+        return read_frame(connection, "hourly", get_location(lat, lon), start, end)
+
+def read_current(lat: float, lon: float, start: pd.Timestamp, end: pd.Timestamp, connection: sqlite3.Connection=None):
+    """Données courantes enregistrées pour un point, pour les relevés compris entre start et end"""
+
+    if connection is not None:
+        return read_frame(connection, "current", get_location(lat, lon), start, end, extra_columns=['sunrise', 'sunset'])
+    with closing(connect()) as connection:
+        return read_frame(connection, "current", get_location(lat, lon), start, end, extra_columns=['sunrise', 'sunset'])
+
+def warm_cache(connection: sqlite3.Connection):
+    """Remplissage du cache des résultats avec les derniers résultats enregistrés encore valides"""
+
+    min_fetched_at = time.time() - cache_ttl
+    latest = connection.execute(
+        "SELECT location, MAX(fetched_at) FROM current WHERE fetched_at >= ? GROUP BY location",
+        (min_fetched_at,)
+    ).fetchall()
+
+    for location, fetched_at in latest:
+        # Dernières valeurs enregistrées de chaque heure prévue au dernier relevé (seules les heures modifiées sont écrites)
+        current_seconds = connection.execute(
+            "SELECT dt FROM current WHERE location = ? AND fetched_at = ?", (location, fetched_at)
+        ).fetchone()[0]
+        frames = {}
+        for table, extra_columns, min_seconds, max_seconds in [
+            ("current", ['sunrise', 'sunset'], current_seconds, current_seconds),
+            ("hourly", [], current_seconds - 3599, current_seconds + HOURS * 3600 - 3600)
+        ]:
+            rows = [
+                row[:1] + row[2:] for dt, row in sorted(read_latest(connection, table, location, min_seconds, extra_columns).items())
+                if dt <= max_seconds
+            ]
+            frame = pd.DataFrame(rows, columns=['dt'] + get_columns(extra_columns))
+            for column in ['dt'] + extra_columns:
+                frame[column] = frame[column].to_numpy().astype('int64').astype('datetime64[s]').astype('datetime64[ns]')
+            frames[table] = frame
+        if frames['current'].empty or frames['hourly'].empty:
+            continue
+
+        current = frames['current'].iloc[0].dropna()
+        hourly = frames['hourly'].dropna(axis='columns', how='all')
+        hourly = hourly.astype({column: 'float32' for column in FIELDS if column in hourly.columns})
+        hourly[['weather_condition', 'weather_icon']] = hourly[['weather_condition', 'weather_icon']].astype('category')
+        lat, lon, units, exclude = location.split("|")
+        api.weather_cache.set(
+            (float(lat), float(lon), units, exclude),
+            (current, hourly),
+            ttl=fetched_at + cache_ttl - time.time()
+        )
+
+    return len(latest)
+
+def start():
+    """Ouverture de l'historique : remplissage du cache puis enregistrement de chaque nouveau résultat de l'API"""
+
+    global _started
+
+    with _start_lock:
+        if _started:
+            return
+        api.keep_fields(FIELDS)
+        connection = connect()
+        warm_cache(connection)
+        api.fetch_listeners.append(append)
+        threading.Thread(
+            target=run_writer,
+            args=(connection, history_flush_interval, history_retention_days),
+            name="history-writer",
+            daemon=True
+        ).start()
+        _started = True
@@ -0,0 +1,149 @@
+# coding: utf-8
+
+import numpy as np
+
+
+# Limites (longitude min, latitude min, longitude max, latitude max) du monde entier
+WORLD_BOUNDS = (-180.0, -90.0, 180.0, 90.0)
+
+# Largeur en pixels d'une tuile cartographique : au zoom z, le monde fait 256 * 2^z pixels de large
+TILE_SIZE = 256
+
+
+def get_grid_cells(latitudes: np.ndarray, longitudes: np.ndarray, cell_size: float):
+    """Numéro de la cellule de grille (de cell_size degrés de côté) de chaque point, ligne par ligne du sud au nord"""
+
+    columns = int(np.ceil(360 / cell_size))
+    rows = int(np.ceil(180 / cell_size))
+    row = np.clip(((latitudes + 90) // cell_size).astype('int64'), 0, rows - 1)
+    column = np.clip(((longitudes + 180) // cell_size).astype('int64'), 0, columns - 1)
+
+    return row * columns + column
+
+def wrap_longitude(longitude: float):
+    """Longitude ramenée dans [-180, 180["""
+
+    return (longitude + 180) % 360 - 180
+
+def get_viewport(relayout_data: dict, default_zoom: float, margin: float=0.0):
+    """Zoom et limites de la vue de la carte d'après son relayoutData (monde entier si la vue n'est pas connue),
+    élargies de margin (en proportion) de chaque côté pour que les petits déplacements restent couverts"""
+
+    relayout_data = relayout_data or {}
+    zoom = relayout_data.get('mapbox.zoom', default_zoom)
+    derived = relayout_data.get('mapbox._derived')
+    if not derived:
+        return zoom, WORLD_BOUNDS
+
+    # Coins de la vue (longitude, latitude), éventuellement au-delà de ±180° si la carte a fait le tour du monde
+    corners = np.array(derived['coordinates'], dtype='float64')
+    lon_min, lat_min = corners.min(axis=0)
+    lon_max, lat_max = corners.max(axis=0)
+    lon_margin, lat_margin = (lon_max - lon_min) * margin, (lat_max - lat_min) * margin
+    lat_min, lat_max = max(-90.0, lat_min - lat_margin), min(90.0, lat_max + lat_margin)
+    if lon_max - lon_min + 2 * lon_margin >= 360:
+        return zoom, (-180.0, lat_min, 180.0, lat_max)
+
+    return zoom, (wrap_longitude(lon_min - lon_margin), lat_min, wrap_longitude(lon_max + lon_margin), lat_max)
+
+def cluster(latitudes: np.ndarray, longitudes: np.ndarray, cell_size: float):
+    """Regroupement des points par cellule de grille : position moyenne et nombre de points de chaque groupe,
+    et groupe de chaque point"""
+
+    _, groups, counts = np.unique(get_grid_cells(latitudes, longitudes, cell_size), return_inverse=True, return_counts=True)
+
+    return (
+        np.bincount(groups, weights=latitudes) / counts,
+        np.bincount(groups, weights=longitudes) / counts,
+        counts,
+        groups
+    )
+
+
+class GridIndex:
+    """Index spatial en grille régulière : les positions des points d'une même cellule sont contiguës,
+    et celles d'une ligne de cellules aussi, d'où une tranche de tableau par ligne pour une requête rectangulaire"""
+
+    def __init__(self, latitudes: np.ndarray, longitudes: np.ndarray, cell_size: float):
+        self.latitudes = np.ascontiguousarray(latitudes, dtype='float64')
+        self.longitudes = np.ascontiguousarray(longitudes, dtype='float64')
+        self.cell_size = cell_size
+        self.columns = int(np.ceil(360 / cell_size))
+        self.rows = int(np.ceil(180 / cell_size))
+
+        cells = get_grid_cells(self.latitudes, self.longitudes, cell_size)
+        self.order = np.argsort(cells, kind='stable')
+        # Début de chaque cellule dans self.order (et fin de la dernière)
+        self.starts = np.searchsorted(cells[self.order], np.arange(self.rows * self.columns + 1))
+
+    def get_column(self, longitude: float):
+        """Colonne de cellules d'une longitude"""
+
+        return min(self.columns - 1, max(0, int((longitude + 180) // self.cell_size)))
+
+    def get_row(self, latitude: float):
+        """Ligne de cellules d'une latitude"""
+
+        return min(self.rows - 1, max(0, int((latitude + 90) // self.cell_size)))
+
+    def query(self, bounds: tuple[float, float, float, float]):
+        """Positions des points situés dans les limites (longitude min, latitude min, longitude max, latitude max) ;
+        une longitude min supérieure à la longitude max désigne une vue à cheval sur l'antiméridien"""
+
+        lon_min, lat_min, lon_max, lat_max = bounds
+        if lon_min <= lon_max:
+            column_ranges = [(self.get_column(lon_min), self.get_column(lon_max))]
+        else:
+            column_ranges = [(self.get_column(lon_min), self.columns - 1), (0, self.get_column(lon_max))]
+
+        slices = []
+        for row in range(self.get_row(lat_min), self.get_row(lat_max) + 1):
+            for first_column, last_column in column_ranges:
+                start = self.starts[row * self.columns + first_column]
+                end = self.starts[row * self.columns + last_column + 1]
+                slices.append(self.order[start:end])
+        positions = np.concatenate(slices) if slices else np.empty(0, dtype='int64')
+
+        # Filtre exact des points des cellules en bordure de la vue
+        latitudes, longitudes = self.latitudes[positions], self.longitudes[positions]
+        inside = (latitudes >= lat_min) & (latitudes <= lat_max)
+        if lon_min <= lon_max:
+            inside &= (longitudes >= lon_min) & (longitudes <= lon_max)
+        else:
+            inside &= (longitudes >= lon_min) | (longitudes <= lon_max)
+
+        return np.sort(positions[inside])
+
+
+class LevelOfDetail:
+    """Choix des marqueurs à afficher pour une vue de la carte : les points de la vue s'ils sont peu nombreux,
+    sinon des groupes d'environ cluster_radius pixels de côté, sans jamais dépasser max_markers marqueurs"""
+
+    def __init__(self, latitudes: np.ndarray, longitudes: np.ndarray, cell_size: float, max_markers: int, cluster_radius: float):
+        self.grid = GridIndex(latitudes, longitudes, cell_size)
+        self.max_markers = max_markers
+        self.cluster_radius = cluster_radius
+
+    def select(self, bounds: tuple[float, float, float, float], zoom: float):
+        """Positions des points affichés seuls, et groupes (latitudes, longitudes, nombres de points) de la vue"""
+
+        positions = self.grid.query(bounds)
+        no_clusters = (np.empty(0), np.empty(0), np.empty(0, dtype='int64'))
+        if len(positions) <= self.max_markers:
+            return positions, no_clusters
+
+        latitudes, longitudes = self.grid.latitudes[positions], self.grid.longitudes[positions]
+        cell_size = 360 * self.cluster_radius / (TILE_SIZE * 2 ** zoom)
+        while True:
+            cluster_latitudes, cluster_longitudes, counts, groups = cluster(latitudes, longitudes, cell_size)
+            if len(counts) <= self.max_markers:
+                break
+            cell_size *= 2
+
+        # Les groupes d'un seul point sont affichés comme des points ordinaires
+        grouped = counts > 1
+
+        return (
+            positions[~grouped[groups]],
+            (cluster_latitudes[grouped], cluster_longitudes[grouped], counts[grouped])
+        )
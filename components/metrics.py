@@ -0,0 +1,159 @@
+# coding: utf-8
+
+import functools
+import time
+
+import flask
+from dash.exceptions import PreventUpdate
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+
+# Registre propre à l'application, exposé au format Prometheus
+registry = CollectorRegistry()
+
+# Tailles des corps de requête et de réponse, en octets
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+callback_duration = Histogram(
+    "sayato_callback_duration_seconds", "Durée d'exécution des callbacks Dash", ["callback"], registry=registry
+)
+callback_errors = Counter(
+    "sayato_callback_errors_total", "Exceptions levées par les callbacks Dash", ["callback"], registry=registry
+)
+callback_request_bytes = Histogram(
+    "sayato_callback_request_bytes", "Taille des requêtes reçues par les callbacks Dash", ["callback"],
+    buckets=SIZE_BUCKETS, registry=registry
+)
+callback_response_bytes = Histogram(
+    "sayato_callback_response_bytes", "Taille des réponses renvoyées par les callbacks Dash", ["callback"],
+    buckets=SIZE_BUCKETS, registry=registry
+)
+upstream_duration = Histogram(
+    "sayato_upstream_duration_seconds", "Durée des appels HTTP à OpenWeather (par tentative)", ["service"], registry=registry
+)
+upstream_requests = Counter(
+    "sayato_upstream_requests_total", "Appels HTTP à OpenWeather (par tentative) selon le code de réponse",
+    ["service", "status"], registry=registry
+)
+stream_updates = Counter(
+    "sayato_stream_updates_total", "Données envoyées (changed) ou non (unchanged) aux zones de stockage par stream_data",
+    ["store", "outcome"], registry=registry
+)
+downstream_runs_avoided = Counter(
+    "sayato_downstream_runs_avoided_total", "Exécutions de callbacks évitées car les données de la zone de stockage étaient inchangées",
+    ["store"], registry=registry
+)
+upstream_rate_limited = Counter(
+    "sayato_upstream_rate_limited_total", "Réponses 429 (trop d'appels) reçues d'OpenWeather", ["service"], registry=registry
+)
+governor_denied = Counter(
+    "sayato_governor_denied_total", "Appels à OpenWeather refusés par le budget du processus", ["priority"], registry=registry
+)
+stale_results = Counter(
+    "sayato_stale_results_total", "Résultats expirés servis faute de pouvoir appeler OpenWeather", ["service"], registry=registry
+)
+compression_bytes = Counter(
+    "sayato_compression_bytes_total", "Octets des réponses avant (original) et après (sent) compression, par type de route",
+    ["route", "stage"], registry=registry
+)
+
+
+def get_service(url: str):
+    """Service OpenWeather appelé, d'après l'URL (API One Call, tuiles, autre)"""
+
+    if "/onecall" in url:
+        return "one_call"
+    if "/tile/" in url or "/map/" in url:
+        return "tiles"
+
+    return "other"
+
+def observe_upstream(url: str, status: str, duration: float):
+    """Enregistrement d'une tentative d'appel à OpenWeather"""
+
+    service = get_service(url)
+    upstream_duration.labels(service).observe(duration)
+    upstream_requests.labels(service, status).inc()
+    if status == "429":
+        upstream_rate_limited.labels(service).inc()
+
+def observe_stream_update(store: str, changed: bool, dependents: int):
+    """Enregistrement d'une mise à jour (ou non) d'une zone de stockage, et des callbacks dépendants évités"""
+
+    stream_updates.labels(store, "changed" if changed else "unchanged").inc()
+    if not changed:
+        downstream_runs_avoided.labels(store).inc(dependents)
+
+def observe_compression(route: str, original: int, sent: int):
+    """Enregistrement de la taille d'une réponse avant et après compression"""
+
+    compression_bytes.labels(route, "original").inc(original)
+    compression_bytes.labels(route, "sent").inc(sent)
+
+def watch_cache(name: str, cache):
+    """Exposition des compteurs de succès et d'échecs et de la taille d'un cache"""
+
+    for stat in ['hits', 'misses', 'size']:
+        gauge = Gauge(
+            "sayato_{}_cache_{}".format(name, stat),
+            "Cache '{}' : {}".format(name, stat),
+            registry=registry
+        )
+        gauge.set_function(functools.partial(lambda stat: cache.stats()[stat], stat))
+
+def watch_governor(governor):
+    """Exposition de l'état du budget des appels à OpenWeather"""
+
+    gauges = {
+        'minute_available': lambda: governor.status()['minute']['available'],
+        'month_used': lambda: governor.status()['month']['used']
+    }
+    for stat, read in gauges.items():
+        gauge = Gauge("sayato_governor_{}".format(stat), "Budget des appels à OpenWeather : {}".format(stat), registry=registry)
+        gauge.set_function(read)
+
+def timed_callback(callback, name: str):
+    """Enveloppe d'un callback Dash mesurant sa durée et comptant ses exceptions"""
+
+    @functools.wraps(callback)
+    def wrapper(*args, **kwargs):
+        flask.g.callback_name = name
+        started = time.perf_counter()
+        try:
+            return callback(*args, **kwargs)
+        except PreventUpdate:
+            raise
+        except Exception:
+            callback_errors.labels(name).inc()
+            raise
+        finally:
+            callback_duration.labels(name).observe(time.perf_counter() - started)
+
+    return wrapper
+
+def observe_payload_sizes(response: flask.Response):
+    """Enregistrement des tailles de requête et de réponse des appels aux callbacks"""
+
+    name = flask.g.get("callback_name")
+    if name is not None:
+        callback_request_bytes.labels(name).observe(flask.request.content_length or 0)
+        if not response.direct_passthrough:
+            callback_response_bytes.labels(name).observe(response.calculate_content_length() or 0)
+
+    return response
+
+def serve_metrics():
+    """Route des métriques au format texte Prometheus"""
+
+    return flask.Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+def instrument_app(app, path: str="/metrics"):
+    """Mesure de tous les callbacks enregistrés auprès de l'application Dash, et ajout de la route des métriques"""
+
+    for spec in app.callback_map.values():
+        # Les callbacks exécutés dans le navigateur n'ont pas de fonction Python
+        if 'callback' not in spec:
+            continue
+        spec['callback'] = timed_callback(spec['callback'], spec['callback'].__name__)
+    app.server.after_request(observe_payload_sizes)
+    app.server.add_url_rule(path, "metrics", serve_metrics)
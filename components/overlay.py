@@ -0,0 +1,190 @@
+# coding: utf-8
+
+import functools
+import hashlib
+import struct
+import zlib
+
+import numpy as np
+from flask import Response, abort, request
+
+from . import api
+from .cache import TTLCache
+from .capitals import to_unit_vectors
+from .config import cache_ttl, variables_quanti, overlay_fields, overlay_width, overlay_height, overlay_power, \
+    overlay_colorscale, overlay_opacity
+
+
+# Latitude limite de la projection Web Mercator utilisée par la carte
+MERCATOR_MAX_LATITUDE = 85.0511287798
+
+# Champs absents des résultats lorsque leur valeur est nulle (pas de pluie, pas de neige)
+ZERO_WHEN_MISSING = {'rain', 'snow'}
+
+# Images déjà calculées, par nom de couche et empreinte des relevés
+image_cache = TTLCache(ttl=cache_ttl, maxsize=64)
+
+
+def get_grid_coordinates(width: int, height: int):
+    """Latitudes et longitudes des centres des pixels de l'image : colonnes régulières en longitude,
+    lignes régulières en ordonnée Web Mercator (l'image est étirée dans cette projection par la carte)"""
+
+    longitudes = -180 + (np.arange(width) + 0.5) * 360 / width
+    y_max = np.log(np.tan(np.pi / 4 + np.radians(MERCATOR_MAX_LATITUDE) / 2))
+    y = y_max - (np.arange(height) + 0.5) * 2 * y_max / height
+    latitudes = np.degrees(np.arctan(np.sinh(y)))
+
+    return latitudes, longitudes
+
+def get_image_coordinates():
+    """Coins de l'image sur la carte (longitude, latitude), dans l'ordre attendu par mapbox"""
+
+    return [
+        [-180, MERCATOR_MAX_LATITUDE],
+        [180, MERCATOR_MAX_LATITUDE],
+        [180, -MERCATOR_MAX_LATITUDE],
+        [-180, -MERCATOR_MAX_LATITUDE]
+    ]
+
+def get_field(name: str):
+    """Champ des résultats représenté par une couche (section [overlay_fields]) ou une variable quantitative,
+    None s'il n'y en a pas"""
+
+    return overlay_fields.get(name, name if name in variables_quanti else None)
+
+def get_readings(field: str):
+    """Relevés actuels d'un champ pour tous les points présents dans le cache des résultats :
+    latitudes, longitudes et valeurs, triées par point"""
+
+    readings = []
+    for key, (current, _) in api.weather_cache.items():
+        value = current.get(field)
+        if isinstance(value, dict):
+            value = value.get('1h')
+        if value is None and field in ZERO_WHEN_MISSING:
+            value = 0.0
+        if value is not None and np.isfinite(value):
+            readings.append((key[0], key[1], float(value)))
+    readings.sort()
+
+    return np.array(readings, dtype='float64').reshape(-1, 3).T
+
+def get_readings_digest(latitudes: np.ndarray, longitudes: np.ndarray, values: np.ndarray):
+    """Empreinte des relevés : change dès qu'un relevé est ajouté, retiré ou modifié"""
+
+    return hashlib.sha1(np.stack([latitudes, longitudes, values]).tobytes()).hexdigest()
+
+def get_overlay_version(name: str):
+    """Version de l'image d'une couche (empreinte des relevés), à ajouter à son URL pour que la carte la recharge"""
+
+    field = get_field(name)
+
+    return "" if field is None else get_readings_digest(*get_readings(field))
+
+def interpolate(latitudes: np.ndarray, longitudes: np.ndarray, values: np.ndarray, grid_latitudes: np.ndarray, grid_longitudes: np.ndarray, power: float, rows_per_chunk: int=64):
+    """Interpolation par pondération inverse de la distance (distance de corde sur la sphère unité) sur la grille,
+    calculée par blocs de lignes pour borner la mémoire"""
+
+    readings = to_unit_vectors(latitudes, longitudes).astype('float32')
+    values = values.astype('float32')
+    width = len(grid_longitudes)
+    grid = np.empty((len(grid_latitudes), width), dtype='float32')
+    for start in range(0, len(grid_latitudes), rows_per_chunk):
+        chunk_latitudes = grid_latitudes[start:start + rows_per_chunk]
+        points = to_unit_vectors(
+            np.repeat(chunk_latitudes, width),
+            np.tile(grid_longitudes, len(chunk_latitudes))
+        ).astype('float32')
+        # Carré de la distance de corde : |a - b|² = 2 - 2 a.b pour des vecteurs unitaires
+        squared_distances = np.maximum(2 - 2 * points @ readings.T, 1e-12)
+        weights = squared_distances ** (-power / 2)
+        grid[start:start + len(chunk_latitudes)] = ((weights @ values) / weights.sum(axis=1)).reshape(-1, width)
+
+    return grid
+
+@functools.lru_cache()
+def get_colormap(colorscale: str, opacity: float, size: int=256):
+    """Table de couleurs RGBA (size x 4 octets) interpolée entre les couleurs d'une échelle séquentielle de plotly"""
+
+    import plotly.colors
+
+    colors = getattr(plotly.colors.sequential, colorscale)
+    colors = np.array(plotly.colors.convert_colors_to_same_type(colors, colortype='tuple')[0], dtype='float64')
+    if colors.max() > 1:
+        colors = colors / 255
+    positions = np.linspace(0, 1, len(colors))
+    samples = np.linspace(0, 1, size)
+    channels = [np.interp(samples, positions, colors[:, channel]) for channel in range(3)]
+    colormap = np.column_stack(channels + [np.full(size, opacity)])
+
+    return np.round(colormap * 255).astype('uint8')
+
+def to_rgba(grid: np.ndarray, colormap: np.ndarray):
+    """Couleurs des pixels : valeurs ramenées entre les 2e et 98e centiles des valeurs de la grille"""
+
+    low, high = np.percentile(grid, [2, 98])
+    scaled = (grid - low) / (high - low) if high > low else np.zeros_like(grid)
+    indices = np.clip(np.round(scaled * (len(colormap) - 1)), 0, len(colormap) - 1).astype('intp')
+
+    return colormap[indices]
+
+def encode_png(rgba: np.ndarray):
+    """Encodage PNG (RGBA 8 bits, sans filtre) d'un tableau hauteur x largeur x 4"""
+
+    height, width, _ = rgba.shape
+    # Chaque ligne est précédée de l'octet du type de filtre (0 : aucun)
+    raw = np.concatenate([np.zeros((height, 1), dtype='uint8'), rgba.reshape(height, -1)], axis=1).tobytes()
+
+    def chunk(chunk_type: bytes, data: bytes):
+        return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data) & 0xffffffff)
+
+    return b"".join([
+        b"\x89PNG\r\n\x1a\n",
+        chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)),
+        chunk(b"IDAT", zlib.compress(raw, 6)),
+        chunk(b"IEND", b"")
+    ])
+
+def get_overlay(name: str):
+    """Image de la couche interpolée et son empreinte, recalculée seulement si les relevés ont changé"""
+
+    field = get_field(name)
+    if field is None:
+        return None
+    latitudes, longitudes, values = get_readings(field)
+    digest = get_readings_digest(latitudes, longitudes, values)
+
+    cached = image_cache.get((name, digest))
+    if cached is not None:
+        return cached
+
+    if len(values) == 0:
+        rgba = np.zeros((overlay_height, overlay_width, 4), dtype='uint8')
+    else:
+        grid_latitudes, grid_longitudes = get_grid_coordinates(overlay_width, overlay_height)
+        grid = interpolate(latitudes, longitudes, values, grid_latitudes, grid_longitudes, overlay_power)
+        rgba = to_rgba(grid, get_colormap(overlay_colorscale, overlay_opacity))
+    overlay = (encode_png(rgba), digest)
+    image_cache.set((name, digest), overlay)
+
+    return overlay
+
+def serve_overlay(name: str):
+    """Route de la couche interpolée : image PNG, réponse conditionnelle selon l'empreinte des relevés"""
+
+    overlay = get_overlay(name)
+    if overlay is None:
+        abort(404)
+    content, digest = overlay
+
+    response = Response(content, mimetype="image/png")
+    response.set_etag(digest)
+    response.cache_control.no_cache = True
+
+    return response.make_conditional(request)
+
+def register_overlay(server):
+    """Ajout de la route /overlay/<couche>.png au serveur Flask, et conservation des champs représentés"""
+
+    api.keep_fields(list(overlay_fields.values()) + variables_quanti)
+    server.add_url_rule("/overlay/<name>.png", "overlay", serve_overlay)
@@ -0,0 +1,157 @@
+# coding: utf-8
+
+import cProfile
+import heapq
+import hmac
+import itertools
+import os
+import re
+import threading
+import time
+
+import flask
+
+from .config import root_dir, profiling_env_var, profiling_header, profiling_token, profiling_output_dir, \
+    profiling_max_entries, profiling_window
+
+
+# Requêtes profilées les plus lentes des profiling_window dernières secondes (tas par durée croissante) :
+# durée, numéro d'ordre, description
+slowest = []
+_slowest_lock = threading.Lock()
+_sequence = itertools.count()
+
+# Dossier des fichiers de profilage
+output_dir = os.path.join(root_dir, profiling_output_dir)
+
+
+def is_enabled_by_env():
+    """Profilage de toutes les requêtes demandé par la variable d'environnement"""
+
+    return os.environ.get(profiling_env_var, "") == "1"
+
+def is_requested():
+    """Requête à profiler : toutes en mode variable d'environnement, sinon celles portant le jeton d'administration"""
+
+    if is_enabled_by_env():
+        return True
+    token = flask.request.headers.get(profiling_header)
+
+    return bool(profiling_token) and token is not None and hmac.compare_digest(token, profiling_token)
+
+def get_label(request: flask.Request):
+    """Nom de la requête profilée : callback Dash appelé (sortie), sinon chemin"""
+
+    name = flask.g.get("callback_name")
+    if name is None and request.is_json:
+        name = (request.get_json(silent=True) or {}).get('output')
+
+    return name or request.path
+
+def start_profile():
+    """Démarrage du profilage de la requête si elle est demandée"""
+
+    if is_requested():
+        flask.g.profile = cProfile.Profile()
+        flask.g.profile_started = time.perf_counter()
+        flask.g.profile.enable()
+
+def expire(now: float):
+    """Retrait des requêtes profilées depuis plus de profiling_window secondes (sous _slowest_lock) : les anciennes
+    requêtes lentes laissent la place aux récentes ; renvoie leurs fichiers à supprimer"""
+
+    min_started_at = now - profiling_window
+    expired = [entry['file'] for _, _, entry in slowest if entry['started_at'] < min_started_at]
+    if expired:
+        slowest[:] = [item for item in slowest if item[2]['started_at'] >= min_started_at]
+        heapq.heapify(slowest)
+
+    return expired
+
+def remove_files(filenames: list[str]):
+    """Suppression de fichiers de profilage"""
+
+    for filename in filenames:
+        try:
+            os.remove(os.path.join(output_dir, filename))
+        except OSError:
+            pass
+
+def stop_profile(error=None):
+    """Fin du profilage de la requête : conservée (fichier .prof) si elle compte parmi les plus lentes récentes"""
+
+    profile = flask.g.pop("profile", None)
+    if profile is None:
+        return
+    profile.disable()
+    duration = time.perf_counter() - flask.g.pop("profile_started")
+    label = get_label(flask.request)
+
+    with _slowest_lock:
+        removed = expire(time.time())
+        kept = len(slowest) < profiling_max_entries or duration > slowest[0][0]
+        if kept:
+            entry = {
+                'label': label,
+                'path': flask.request.path,
+                'duration_ms': round(duration * 1000, 2),
+                'started_at': time.time() - duration,
+                'file': "{}-{}-{:.0f}ms.prof".format(int(time.time() * 1000), re.sub(r"[^\w.-]+", "_", label)[:80], duration * 1000)
+            }
+            item = (duration, next(_sequence), entry)
+            if len(slowest) >= profiling_max_entries:
+                removed.append(heapq.heappushpop(slowest, item)[2]['file'])
+            else:
+                heapq.heappush(slowest, item)
+
+    if kept:
+        os.makedirs(output_dir, exist_ok=True)
+        profile.dump_stats(os.path.join(output_dir, entry['file']))
+    remove_files(removed)
+
+def check_access():
+    """Routes du profilage réservées aux porteurs du jeton d'administration, quel que soit le mode de profilage"""
+
+    token = flask.request.headers.get(profiling_header, "")
+    if not profiling_token or not hmac.compare_digest(token, profiling_token):
+        flask.abort(404)
+
+def serve_slowest():
+    """Route des requêtes profilées les plus lentes récentes, de la plus lente à la plus rapide"""
+
+    check_access()
+    with _slowest_lock:
+        removed = expire(time.time())
+        entries = [entry for _, _, entry in sorted(slowest, key=lambda item: item[:2], reverse=True)]
+    remove_files(removed)
+
+    return flask.jsonify(entries)
+
+def serve_profile(filename: str):
+    """Route de téléchargement d'un fichier de profilage"""
+
+    check_access()
+
+    return flask.send_from_directory(output_dir, filename, mimetype="application/octet-stream")
+
+def register(server, path: str="/profiling"):
+    """Profilage à la demande des requêtes (callbacks et appels à OpenWeather qu'ils déclenchent) ; rien n'est ajouté
+    au serveur, donc aucun coût, si ni la variable d'environnement ni le jeton ne sont définis, et les routes de
+    consultation ne sont ajoutées qu'avec un jeton (sinon, fichiers .prof à lire dans output_dir)"""
+
+    if not is_enabled_by_env() and not profiling_token:
+        return False
+    # Fichiers laissés par les processus précédents et sortis de la fenêtre
+    if os.path.isdir(output_dir):
+        min_modified_at = time.time() - profiling_window
+        remove_files([
+            filename for filename in os.listdir(output_dir)
+            if filename.endswith(".prof") and os.path.getmtime(os.path.join(output_dir, filename)) < min_modified_at
+        ])
+    server.before_request(start_profile)
+    server.teardown_request(stop_profile)
+    if profiling_token:
+        server.add_url_rule(path, "profiling", serve_slowest)
+        server.add_url_rule("{}/<path:filename>".format(path), "profiling_file", serve_profile)
+
+    return True
@@ -0,0 +1,194 @@
+# coding: utf-8
+
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+
+from flask import Response, abort, request
+
+from . import api
+from .governor import INTERACTIVE, priority
+from .config import api_key, one_call_api_base_url, push_refresh_interval, push_layer_interval, push_keepalive
+from .store import put_results
+
+
+logger = logging.getLogger(__name__)
+
+# Messages en attente par onglet (onglet lent) : au-delà, les plus anciens sont retirés, pour que l'onglet reçoive
+# toujours les derniers jetons
+QUEUE_SIZE = 16
+
+# Période de la boucle de diffusion, en secondes
+TICK = 1.0
+
+
+class Broadcaster:
+    """Diffusion des mises à jour aux onglets abonnés : une seule lecture des résultats par point suivi et par intervalle,
+    quel que soit le nombre d'onglets, et un message à chaque abonné du point quand les résultats changent"""
+
+    def __init__(self, refresh_interval: float, layer_interval: float):
+        self.refresh_interval = refresh_interval
+        self.layer_interval = layer_interval
+        # File de messages de chaque onglet, par point (coordonnées arrondies comme les clés du cache des résultats)
+        self.subscribers = {}
+        self.coordinates = {}
+        self.last_check = {}
+        self.last_tokens = {}
+        self.layer_version = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self, lat: float, lon: float):
+        """Abonnement d'un onglet aux mises à jour d'un point, renvoie sa file de messages, qui contient déjà les jetons
+        des derniers résultats diffusés (sinon ils sont lus au prochain tour de la boucle de diffusion)"""
+
+        subscriber = queue.Queue(maxsize=QUEUE_SIZE)
+        location = api.get_location(lat, lon)
+        with self._lock:
+            self.subscribers.setdefault(location, set()).add(subscriber)
+            self.coordinates.setdefault(location, (lat, lon))
+            if location in self.last_tokens:
+                subscriber.put_nowait(("weather", json.dumps(self.last_tokens[location])))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run, name="push", daemon=True)
+                self._thread.start()
+
+        return subscriber
+
+    def unsubscribe(self, lat: float, lon: float, subscriber: queue.Queue):
+        """Désabonnement d'un onglet ; un point sans abonné n'est plus suivi"""
+
+        location = api.get_location(lat, lon)
+        with self._lock:
+            subscribers = self.subscribers.get(location, set())
+            subscribers.discard(subscriber)
+            if not subscribers:
+                for followed in [self.subscribers, self.coordinates, self.last_check, self.last_tokens]:
+                    followed.pop(location, None)
+
+    def send(self, subscribers: list, event: str, data: str):
+        """Envoi d'un message à des onglets, en retirant le plus ancien message d'une file pleine"""
+
+        for subscriber in subscribers:
+            while True:
+                try:
+                    subscriber.put_nowait((event, data))
+                    break
+                except queue.Full:
+                    try:
+                        subscriber.get_nowait()
+                    except queue.Empty:
+                        pass
+
+    def publish(self, lat: float, lon: float, current, hourly):
+        """Diffusion de résultats aux abonnés du point s'ils ont changé depuis la dernière diffusion"""
+
+        location = api.get_location(lat, lon)
+        with self._lock:
+            if location not in self.subscribers:
+                return
+            lat, lon = self.coordinates[location]
+        tokens = put_results(lat, lon, current, hourly)
+        with self._lock:
+            if self.last_tokens.get(location) == tokens or location not in self.subscribers:
+                return
+            self.last_tokens[location] = tokens
+            subscribers = list(self.subscribers[location])
+        self.send(subscribers, "weather", json.dumps(tokens))
+
+    def check(self, now: float):
+        """Lecture (cache ou appel API) des résultats des points suivis dont la dernière lecture date d'au moins refresh_interval"""
+
+        with self._lock:
+            due = [
+                (location, coordinates) for location, coordinates in self.coordinates.items()
+                if now - self.last_check.get(location, float("-inf")) >= self.refresh_interval
+            ]
+            for location, _ in due:
+                self.last_check[location] = now
+        for _, (lat, lon) in due:
+            try:
+                # Capitales affichées dans des onglets ouverts : mêmes appels que stream_data en mode poll
+                with priority(INTERACTIVE):
+                    current, hourly = api.get_weather_results(lat, lon, one_call_api_base_url, api_key)
+                self.publish(lat, lon, current, hourly)
+            except Exception:
+                logger.exception("Échec de la lecture des résultats de (%s, %s)", lat, lon)
+
+    def run(self):
+        """Boucle de diffusion : résultats des points suivis, et signal de rechargement de la couche météo à tous les onglets"""
+
+        last_layer = time.monotonic()
+        while True:
+            started = time.monotonic()
+            self.check(started)
+            if started - last_layer >= self.layer_interval:
+                last_layer = started
+                self.layer_version += 1
+                with self._lock:
+                    subscribers = [subscriber for subscribers in self.subscribers.values() for subscriber in subscribers]
+                self.send(subscribers, "layer", str(self.layer_version))
+            time.sleep(max(0.0, TICK - (time.monotonic() - started)))
+
+# Diffusion des mises à jour à tous les onglets ouverts sur ce processus
+broadcaster = Broadcaster(push_refresh_interval, push_layer_interval)
+
+
+def is_streaming_supported(environ: dict):
+    """Serveur capable de garder des connexions ouvertes sans bloquer les autres requêtes : workers à threads
+    (wsgi.multithread) ou coopératifs (gevent, eventlet) ; un worker synchrone serait occupé par chaque onglet"""
+
+    if environ.get('wsgi.multithread'):
+        return True
+    gevent_monkey, eventlet_patcher = sys.modules.get("gevent.monkey"), sys.modules.get("eventlet.patcher")
+
+    return bool(
+        (gevent_monkey is not None and gevent_monkey.is_module_patched("socket"))
+        or (eventlet_patcher is not None and eventlet_patcher.is_monkey_patched("socket"))
+    )
+
+def serve_events():
+    """Route des mises à jour poussées (Server-Sent Events) pour un point : /events?lat=..&lon=.."""
+
+    if not is_streaming_supported(request.environ):
+        logger.error(
+            "Mises à jour poussées refusées : workers synchrones, lancer le serveur avec des workers à threads "
+            "(gunicorn -k gthread --threads 100) ou coopératifs (gunicorn -k gevent), ou utiliser mode=poll"
+        )
+        abort(503)
+    try:
+        lat, lon = float(request.args['lat']), float(request.args['lon'])
+    except (KeyError, ValueError):
+        abort(400)
+    subscriber = broadcaster.subscribe(lat, lon)
+
+    def stream():
+        try:
+            # Délai de reconnexion du navigateur après une coupure, en millisecondes
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event, data = subscriber.get(timeout=push_keepalive)
+                except queue.Empty:
+                    # Commentaire gardant la connexion ouverte à travers les proxys
+                    yield ": keepalive\n\n"
+                    continue
+                yield "event: {}\ndata: {}\n\n".format(event, data)
+        finally:
+            broadcaster.unsubscribe(lat, lon, subscriber)
+
+    response = Response(stream(), mimetype="text/event-stream")
+    response.headers['Cache-Control'] = "no-cache"
+    response.headers['X-Accel-Buffering'] = "no"
+
+    return response
+
+def register_events(server, path: str="/events"):
+    """Ajout de la route des mises à jour poussées, et diffusion immédiate des résultats obtenus ailleurs
+    (rafraîchissement en arrière-plan, autre onglet)"""
+
+    api.result_listeners.append(broadcaster.publish)
+    server.add_url_rule(path, "events", serve_events)
@@ -0,0 +1,188 @@
+# coding: utf-8
+
+import threading
+import warnings
+
+import numpy as np
+import pandas as pd
+from flask import abort, jsonify, request
+
+from . import api
+from .capitals import capitals
+from .config import variables_quanti, rankings_hours, rankings_max_n
+
+
+# Champs des résultats actuels conservés pour toutes les capitales
+CURRENT_FIELDS = ['temp', 'feels_like', 'humidity', 'pressure', 'wind_speed', 'clouds', 'uvi']
+
+_started = False
+_start_lock = threading.Lock()
+
+
+def get_dew_point(temp: np.ndarray, humidity: np.ndarray):
+    """Point de rosée (°C) par la formule de Magnus"""
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gamma = np.log(humidity / 100) + 17.62 * temp / (243.12 + temp)
+
+        return 243.12 * gamma / (17.62 - gamma)
+
+def get_heat_index(temp: np.ndarray, humidity: np.ndarray):
+    """Indice de chaleur (°C) par la régression de Rothfusz (NOAA), égal à la température hors de son domaine
+    de validité (moins de 27 °C ou moins de 40 % d'humidité)"""
+
+    t = temp * 9 / 5 + 32
+    rh = humidity
+    heat_index = (
+        -42.379 + 2.04901523 * t + 10.14333127 * rh - 0.22475541 * t * rh - 6.83783e-3 * t ** 2
+        - 5.481717e-2 * rh ** 2 + 1.22874e-3 * t ** 2 * rh + 8.5282e-4 * t * rh ** 2 - 1.99e-6 * t ** 2 * rh ** 2
+    )
+
+    return np.where((temp >= 27) & (humidity >= 40), (heat_index - 32) * 5 / 9, temp)
+
+def get_wind_chill(temp: np.ndarray, wind_speed: np.ndarray):
+    """Refroidissement éolien (°C) par la formule d'Environnement Canada (vent en m/s), égal à la température
+    hors de son domaine de validité (plus de 10 °C ou vent de moins de 4,8 km/h)"""
+
+    wind_kmh = wind_speed * 3.6
+    with np.errstate(invalid='ignore'):
+        wind_factor = wind_kmh ** 0.16
+    wind_chill = 13.12 + 0.6215 * temp - 11.37 * wind_factor + 0.3965 * temp * wind_factor
+
+    return np.where((temp <= 10) & (wind_kmh > 4.8), wind_chill, temp)
+
+
+class RankingEngine:
+    """Dernières données de toutes les capitales en tableaux colonnes (une ligne par capitale), indicateurs dérivés
+    recalculés ligne par ligne à l'arrivée de chaque résultat, et classements servis sans calcul par requête"""
+
+    def __init__(self, capitals_df: pd.DataFrame, hourly_fields: list[str], hours: int):
+        self.names = capitals_df['CapitalName'].to_numpy()
+        self.countries = capitals_df['CountryName'].to_numpy()
+        self.hourly_fields = hourly_fields
+        self.hours = hours
+        count = len(capitals_df)
+
+        # Ligne de chaque capitale, par coordonnées arrondies comme les clés du cache des résultats
+        self.positions = {}
+        for position, (lat, lon) in enumerate(zip(capitals_df['CapitalLatitude'], capitals_df['CapitalLongitude'])):
+            self.positions.setdefault(api.get_location(lat, lon), position)
+
+        self.current = {field: np.full(count, np.nan) for field in CURRENT_FIELDS}
+        self.hourly = {field: np.full((count, hours), np.nan) for field in hourly_fields}
+        self.metrics = {name: np.full(count, np.nan) for name in self.get_metric_names()}
+        self._lock = threading.Lock()
+
+    def get_metric_names(self):
+        """Indicateurs classables : champs actuels, indicateurs dérivés et statistiques sur les prochaines heures"""
+
+        return CURRENT_FIELDS + ['dew_point', 'heat_index', 'wind_chill'] + [
+            "{}_{}h_{}".format(field, self.hours, statistic)
+            for field in self.hourly_fields
+            for statistic in ['min', 'max', 'mean']
+        ]
+
+    def write(self, position: int, current: pd.Series, hourly: pd.DataFrame):
+        """Copie des résultats d'une capitale dans sa ligne"""
+
+        for field in CURRENT_FIELDS:
+            value = current.get(field, np.nan)
+            self.current[field][position] = np.nan if value is None else value
+        for field in self.hourly_fields:
+            row = self.hourly[field][position]
+            row[:] = np.nan
+            if field in hourly:
+                values = hourly[field].to_numpy(dtype='float64')[:self.hours]
+                row[:len(values)] = values
+
+    def compute(self, rows=slice(None)):
+        """Calcul en bloc des indicateurs dérivés des lignes données (toutes par défaut)"""
+
+        temp, humidity = self.current['temp'][rows], self.current['humidity'][rows]
+        metrics = self.metrics
+        for field in CURRENT_FIELDS:
+            metrics[field][rows] = self.current[field][rows]
+        metrics['dew_point'][rows] = get_dew_point(temp, humidity)
+        metrics['heat_index'][rows] = get_heat_index(temp, humidity)
+        metrics['wind_chill'][rows] = get_wind_chill(temp, self.current['wind_speed'][rows])
+
+        # Statistiques des prévisions (NaN pour les capitales sans prévisions, sans avertissement)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            for field in self.hourly_fields:
+                values = self.hourly[field][rows]
+                prefix = "{}_{}h_".format(field, self.hours)
+                metrics[prefix + 'min'][rows] = np.nanmin(values, axis=-1)
+                metrics[prefix + 'max'][rows] = np.nanmax(values, axis=-1)
+                metrics[prefix + 'mean'][rows] = np.nanmean(values, axis=-1)
+
+    def update(self, lat: float, lon: float, current: pd.Series, hourly: pd.DataFrame):
+        """Prise en compte d'un nouveau résultat : seule la ligne de la capitale est recalculée"""
+
+        position = self.positions.get(api.get_location(lat, lon))
+        if position is None:
+            return
+        with self._lock:
+            self.write(position, current, hourly)
+            self.compute(slice(position, position + 1))
+
+    def load(self, items: list):
+        """Chargement de résultats déjà obtenus (entrées du cache des résultats), puis calcul de toutes les lignes"""
+
+        with self._lock:
+            for key, (current, hourly) in items:
+                position = self.positions.get(api.get_location(key[0], key[1]))
+                if position is not None:
+                    self.write(position, current, hourly)
+            self.compute()
+
+    def top(self, metric: str, n: int=10, ascending: bool=False):
+        """Classement des n capitales aux valeurs les plus hautes (ou les plus basses) d'un indicateur"""
+
+        with self._lock:
+            values = self.metrics[metric].copy()
+        known = np.flatnonzero(~np.isnan(values))
+        n = min(n, len(known))
+        if n == 0:
+            return []
+        keys = values[known] if ascending else -values[known]
+        # Sélection partielle des n meilleures valeurs, puis tri de ces seules valeurs
+        order = np.argpartition(keys, n - 1)[:n] if n < len(known) else np.arange(len(known))
+        best = known[order[np.argsort(keys[order], kind='stable')]]
+
+        return [
+            {'name': self.names[position], 'country': self.countries[position], 'value': round(float(values[position]), 2)}
+            for position in best
+        ]
+
+# Classements de toutes les capitales, mis à jour à chaque nouveau résultat (obtenu par ce processus ou un autre)
+engine = RankingEngine(capitals, variables_quanti, rankings_hours)
+
+
+def serve_rankings(metric: str):
+    """Route des classements : /rankings/<indicateur>?n=10&order=desc"""
+
+    if metric not in engine.metrics:
+        abort(404)
+    n = min(max(request.args.get('n', 10, type=int), 1), rankings_max_n)
+    ascending = request.args.get('order', "desc") == "asc"
+
+    return jsonify({
+        'metric': metric,
+        'order': "asc" if ascending else "desc",
+        'rankings': engine.top(metric, n, ascending)
+    })
+
+def start(server, path: str="/rankings"):
+    """Chargement des résultats déjà en cache, abonnement aux nouveaux résultats et ajout de la route des classements"""
+
+    global _started
+
+    with _start_lock:
+        if _started:
+            return
+        api.keep_fields(CURRENT_FIELDS)
+        engine.load(api.weather_cache.items())
+        api.result_listeners.append(engine.update)
+        server.add_url_rule("{}/<metric>".format(path), "rankings", serve_rankings)
+        _started = True
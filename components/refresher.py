@@ -0,0 +1,153 @@
+# coding: utf-8
+
+import logging
+import threading
+import time
+from collections import Counter
+
+import pandas as pd
+
+from . import api
+from .api import get_weather_results
+from .upstream import BudgetExhausted
+from .capitals import capitals
+from .config import api_key, one_call_api_base_url, cache_ttl, cache_shared_path, cache_lease_timeout, \
+    cache_poll_interval, refresher_enabled, refresher_requests_per_minute, refresher_min_interval, governor_enabled, \
+    governor_per_minute, governor_per_month, governor_interactive_reserve
+from .shared_cache import SharedCache
+
+
+logger = logging.getLogger(__name__)
+
+# Verrou (base SQLite du cache partagé) désignant le seul processus de la machine qui rafraîchit les capitales,
+# prolongé à chaque tour de boucle et repris par un autre processus s'il n'est plus prolongé pendant LEASE_DURATION s
+LEASE_KEY = "refresher"
+LEASE_DURATION = 60
+
+# Minutes d'un mois de 31 jours, pour comparer le rythme de rafraîchissement au budget mensuel
+MONTH_MINUTES = 31 * 24 * 60
+
+# Nombre de sélections de chaque capitale par les utilisateurs, pour rafraîchir en priorité les plus consultées
+view_counts = Counter()
+
+# Instant (time.monotonic) du dernier rafraîchissement de chaque capitale, par position dans le tableau
+last_refresh = {}
+
+_started = False
+_start_lock = threading.Lock()
+
+
+def record_view(capital_name: str):
+    """Comptabilise une sélection de la capitale par un utilisateur"""
+
+    view_counts[capital_name] += 1
+
+def select_next_capital(capitals_df: pd.DataFrame, now: float, min_interval: float):
+    """Choix de la prochaine capitale à rafraîchir : ancienneté des données pondérée par la popularité"""
+
+    best_idx, best_score = None, 0.0
+    for idx, capital_name in enumerate(capitals_df['CapitalName']):
+        age = now - last_refresh.get(idx, float("-inf"))
+        if age < min_interval:
+            continue
+        score = age * (1 + view_counts[capital_name])
+        if best_idx is None or score > best_score:
+            best_idx, best_score = idx, score
+
+    return best_idx
+
+def refresh_capital(capitals_df: pd.DataFrame, idx: int):
+    """Rafraîchissement des résultats météo d'une capitale dans le cache, sans tenir compte des résultats en cache"""
+
+    capital = capitals_df.iloc[idx]
+    last_refresh[idx] = time.monotonic()
+    try:
+        get_weather_results(
+            capital['CapitalLatitude'],
+            capital['CapitalLongitude'],
+            one_call_api_base_url,
+            api_key,
+            refresh=True
+        )
+    except BudgetExhausted:
+        # Part du budget laissée aux appels interactifs : la capitale sera rafraîchie plus tard
+        logger.debug("Rafraîchissement de %s reporté (budget épuisé)", capital['CapitalName'])
+    except Exception:
+        logger.exception("Échec du rafraîchissement de %s", capital['CapitalName'])
+
+def get_required_rate(capital_count: int, ttl: float):
+    """Appels par minute nécessaires pour rafraîchir toutes les capitales avant l'expiration de leurs résultats en cache"""
+
+    return capital_count * 60 / ttl
+
+def check_rate(capital_count: int, requests_per_minute: float):
+    """Avertissement si le rythme configuré, ou la part du budget (par minute et par mois) laissée à l'arrière-plan, ne
+    permet pas de rafraîchir toutes les capitales pendant la durée de vie du cache, ou si le rythme configuré épuise
+    le budget mensuel avant la fin du mois"""
+
+    required = get_required_rate(capital_count, cache_ttl)
+    if requests_per_minute < required:
+        logger.warning(
+            "Rafraîchissement de %d capitales en %.1f min pour un cache de %.1f min : requests_per_minute=%g, "
+            "au moins %.1f nécessaires", capital_count, capital_count / requests_per_minute, cache_ttl / 60,
+            requests_per_minute, required
+        )
+    if not governor_enabled:
+        return
+    # Rythme tenable avec chaque part du budget laissée à l'arrière-plan
+    background_per_minute = min(
+        governor_per_minute * (1 - governor_interactive_reserve),
+        governor_per_month * (1 - governor_interactive_reserve) / MONTH_MINUTES
+    )
+    if background_per_minute < required:
+        logger.warning(
+            "Budget d'arrière-plan de %.1f appels par minute ([governor], par minute et par mois) insuffisant pour "
+            "rafraîchir les capitales (%.1f nécessaires)", background_per_minute, required
+        )
+    if requests_per_minute > background_per_minute:
+        logger.warning(
+            "Rafraîchissement à %g appels par minute au-delà du budget d'arrière-plan ([governor]) : budget mensuel "
+            "épuisé en %.0f jours, au plus %.1f appels par minute", requests_per_minute,
+            governor_per_month * (1 - governor_interactive_reserve) / requests_per_minute / 1440, background_per_minute
+        )
+
+def run(capitals_df: pd.DataFrame, requests_per_minute: float, min_interval: float, lease: SharedCache=None):
+    """Boucle de rafraîchissement : au plus un appel API toutes les 60 / requests_per_minute secondes, seulement
+    pendant que ce processus détient le verrou partagé (lease) s'il est donné"""
+
+    check_rate(len(capitals_df), requests_per_minute)
+    period = 60 / requests_per_minute
+    while True:
+        started = time.monotonic()
+        if lease is not None and not lease.acquire(LEASE_KEY, LEASE_DURATION):
+            # Capitales rafraîchies par un autre processus : nouvel essai dans un quart de la durée du verrou
+            time.sleep(LEASE_DURATION / 4)
+            continue
+        idx = select_next_capital(capitals_df, started, min_interval)
+        if idx is not None:
+            refresh_capital(capitals_df, idx)
+        time.sleep(max(0.0, period - (time.monotonic() - started)))
+
+def start():
+    """Démarrage (une seule fois par processus) du thread de rafraîchissement des capitales en arrière-plan, actif
+    dans un seul processus de la machine à la fois (workers du serveur)"""
+
+    global _started
+
+    if _started or not refresher_enabled:
+        return
+    with _start_lock:
+        if _started:
+            return
+        threading.Thread(
+            target=run,
+            args=(
+                capitals,
+                refresher_requests_per_minute,
+                refresher_min_interval,
+                api.shared_cache or SharedCache(cache_shared_path, cache_ttl, cache_lease_timeout, cache_poll_interval)
+            ),
+            name="refresher",
+            daemon=True
+        ).start()
+        _started = True
@@ -0,0 +1,127 @@
+# coding: utf-8
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Optional
+
+from .config import root_dir
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    stored_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    payload BLOB NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS leases (
+    key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+class SharedCache:
+    """Cache partagé par tous les processus d'une machine (base SQLite) : réponses brutes de l'API par clé,
+    avec un verrou par clé pour qu'un seul processus appelle l'API pendant que les autres attendent son résultat"""
+
+    def __init__(self, path: str, ttl: float, lease_timeout: float, poll_interval: float):
+        self.path = os.path.join(root_dir, path)
+        self.ttl = ttl
+        self.lease_timeout = lease_timeout
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self):
+        """Connexion propre au thread appelant (les connexions SQLite ne se partagent pas entre threads)"""
+
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.lease_timeout, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+
+        return connection
+
+    def get(self, key: str, min_stored_at: float=0.0) -> Optional[tuple[bytes, float]]:
+        """Réponse enregistrée et non expirée (et enregistrée après min_stored_at) avec sa durée de vie restante, None sinon"""
+
+        now = time.time()
+        row = self._connect().execute(
+            "SELECT payload, expires_at FROM entries WHERE key = ? AND expires_at > ? AND stored_at >= ?",
+            (key, now, min_stored_at)
+        ).fetchone()
+        if row is None:
+            return None
+
+        return row[0], row[1] - now
+
+    def set(self, key: str, payload: bytes):
+        """Enregistrement d'une réponse, et suppression des réponses expirées"""
+
+        now = time.time()
+        connection = self._connect()
+        connection.execute(
+            "INSERT OR REPLACE INTO entries (key, stored_at, expires_at, payload) VALUES (?, ?, ?, ?)",
+            (key, now, now + self.ttl, payload)
+        )
+        connection.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+
+    def acquire(self, key: str, duration: Optional[float]=None) -> bool:
+        """Prise du verrou d'une clé pour duration secondes (lease_timeout par défaut), possible s'il est libre, si son
+        détenteur a dépassé le délai imparti, ou s'il est déjà détenu par l'appelant (prolongation)"""
+
+        now = time.time()
+        cursor = self._connect().execute(
+            """INSERT INTO leases (key, owner, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+            WHERE leases.expires_at < ? OR leases.owner = excluded.owner""",
+            (key, "{}-{}".format(os.getpid(), threading.get_ident()), now + (duration or self.lease_timeout), now)
+        )
+
+        return cursor.rowcount == 1
+
+    def release(self, key: str):
+        """Libération du verrou d'une clé"""
+
+        self._connect().execute(
+            "DELETE FROM leases WHERE key = ? AND owner = ?",
+            (key, "{}-{}".format(os.getpid(), threading.get_ident()))
+        )
+
+    def get_or_fetch(self, key: str, fetch: Callable[[], bytes], max_age: Optional[float]=None) -> tuple[bytes, float, bool]:
+        """Réponse de la clé : enregistrée par n'importe quel processus, ou obtenue par fetch() si ce processus obtient
+        le verrou ; renvoie la réponse, sa durée de vie restante et si elle a été obtenue par ce processus.
+        Avec max_age (rafraîchissement), seule une réponse enregistrée depuis moins de max_age secondes est acceptée :
+        celle qu'un autre processus vient d'obtenir en rafraîchissant le même point évite un second appel."""
+
+        min_stored_at = time.time() - max_age if max_age is not None else 0.0
+        deadline = time.monotonic() + self.lease_timeout
+        while True:
+            cached = self.get(key, min_stored_at)
+            if cached is not None:
+                return cached[0], cached[1], False
+            if self.acquire(key):
+                break
+            # Détenteur du verrou trop lent (ou arrêté) : appel direct plutôt qu'une attente sans fin
+            if time.monotonic() > deadline:
+                return fetch(), self.ttl, True
+            time.sleep(self.poll_interval)
+
+        try:
+            # La réponse a pu être enregistrée entre la lecture et la prise du verrou
+            cached = self.get(key, min_stored_at)
+            if cached is not None:
+                return cached[0], cached[1], False
+            payload = fetch()
+            self.set(key, payload)
+        finally:
+            self.release(key)
+
+        return payload, self.ttl, True
@@ -0,0 +1,107 @@
+# coding: utf-8
+
+import glob
+import hashlib
+import inspect
+import os
+import pickle
+import sys
+import threading
+from typing import Any, Callable
+
+import numpy as np
+import pandas as pd
+import plotly
+
+from . import config
+from .config import root_dir, startup_artifacts_enabled, startup_artifacts_dir
+
+
+# Fichiers dont dépendent les objets préparés au démarrage : toute modification invalide les artefacts
+SOURCE_FILES = [
+    os.path.join(root_dir, "config.ini"),
+    os.path.join(root_dir, "data", "concap.csv")
+]
+
+# Code des constructions : modules de 'components' (le fichier de chaque fonction de construction s'y ajoute)
+CODE_FILES = sorted(glob.glob(os.path.join(root_dir, "components", "*.py")))
+
+# Types des paramètres de 'config.py' pris en compte dans l'empreinte
+CONFIG_VALUE_TYPES = (str, int, float, bool, list, tuple, dict, type(None))
+
+artifacts_dir = os.path.join(root_dir, startup_artifacts_dir)
+
+
+def get_config_values():
+    """Valeurs effectives des paramètres de 'config.py', éventuellement remplacées avant l'import de 'main.py'"""
+
+    return sorted(
+        (name, repr(value)) for name, value in vars(config).items()
+        if not name.startswith("_") and isinstance(value, CONFIG_VALUE_TYPES)
+    )
+
+def get_sources_hash(build: Callable[[], Any]):
+    """Empreinte de ce dont dépend un objet : fichiers sources, code de sa construction, paramètres effectifs et
+    versions de Python et des bibliothèques dont les objets sont enregistrés"""
+
+    digest = hashlib.sha256()
+    paths = SOURCE_FILES + CODE_FILES
+    build_path = inspect.getsourcefile(build)
+    if build_path is not None and os.path.abspath(build_path) not in paths:
+        paths = paths + [os.path.abspath(build_path)]
+    for path in paths:
+        with open(path, "rb") as source_file:
+            digest.update(source_file.read())
+    digest.update(repr(get_config_values()).encode("utf-8"))
+    digest.update(repr((sys.version_info[:2], np.__version__, pd.__version__, plotly.__version__)).encode("utf-8"))
+
+    return digest.hexdigest()[:16]
+
+def get_artifact_path(name: str, sources_hash: str):
+    """Emplacement de l'artefact d'un objet pour une empreinte de ses sources"""
+
+    return os.path.join(artifacts_dir, "{}-{}.pickle".format(name, sources_hash))
+
+def load_artifact(path: str):
+    """Lecture d'un artefact, None s'il est absent ou illisible"""
+
+    try:
+        with open(path, "rb") as artifact_file:
+            return pickle.load(artifact_file)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+
+def save_artifact(name: str, path: str, value: Any):
+    """Enregistrement d'un artefact (écriture atomique), en supprimant les versions précédentes du même objet"""
+
+    os.makedirs(artifacts_dir, exist_ok=True)
+    temporary_path = "{}.{}.tmp".format(path, threading.get_ident())
+    with open(temporary_path, "wb") as artifact_file:
+        pickle.dump(value, artifact_file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary_path, path)
+
+    for previous_path in glob.glob(os.path.join(artifacts_dir, "{}-*.pickle".format(name))):
+        if previous_path != path:
+            try:
+                os.remove(previous_path)
+            except OSError:
+                pass
+
+def load_or_build(name: str, build: Callable[[], Any]):
+    """Objet lu depuis son artefact s'il correspond aux fichiers sources, au code et aux paramètres actuels,
+    construit et enregistré sinon"""
+
+    if not startup_artifacts_enabled:
+        return build()
+
+    path = get_artifact_path(name, get_sources_hash(build))
+    value = load_artifact(path)
+    if value is None:
+        value = build()
+        try:
+            save_artifact(name, path, value)
+        except OSError:
+            # Répertoire en lecture seule : l'objet sera reconstruit au prochain démarrage
+            pass
+
+    return value
@@ -0,0 +1,57 @@
+# coding: utf-8
+
+import hashlib
+import json
+
+import pandas as pd
+
+from . import metrics
+from .api import get_weather_results
+from .cache import TTLCache
+from .config import api_key, one_call_api_base_url, store_ttl, store_maxsize
+
+
+# Résultats déjà mis en forme conservés côté serveur : le navigateur ne reçoit et ne renvoie qu'un jeton
+result_store = TTLCache(ttl=store_ttl, maxsize=store_maxsize)
+metrics.watch_cache("result_store", result_store)
+
+
+def get_hourly_version(hourly: pd.DataFrame):
+    """Version des prévisions : empreinte de leur contenu (elles peuvent changer sans que l'heure de la mesure change)"""
+
+    return hashlib.sha1(pd.util.hash_pandas_object(hourly, index=False).to_numpy().tobytes()).hexdigest()[:16]
+
+def put_results(lat: float, lon: float, current: pd.Series, hourly: pd.DataFrame):
+    """Enregistrement des résultats d'un point, renvoie les jetons qui désignent les données actuelles et les prévisions
+    (coordonnées et version : heure de la mesure pour les données actuelles, empreinte du contenu pour les prévisions) ;
+    un jeton identique signifie des données inchangées"""
+
+    tokens = []
+    for version in [current['dt'].isoformat(), get_hourly_version(hourly)]:
+        token = json.dumps({
+            'lat': float(lat),
+            'lon': float(lon),
+            'version': version
+        })
+        result_store.set(token, (current, hourly))
+        tokens.append(token)
+
+    return tuple(tokens)
+
+def get_results(token: str):
+    """Résultats désignés par un jeton, obtenus à nouveau (via le cache des appels API) s'ils ont été évincés
+    ou enregistrés par un autre processus ; les résultats obtenus à nouveau ne sont enregistrés que sous leurs propres
+    jetons : s'ils sont d'une autre version que le jeton demandé, ils sont renvoyés sans être attribués à ce jeton"""
+
+    results = result_store.get(token)
+    if results is None:
+        location = json.loads(token)
+        results = get_weather_results(location['lat'], location['lon'], one_call_api_base_url, api_key)
+        put_results(location['lat'], location['lon'], *results)
+
+    return results
+
+def has_results(token: str):
+    """Résultats de la version désignée par le jeton enregistrés (faux si seuls ceux d'une autre version ont été obtenus)"""
+
+    return result_store.get(token) is not None
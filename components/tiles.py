@@ -0,0 +1,174 @@
+# coding: utf-8
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import Response, abort, request
+
+from . import governor, metrics, upstream
+from .cache import TTLCache
+from .config import root_dir, api_key, weather_tile_api_base_url, layers, tiles_basemap_tile_url, tiles_cache_dir, \
+    tiles_memory_maxsize, tiles_disk_maxsize, tiles_weather_ttl, tiles_basemap_ttl
+
+
+# Nom de la couche du fond de carte dans les URL du proxy (les autres couches sont les couches météo de config.ini)
+BASEMAP_LAYER = "basemap"
+
+# Tuiles récemment servies, en mémoire : (ETag, contenu, type MIME, instant d'expiration)
+memory_cache = TTLCache(ttl=tiles_weather_ttl, maxsize=tiles_memory_maxsize)
+metrics.watch_cache("tiles", memory_cache)
+
+# Tuiles enregistrées sur disque, de la moins à la plus récemment utilisée
+cache_dir = os.path.join(root_dir, tiles_cache_dir)
+disk_index = OrderedDict()
+_disk_lock = threading.Lock()
+
+# Verrous par tuile : une seule requête vers l'origine par tuile absente du cache, les autres l'attendent
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def get_layer_ttl(layer: str):
+    """Durée de vie des tuiles d'une couche : longue pour le fond de carte, courte pour la météo"""
+
+    return tiles_basemap_ttl if layer == BASEMAP_LAYER else tiles_weather_ttl
+
+def get_origin_url(layer: str, z: int, x: int, y: int):
+    """URL de la tuile sur son serveur d'origine"""
+
+    if layer == BASEMAP_LAYER:
+        return tiles_basemap_tile_url.format(z=z, x=x, y=y)
+
+    return weather_tile_api_base_url.format(layer, z, x, y, api_key)
+
+def get_content_type(content: bytes):
+    """Type MIME d'une tuile d'après sa signature"""
+
+    return "image/jpeg" if content[:3] == b"\xff\xd8\xff" else "image/png"
+
+def get_tile_path(layer: str, z: int, x: int, y: int):
+    """Emplacement de la tuile dans le cache sur disque"""
+
+    return os.path.join(cache_dir, layer, str(z), str(x), "{}.tile".format(y))
+
+def make_tile(content: bytes, expires_at: float):
+    """Tuile prête à servir : ETag calculé sur le contenu"""
+
+    return hashlib.sha1(content).hexdigest(), content, get_content_type(content), expires_at
+
+def load_disk_index():
+    """Lecture des tuiles déjà présentes sur disque, les plus anciennes en premier"""
+
+    paths = []
+    for directory, _, filenames in os.walk(cache_dir):
+        paths.extend(os.path.join(directory, filename) for filename in filenames if filename.endswith(".tile"))
+    with _disk_lock:
+        disk_index.clear()
+        for path in sorted(paths, key=os.path.getmtime):
+            disk_index[path] = None
+
+def read_disk_tile(layer: str, z: int, x: int, y: int, stale: bool=False):
+    """Tuile du cache sur disque si elle est encore valide (ou même expirée si stale), None sinon"""
+
+    path = get_tile_path(layer, z, x, y)
+    try:
+        expires_at = os.path.getmtime(path) + get_layer_ttl(layer)
+        if expires_at < time.time():
+            if not stale:
+                return None
+            # Tuile expirée servie faute de mieux : le navigateur la redemandera
+            expires_at = time.time()
+        with open(path, "rb") as tile_file:
+            content = tile_file.read()
+    except OSError:
+        return None
+    with _disk_lock:
+        if path in disk_index:
+            disk_index.move_to_end(path)
+
+    return make_tile(content, expires_at)
+
+def write_disk_tile(layer: str, z: int, x: int, y: int, content: bytes):
+    """Enregistrement d'une tuile sur disque, en supprimant les moins récemment utilisées au-delà de la taille maximale"""
+
+    path = get_tile_path(layer, z, x, y)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = "{}.{}.tmp".format(path, threading.get_ident())
+    with open(temporary_path, "wb") as tile_file:
+        tile_file.write(content)
+    os.replace(temporary_path, path)
+
+    with _disk_lock:
+        disk_index[path] = None
+        disk_index.move_to_end(path)
+        evicted = []
+        while len(disk_index) > tiles_disk_maxsize:
+            evicted.append(disk_index.popitem(last=False)[0])
+    for evicted_path in evicted:
+        try:
+            os.remove(evicted_path)
+        except OSError:
+            pass
+
+def get_tile(layer: str, z: int, x: int, y: int):
+    """Tuile servie depuis la mémoire, puis le disque, puis l'origine (une seule requête à la fois par tuile)"""
+
+    key = (layer, z, x, y)
+    tile = memory_cache.get(key)
+    if tile is not None:
+        return tile
+
+    with _inflight_lock:
+        tile_lock = _inflight.setdefault(key, threading.Lock())
+    try:
+        with tile_lock:
+            # La tuile a pu être obtenue par une autre requête pendant l'attente du verrou
+            tile = memory_cache.get(key) or read_disk_tile(layer, z, x, y)
+            if tile is None:
+                try:
+                    # Le fond de carte n'est pas servi par OpenWeather : hors budget des appels ; les tuiles météo
+                    # laissent intacte la part du budget réservée aux clics
+                    with governor.priority(governor.TILES):
+                        response = upstream.get(get_origin_url(layer, z, x, y), governed=layer != BASEMAP_LAYER)
+                except upstream.BudgetExhausted:
+                    tile = read_disk_tile(layer, z, x, y, stale=True)
+                    if tile is None:
+                        raise
+                    metrics.stale_results.labels("tiles").inc()
+                    return tile
+                if response.status_code != 200:
+                    abort(404 if response.status_code == 404 else 502)
+                tile = make_tile(response.content, time.time() + get_layer_ttl(layer))
+                write_disk_tile(layer, z, x, y, response.content)
+            memory_cache.set(key, tile, ttl=max(0.0, tile[3] - time.time()))
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+    return tile
+
+def serve_tile(layer: str, z: int, x: int, y: int):
+    """Route du proxy de tuiles : réponse conditionnelle (ETag / If-None-Match) et mise en cache par le navigateur"""
+
+    if layer != BASEMAP_LAYER and layer not in layers.values():
+        abort(404)
+    try:
+        etag, content, content_type, expires_at = get_tile(layer, z, x, y)
+    except upstream.UpstreamError:
+        abort(502)
+
+    response = Response(content, mimetype=content_type)
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = int(max(0.0, expires_at - time.time()))
+
+    return response.make_conditional(request)
+
+def register_tile_proxy(server):
+    """Ajout de la route /tiles/<couche>/<z>/<x>/<y>.png au serveur Flask"""
+
+    load_disk_index()
+    server.add_url_rule("/tiles/<layer>/<int:z>/<int:x>/<int:y>.png", "tiles", serve_tile)
@@ -0,0 +1,93 @@
+# coding: utf-8
+
+import email.utils
+import random
+import time
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import governor, metrics
+from .config import http_pool_connections, http_pool_maxsize, http_connect_timeout, http_read_timeout, \
+    http_max_retries, http_backoff_factor, http_backoff_max
+
+
+# Codes HTTP pour lesquels la requête est retentée
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class UpstreamError(Exception):
+    """Échec définitif d'un appel à OpenWeather, après épuisement des nouvelles tentatives"""
+
+class BudgetExhausted(UpstreamError):
+    """Appel à OpenWeather refusé par le budget des appels du processus"""
+
+
+def create_session(pool_connections: int, pool_maxsize: int):
+    """Création d'une session HTTP réutilisant ses connexions (keep-alive) avec un nombre de connexions borné"""
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=True)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    return session
+
+# Session partagée par tous les appels à OpenWeather du processus
+session = create_session(http_pool_connections, http_pool_maxsize)
+
+def get_retry_after(response: requests.Response) -> Optional[float]:
+    """Lecture de l'en-tête Retry-After (en secondes ou sous forme de date HTTP)"""
+
+    retry_after = response.headers.get("Retry-After")
+    if retry_after is None:
+        return None
+    if retry_after.strip().isdigit():
+        return float(retry_after)
+    try:
+        retry_date = email.utils.parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        # En-tête mal formé : délai d'attente exponentiel habituel
+        return None
+    if retry_date is None:
+        return None
+
+    return max(0.0, retry_date.timestamp() - time.time())
+
+def get_backoff_delay(attempt: int, backoff_factor: float, backoff_max: float):
+    """Délai d'attente exponentiel avec gigue complète avant la tentative suivante"""
+
+    return random.uniform(0, min(backoff_max, backoff_factor * 2 ** attempt))
+
+def get(url: str, max_retries: int=http_max_retries, backoff_factor: float=http_backoff_factor, backoff_max: float=http_backoff_max, governed: bool=True):
+    """Requête GET vers OpenWeather avec délais de connexion et de lecture, et nouvelles tentatives sur 429/5xx ;
+    chaque tentative consomme un appel du budget du processus (sauf governed=False, pour les autres serveurs)"""
+
+    for attempt in range(max_retries + 1):
+        if governed and governor.budget is not None and not governor.budget.acquire():
+            raise BudgetExhausted("Budget des appels à OpenWeather épuisé")
+        started = time.perf_counter()
+        try:
+            response = session.get(url, timeout=(http_connect_timeout, http_read_timeout))
+        except (requests.ConnectionError, requests.Timeout) as error:
+            metrics.observe_upstream(url, "error", time.perf_counter() - started)
+            if attempt == max_retries:
+                raise UpstreamError("OpenWeather injoignable : {}".format(error)) from error
+            delay = get_backoff_delay(attempt, backoff_factor, backoff_max)
+        else:
+            metrics.observe_upstream(url, str(response.status_code), time.perf_counter() - started)
+            if response.status_code not in RETRY_STATUS_CODES:
+                return response
+            delay = get_retry_after(response)
+            if delay is None:
+                delay = get_backoff_delay(attempt, backoff_factor, backoff_max)
+            # Trop d'appels : tous les appels du processus sont suspendus, pas seulement celui-ci
+            if response.status_code == 429 and governed and governor.budget is not None:
+                governor.budget.on_rate_limited(delay)
+            # Attente demandée trop longue pour bloquer un worker : abandon immédiat
+            if attempt == max_retries or delay > backoff_max:
+                if response.status_code == 429:
+                    raise UpstreamError("Compte OpenWeather bloqué : trop d'appels API effectués ?")
+                raise UpstreamError("Erreur OpenWeather : code HTTP {}".format(response.status_code))
+        time.sleep(delay)
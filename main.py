@@ -2,28 +2,93 @@
 
 import locale
 
-from components import client, figures
+from components import client, compression, figures, governor, history, metrics, overlay, profiling, push, rankings, refresher, startup, tiles
 from components.app import app, application
 from components.capitals import capitals
-from components.config import api_key, weather_tile_api_base_url, layers, init_layer, \
-    variables, init_variable, variables_quanti, scatter_mapbox_marker_color
+from components.config import api_key, map_weather_tile_base_url, map_basemap_tile_url, layers, init_layer, \
+    variables, init_variable, variables_quanti, scatter_mapbox_marker_color, scatter_mapbox_marker_color_selected, \
+    tiles_proxy_enabled, history_enabled, metrics_enabled, metrics_path, map_update_mode, map_weather_layer, overlay_url, \
+    rankings_enabled, rankings_path, push_mode, push_path, governor_enabled, governor_status_path, compression_enabled, profiling_path
 from components.callbacks import *
 
 
 # Format des dates français (si disponible)
 locale.setlocale(locale.LC_TIME, "fr_FR")
 
-# Mise en page
-init_map = figures.create_map(capitals, init_layer, weather_tile_api_base_url, api_key, scatter_mapbox_marker_color)
+def build_init_map():
+    """Carte initiale : toutes les capitales, ou en mode niveau de détail les points et groupes de la vue du monde entier"""
+
+    if map_update_mode == "lod":
+        return create_lod_figure(None, init_layer, None)
+
+    return figures.create_map(
+        capitals,
+        init_layer,
+        map_weather_tile_base_url,
+        api_key,
+        scatter_mapbox_marker_color,
+        map_basemap_tile_url,
+        get_overlay_url(init_layer)
+    ).to_plotly_json()
+
+# Mise en page : carte initiale lue depuis son artefact (reconstruite si config.ini, concap.csv, le code ou les
+# paramètres ont changé) ; chemins du proxy des tuiles complétés par l'adresse de la page dans le navigateur (assets/map.js)
+init_map = startup.load_or_build("init_map", build_init_map)
 app.layout = client.generate_layout(
     layers=layers,
     variables=variables,
     init_layer=init_layer,
     init_variable=init_variable,
     variables_quanti=variables_quanti,
-    init_map=init_map
+    init_map=init_map,
+    map_settings={
+        'weather_tile_url': figures.get_weather_tile_url("{layer}", map_weather_tile_base_url, api_key),
+        'marker_color': scatter_mapbox_marker_color,
+        'marker_color_selected': scatter_mapbox_marker_color_selected,
+        'overlay_url': overlay_url.format("{layer}") if map_weather_layer == "overlay" else None
+    },
+    push_settings={'url': push_path} if push_mode == "sse" else None
 )
 
+# Profilage à la demande des requêtes (variable d'environnement ou en-tête d'administration), inactif par défaut
+profiling.register(application, profiling_path)
+
+# Proxy des tuiles cartographiques, avec cache en mémoire et sur disque
+if tiles_proxy_enabled:
+    tiles.register_tile_proxy(application)
+
+# Couche météo interpolée localement à partir des relevés en cache
+if map_weather_layer == "overlay":
+    overlay.register_overlay(application)
+
+# Mises à jour poussées aux onglets (Server-Sent Events) : une lecture par capitale suivie, diffusée à tous ses onglets
+if push_mode == "sse":
+    push.register_events(application, push_path)
+
+# État du budget des appels à OpenWeather, servi en JSON
+if governor_enabled:
+    governor.register_status(application, governor_status_path)
+
+# Historique des résultats : cache rempli avec les derniers résultats enregistrés, puis enregistrement des suivants
+if history_enabled:
+    history.start()
+
+# Classements de toutes les capitales (indicateurs dérivés, statistiques des prévisions), servis en JSON
+if rankings_enabled:
+    rankings.start(application, rankings_path)
+
+# Compression des réponses (brotli ou gzip), mise en page revalidée par ETag, assets compressés au démarrage
+if compression_enabled:
+    compression.register(app)
+
+# Mesures des callbacks et des appels à OpenWeather, exposées au format Prometheus
+if metrics_enabled:
+    metrics.instrument_app(app, metrics_path)
+
+# Rafraîchissement des capitales en arrière-plan, démarré à la première requête reçue par le processus
+# (et non dans le processus de surveillance du rechargement automatique en mode debug)
+application.before_request(refresher.start)
+
 # Lancement du serveur
 if __name__ == '__main__':
     app.run_server(debug=True)
@@ -0,0 +1,31 @@
+# coding: utf-8
+
+import locale
+import os
+import sys
+
+import pytest
+
+# Racine du projet importable (components, benchmarks, main) quel que soit le dossier de lancement
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Format des dates français pas toujours installé sur les machines de test : ignoré
+locale.setlocale = lambda *args, **kwargs: None
+
+from benchmarks.upstream_stub import get_stub_urls, start_stub
+
+
+@pytest.fixture
+def stub():
+    """Serveur de substitution à OpenWeather et au fond de carte, avec une latence laissant les requêtes se chevaucher"""
+
+    server, _ = start_stub(latency=0.2)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def stub_urls(stub):
+    """URL du serveur de substitution, aux modèles des URL de 'config.ini'"""
+
+    return get_stub_urls(stub)
@@ -0,0 +1,52 @@
+# coding: utf-8
+
+import json
+import threading
+
+import pytest
+
+from benchmarks.payloads import generate_one_call_payload
+from components import api, governor
+from components.shared_cache import SharedCache
+
+
+@pytest.fixture
+def one_call_url(stub_urls, monkeypatch):
+    """URL One Call du serveur de substitution, avec le cache propre au processus vide"""
+
+    monkeypatch.setattr(api, "shared_cache", None)
+    monkeypatch.setattr(governor, "budget", None)
+    api.weather_cache.clear()
+    yield stub_urls['one_call_api_base_url']
+    api.weather_cache.clear()
+
+def test_concurrent_cold_misses_make_one_call(one_call_url, stub):
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(api.get_weather_results(48.85, 2.35, one_call_url, "")))
+        for _ in range(10)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 10
+    assert all(current is results[0][0] for current, _ in results)
+    assert stub.status_counts['one_call', 200] == 1
+
+def test_shared_cache_hit_notifies_result_listeners(one_call_url, stub, tmp_path, monkeypatch):
+    # Réponse déjà obtenue par un autre processus
+    shared_cache = SharedCache(str(tmp_path / "shared.sqlite"), 600, 5, 0.01)
+    cache_key = api.get_weather_cache_key(48.85, 2.35, one_call_url)
+    shared_cache.set("|".join(map(str, cache_key)), json.dumps(generate_one_call_payload(48.85, 2.35)).encode("utf-8"))
+    monkeypatch.setattr(api, "shared_cache", shared_cache)
+    results, fetches = [], []
+    monkeypatch.setattr(api, "result_listeners", [lambda *args: results.append(args)])
+    monkeypatch.setattr(api, "fetch_listeners", [lambda *args: fetches.append(args)])
+
+    current, _ = api.get_weather_results(48.85, 2.35, one_call_url, "")
+
+    assert stub.request_count == 0
+    assert len(results) == 1 and results[0][2] is current
+    assert fetches == []
@@ -0,0 +1,73 @@
+# coding: utf-8
+
+import sqlite3
+import threading
+
+from components.governor import BACKGROUND, INTERACTIVE, TILES, Governor
+
+
+def get_stored_usage(path: str):
+    """Nombre d'appels du mois enregistrés dans la base partagée"""
+
+    with sqlite3.connect(path) as connection:
+        return connection.execute("SELECT COALESCE(SUM(used), 0) FROM usage").fetchone()[0]
+
+def test_processes_share_monthly_usage(tmp_path):
+    path = str(tmp_path / "governor.sqlite")
+    # Un budget par processus, sur la même base
+    budgets = [Governor(6000, 1000, 0.0, 0.0, path, 0.0) for _ in range(4)]
+
+    def take_tokens(budget):
+        for _ in range(25):
+            assert budget.acquire(INTERACTIVE)
+
+    threads = [threading.Thread(target=take_tokens, args=(budget,)) for budget in budgets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Aucun appel perdu par un écrasement entre processus, et chaque processus voit le total de tous
+    assert get_stored_usage(path) == 100
+    budgets[0].flush()
+    assert budgets[0].status()['month']['used'] == 100
+
+def test_monthly_usage_is_written_in_batches(tmp_path):
+    path = str(tmp_path / "governor.sqlite")
+    budget = Governor(6000, 1000, 0.0, 0.0, path, 3600)
+
+    for _ in range(10):
+        assert budget.acquire(BACKGROUND)
+
+    assert get_stored_usage(path) == 0
+    budget.flush()
+    assert get_stored_usage(path) == 10
+
+def test_monthly_limit_counts_other_processes(tmp_path):
+    path = str(tmp_path / "governor.sqlite")
+    first, second = Governor(6000, 10, 0.0, 0.0, path, 0.0), Governor(6000, 10, 0.0, 0.0, path, 0.0)
+
+    for _ in range(8):
+        assert first.acquire(INTERACTIVE)
+    assert second.acquire(INTERACTIVE)
+    assert second.acquire(INTERACTIVE)
+
+    assert not second.acquire(INTERACTIVE)
+    # Total des autres processus lu au prochain enregistrement
+    first.flush()
+    assert not first.acquire(INTERACTIVE)
+
+def test_processes_share_minute_bucket(tmp_path):
+    path = str(tmp_path / "governor.sqlite")
+    first, second = Governor(4, 1000, 0.5, 0.0, path, 0.0), Governor(4, 1000, 0.5, 0.0, path, 0.0)
+
+    # Jetons hors réserve pris par un processus : ni les tuiles ni l'arrière-plan de l'autre n'entament la réserve
+    assert first.acquire(BACKGROUND)
+    assert first.acquire(TILES)
+    assert not second.acquire(TILES)
+    assert not second.acquire(BACKGROUND)
+
+    # Réserve laissée aux appels interactifs de tous les processus, pas au-delà de per_minute au total
+    assert second.acquire(INTERACTIVE)
+    assert first.acquire(INTERACTIVE)
+    assert not second.acquire(INTERACTIVE)
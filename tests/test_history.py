@@ -0,0 +1,55 @@
+# coding: utf-8
+
+import time
+
+import pandas as pd
+
+from benchmarks.payloads import generate_one_call_payload
+from components import api, history
+
+
+def get_results(dt: int=1634558400, seed: int=0):
+    """Données courantes et prévisions horaires d'une réponse One Call synthétique pour Paris"""
+
+    payload = generate_one_call_payload(48.85, 2.35, dt=dt, seed=seed)
+
+    return api.get_current_weather_results(payload), api.get_hourly_weather_results(payload)
+
+def test_prune_removes_results_older_than_retention(tmp_path):
+    connection = history.connect(str(tmp_path / "history.sqlite"))
+    now = time.time()
+    history.write_batch(connection, [
+        (48.85, 2.35, now - 40 * 86400, *get_results(seed=0)),
+        (48.85, 2.35, now, *get_results(seed=1))
+    ])
+
+    deleted = history.prune(connection, 30)
+
+    assert deleted == history.HOURS + 1
+    for table in ["hourly", "current"]:
+        assert connection.execute("SELECT MIN(fetched_at) FROM {}".format(table)).fetchone()[0] == now
+    assert connection.execute("SELECT COUNT(*) FROM hourly").fetchone()[0] == history.HOURS
+
+def test_unchanged_hours_are_written_once(tmp_path, monkeypatch):
+    connection = history.connect(str(tmp_path / "history.sqlite"))
+    now = time.time()
+    current, hourly = get_results()
+    changed = hourly.copy()
+    changed['temp'] = changed['temp'].where(changed.index != 5, changed['temp'] + 1)
+    history.write_batch(connection, [(48.85, 2.35, now - 120, current, hourly)])
+    history.write_batch(connection, [(48.85, 2.35, now - 60, current, hourly), (48.85, 2.35, now, current, changed)])
+
+    # Une ligne par heure, plus l'heure modifiée au dernier appel
+    assert connection.execute("SELECT COUNT(*) FROM hourly").fetchone()[0] == history.HOURS + 1
+    assert connection.execute("SELECT COUNT(*) FROM current").fetchone()[0] == 1
+    start, end = hourly['dt'].iloc[0], hourly['dt'].iloc[-1]
+    assert len(history.read_hourly(48.85, 2.35, start, end, connection=connection)) == history.HOURS + 1
+
+    # Le cache est rempli avec les dernières valeurs de chaque heure
+    monkeypatch.setattr(history, "cache_ttl", 600)
+    api.weather_cache.clear()
+    assert history.warm_cache(connection) == 1
+    _, cached = api.weather_cache.get(api.get_weather_cache_key(48.85, 2.35, history.one_call_api_base_url))
+    api.weather_cache.clear()
+    pd.testing.assert_series_equal(cached['temp'], changed['temp'], check_names=False)
+    assert list(cached['dt']) == list(hourly['dt'])
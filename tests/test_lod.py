@@ -0,0 +1,46 @@
+# coding: utf-8
+
+import functools
+
+import pytest
+
+from benchmarks.bench_lod import generate_cities, get_size
+from components.capitals import CapitalIndex
+from components.config import api_key, init_layer, weather_tile_api_base_url, scatter_mapbox_marker_color, \
+    map_lod_cell_size, map_lod_max_markers, map_lod_cluster_radius, map_lod_viewport_margin
+from components.figures import create_lod_map, get_lod_map_template
+from components.lod import LevelOfDetail, get_viewport
+
+
+# Octets au plus par marqueur de la figure sérialisée (coordonnées, nom, pays, continent, nombre de villes du groupe)
+MARKER_BYTES = 200
+
+# relayoutData des vues : monde entier, Europe, et Pacifique à cheval sur l'antiméridien (longitudes au-delà de 180°)
+VIEWS = {
+    'world': {'mapbox.zoom': 1},
+    'regional': {'mapbox.zoom': 4, 'mapbox._derived': {'coordinates': [[-12, 60], [30, 60], [30, 35], [-12, 35]]}},
+    'antimeridian': {'mapbox.zoom': 4, 'mapbox._derived': {'coordinates': [[165, 5], [200, 5], [200, -30], [165, -30]]}}
+}
+
+
+@functools.lru_cache()
+def get_level_of_detail(size: int):
+    """Villes générées, leur index et le choix des marqueurs, construits une fois par nombre de villes"""
+
+    index = CapitalIndex(generate_cities(size))
+    lod = LevelOfDetail(index.latitudes, index.longitudes, map_lod_cell_size, map_lod_max_markers, map_lod_cluster_radius)
+
+    return index, lod
+
+@pytest.mark.parametrize("view", VIEWS)
+@pytest.mark.parametrize("size", [245, 5000, 50000, 200000])
+def test_lod_map_payload_is_bounded(size, view):
+    index, lod = get_level_of_detail(size)
+    template = get_lod_map_template(init_layer, weather_tile_api_base_url, api_key, scatter_mapbox_marker_color)
+
+    zoom, bounds = get_viewport(VIEWS[view], 1, map_lod_viewport_margin)
+    positions, clusters = lod.select(bounds, zoom)
+    fig = create_lod_map(template, index, positions, clusters, "Ville 0")
+
+    assert 0 < len(positions) + len(clusters[2]) <= map_lod_max_markers
+    assert get_size(fig) <= get_size(template) + map_lod_max_markers * MARKER_BYTES
@@ -0,0 +1,63 @@
+# coding: utf-8
+
+import os
+import time
+
+import flask
+import pytest
+
+from components import profiling
+
+
+TOKEN = "s3cret"
+
+
+@pytest.fixture
+def make_client(tmp_path, monkeypatch):
+    """Serveur profilé (variable d'environnement et/ou jeton), fichiers de profilage dans un dossier temporaire"""
+
+    monkeypatch.setattr(profiling, "output_dir", str(tmp_path))
+    monkeypatch.setattr(profiling, "slowest", [])
+
+    def make(env: bool, token: str):
+        if env:
+            monkeypatch.setenv(profiling.profiling_env_var, "1")
+        else:
+            monkeypatch.delenv(profiling.profiling_env_var, raising=False)
+        monkeypatch.setattr(profiling, "profiling_token", token)
+        server = flask.Flask(__name__)
+        server.add_url_rule("/page", "page", lambda: "ok")
+        assert profiling.register(server)
+        return server.test_client()
+
+    return make
+
+def test_routes_absent_without_token(make_client):
+    client = make_client(env=True, token="")
+
+    assert client.get("/page").status_code == 200
+    assert len(profiling.slowest) == 1
+    assert client.get("/profiling").status_code == 404
+
+def test_routes_require_token(make_client):
+    client = make_client(env=True, token=TOKEN)
+    client.get("/page")
+
+    assert client.get("/profiling").status_code == 404
+    assert client.get("/profiling", headers={'X-Profile-Token': "wrong"}).status_code == 404
+    response = client.get("/profiling", headers={'X-Profile-Token': TOKEN})
+    assert response.status_code == 200
+    assert sorted(entry['path'] for entry in response.json) == ["/page", "/profiling", "/profiling"]
+
+def test_old_entries_age_out(make_client, monkeypatch):
+    client = make_client(env=False, token=TOKEN)
+    client.get("/page", headers={'X-Profile-Token': TOKEN})
+    old_file = os.path.join(profiling.output_dir, profiling.slowest[0][2]['file'])
+    assert os.path.exists(old_file)
+
+    # Requête lente profilée avant la fenêtre : retirée de la liste et son fichier supprimé
+    profiling.slowest[0][2]['started_at'] = time.time() - profiling.profiling_window - 1
+    response = client.get("/profiling", headers={'X-Profile-Token': TOKEN})
+
+    assert response.json == []
+    assert not os.path.exists(old_file)
@@ -0,0 +1,46 @@
+# coding: utf-8
+
+import queue
+
+import flask
+import pytest
+
+from components import governor, push
+
+
+@pytest.fixture
+def client(stub_urls, monkeypatch):
+    """Route des mises à jour poussées, résultats lus sur le serveur de substitution"""
+
+    monkeypatch.setattr(push, "one_call_api_base_url", stub_urls['one_call_api_base_url'])
+    monkeypatch.setattr(governor, "budget", None)
+    server = flask.Flask(__name__)
+    push.register_events(server)
+
+    return server.test_client()
+
+def test_events_refused_on_sync_worker(client):
+    # Worker synchrone (gunicorn par défaut) : une connexion ouverte par onglet bloquerait le worker
+    response = client.get("/events?lat=48.85&lon=2.35", environ_overrides={'wsgi.multithread': False})
+
+    assert response.status_code == 503
+    assert push.broadcaster.subscribers == {}
+
+def test_events_streamed_on_threaded_worker(client):
+    response = client.get("/events?lat=48.85&lon=2.35", environ_overrides={'wsgi.multithread': True}, buffered=False)
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    assert next(response.response) == b"retry: 5000\n\n"
+    response.close()
+    assert push.broadcaster.subscribers == {}
+
+def test_full_queue_keeps_latest_messages():
+    subscriber = queue.Queue(maxsize=push.QUEUE_SIZE)
+
+    for version in range(push.QUEUE_SIZE + 3):
+        push.broadcaster.send([subscriber], "weather", str(version))
+
+    # Onglet lent : les plus anciens messages sont retirés, le dernier jeton est toujours reçu
+    messages = [subscriber.get_nowait()[1] for _ in range(subscriber.qsize())]
+    assert messages == [str(version) for version in range(3, push.QUEUE_SIZE + 3)]
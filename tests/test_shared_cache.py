@@ -0,0 +1,52 @@
+# coding: utf-8
+
+import threading
+
+import pytest
+
+from benchmarks import bench_workers
+from components.shared_cache import SharedCache
+
+
+@pytest.fixture
+def shared_cache(tmp_path):
+    """Cache partagé dans une base SQLite temporaire"""
+
+    return SharedCache(str(tmp_path / "shared.sqlite"), 600, 5, 0.01)
+
+def test_refresh_accepts_recent_response_from_another_process(shared_cache):
+    shared_cache.set("paris", b"stored")
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return b"fetched"
+
+    # Réponse enregistrée par un autre processus depuis moins de max_age secondes : pas de second appel
+    assert shared_cache.get_or_fetch("paris", fetch, max_age=300) == (b"stored", pytest.approx(600, abs=1), False)
+    assert calls == []
+
+    # Réponse plus ancienne que max_age : appel de l'API
+    shared_cache._connect().execute("UPDATE entries SET stored_at = stored_at - 400")
+    assert shared_cache.get_or_fetch("paris", fetch, max_age=300)[::2] == (b"fetched", True)
+    assert calls == [1]
+
+def test_workers_make_one_call_per_location(stub, stub_urls, tmp_path):
+    # Processus demandant les mêmes capitales en même temps, comme les workers d'un serveur (benchmarks.bench_workers)
+    _, results = bench_workers.run(stub_urls['one_call_api_base_url'], str(tmp_path / "shared.sqlite"), 3, 3)
+
+    assert stub.status_counts['one_call', 200] == bench_workers.CAPITAL_COUNT
+    assert stub.request_count == bench_workers.CAPITAL_COUNT
+    assert len(results) == 3
+    assert all(result == results[0] for result in results)
+
+def test_lease_is_renewed_by_its_owner_only(shared_cache):
+    assert shared_cache.acquire("refresher", 60)
+    assert shared_cache.acquire("refresher", 60)
+
+    # Verrou détenu par un autre processus (ou thread) tant qu'il n'a pas expiré
+    results = []
+    thread = threading.Thread(target=lambda: results.append(shared_cache.acquire("refresher", 60)))
+    thread.start()
+    thread.join()
+    assert results == [False]
@@ -0,0 +1,34 @@
+# coding: utf-8
+
+from benchmarks.payloads import generate_one_call_payload
+from components import api, store
+
+
+def get_results(seed: int):
+    """Données courantes et prévisions horaires d'une réponse One Call synthétique pour Paris"""
+
+    payload = generate_one_call_payload(48.85, 2.35, seed=seed)
+
+    return api.get_current_weather_results(payload), api.get_hourly_weather_results(payload)
+
+def test_token_of_another_version_is_not_reassigned(monkeypatch):
+    # Jetons obtenus par un autre processus, dont le cache contient une autre version des prévisions
+    _, hourly_token = store.put_results(48.85, 2.35, *get_results(seed=0))
+    store.result_store.clear()
+    fresher = get_results(seed=1)
+    monkeypatch.setattr(store, "get_weather_results", lambda *args: fresher)
+
+    assert store.get_results(hourly_token) is fresher
+    assert not store.has_results(hourly_token)
+    assert store.has_results(store.put_results(48.85, 2.35, *fresher)[1])
+    store.result_store.clear()
+
+def test_token_of_same_version_is_restored(monkeypatch):
+    current_token, hourly_token = store.put_results(48.85, 2.35, *get_results(seed=0))
+    store.result_store.clear()
+    monkeypatch.setattr(store, "get_weather_results", lambda *args: get_results(seed=0))
+
+    store.get_results(hourly_token)
+
+    assert store.has_results(current_token) and store.has_results(hourly_token)
+    store.result_store.clear()
@@ -0,0 +1,89 @@
+# coding: utf-8
+
+import os
+import threading
+import time
+
+import flask
+import pytest
+
+from components import governor, tiles
+
+
+@pytest.fixture
+def client(stub_urls, tmp_path, monkeypatch):
+    """Proxy des tuiles vers le serveur de substitution, avec un cache sur disque vide de 3 tuiles au plus"""
+
+    monkeypatch.setattr(tiles, "weather_tile_api_base_url", stub_urls['weather_tile_api_base_url'])
+    monkeypatch.setattr(tiles, "tiles_basemap_tile_url", stub_urls['basemap_tile_url'])
+    monkeypatch.setattr(tiles, "cache_dir", str(tmp_path))
+    monkeypatch.setattr(tiles, "tiles_disk_maxsize", 3)
+    monkeypatch.setattr(governor, "budget", None)
+    tiles.memory_cache.clear()
+
+    server = flask.Flask(__name__)
+    tiles.register_tile_proxy(server)
+    yield server.test_client()
+    tiles.memory_cache.clear()
+    tiles.disk_index.clear()
+
+class RefusingBudget:
+    """Budget des appels à OpenWeather épuisé"""
+
+    def acquire(self, priority=None):
+        return False
+
+def test_concurrent_misses_make_one_origin_call(client, stub):
+    responses = []
+    threads = [
+        threading.Thread(target=lambda: responses.append(client.get("/tiles/temp_new/2/1/1.png")))
+        for _ in range(10)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [response.status_code for response in responses] == [200] * 10
+    assert len({response.data for response in responses}) == 1
+    assert stub.status_counts['tiles', 200] == 1
+
+def test_if_none_match_returns_304(client, stub):
+    response = client.get("/tiles/basemap/3/2/1.png")
+    assert response.status_code == 200
+
+    revalidated = client.get("/tiles/basemap/3/2/1.png", headers={'If-None-Match': response.headers['ETag']})
+
+    assert revalidated.status_code == 304
+    assert revalidated.data == b""
+    assert stub.request_count == 1
+
+def test_disk_cache_evicts_least_recently_used(client, stub):
+    for x in range(5):
+        assert client.get("/tiles/wind_new/4/{}/0.png".format(x)).status_code == 200
+
+    paths = list(tiles.disk_index)
+    assert len(paths) == 3
+    assert paths == [tiles.get_tile_path("wind_new", 4, x, 0) for x in (2, 3, 4)]
+    assert not os.path.exists(tiles.get_tile_path("wind_new", 4, 0, 0))
+    assert all(os.path.exists(path) for path in paths)
+
+def test_unknown_layer_returns_404(client, stub):
+    assert client.get("/tiles/unknown_layer/1/0/0.png").status_code == 404
+    assert stub.request_count == 0
+
+def test_budget_refusal_serves_stale_disk_tile(client, stub, monkeypatch):
+    response = client.get("/tiles/pressure_new/5/3/7.png")
+    assert response.status_code == 200
+
+    # Tuile expirée en mémoire et sur disque, budget épuisé : l'ancienne tuile est servie sans appel à l'origine
+    tiles.memory_cache.clear()
+    expired = time.time() - tiles.get_layer_ttl("pressure_new") - 60
+    os.utime(tiles.get_tile_path("pressure_new", 5, 3, 7), (expired, expired))
+    monkeypatch.setattr(governor, "budget", RefusingBudget())
+
+    stale = client.get("/tiles/pressure_new/5/3/7.png")
+
+    assert stale.status_code == 200
+    assert stale.data == response.data
+    assert stub.request_count == 1
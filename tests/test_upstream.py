@@ -0,0 +1,31 @@
+# coding: utf-8
+
+import email.utils
+import time
+
+import pytest
+import requests
+
+from components import upstream
+
+
+def make_response(retry_after: str):
+    """Réponse 429 portant un en-tête Retry-After"""
+
+    response = requests.Response()
+    response.status_code = 429
+    response.headers['Retry-After'] = retry_after
+
+    return response
+
+def test_retry_after_in_seconds():
+    assert upstream.get_retry_after(make_response("120")) == 120.0
+
+def test_retry_after_as_http_date():
+    retry_after = email.utils.formatdate(time.time() + 60, usegmt=True)
+
+    assert upstream.get_retry_after(make_response(retry_after)) == pytest.approx(60, abs=2)
+
+@pytest.mark.parametrize("retry_after", ["soon", "", "Wed, 99 Foo 2021 25:00:00 GMT", "-5"])
+def test_malformed_retry_after_is_ignored(retry_after):
+    assert upstream.get_retry_after(make_response(retry_after)) is None